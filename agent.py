@@ -1,15 +1,21 @@
-from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import create_react_agent
 from langgraph.checkpoint.memory import MemorySaver
-from typing import Annotated
+from typing import Annotated, Optional
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from tools import route_validation_tool, route_solving_tool, get_available_locations_tool
-from tools import RoutingAgentState
+from tools import RoutingAgentState, solve_route, validate_route
+from utils.backends import get_backend
+from utils.command_parser import NameIndex, format_route_reply, format_solution_reply, parse_route_command
+from utils.conversation_window import pre_model_hook
+from utils.precedence import Precedence
+import json
 import os
+import uuid
 
 memory = MemorySaver()
 
-# Define LLM
-llm = ChatOpenAI(model="gpt-4.1", temperature=0)
+# Define LLM: gpt-4.1, or the scripted stand-in with LLM_BACKEND=FAKE
+llm = get_backend("llm")
 
 # Build LangGraph agent (OpenAI function-calling + your tools)
 graph = create_react_agent(
@@ -17,6 +23,8 @@ graph = create_react_agent(
     [route_validation_tool, route_solving_tool, get_available_locations_tool],
     state_schema=RoutingAgentState,
     checkpointer=memory,
+    # The LLM gets the recent turns, a summary of the older ones and the validated route
+    pre_model_hook=pre_model_hook,
     debug=False,
     prompt="""
         Limit your role to gathering the list of locations that should be visited, and, if asked explicitly, solve the route. 
@@ -39,4 +47,79 @@ graph = create_react_agent(
         
         Whenever you mention a location, only use its id and wrap it in a tag `[[loc:"{id}"]]`.
     """
-)
\ No newline at end of file
+)
+
+def run_fast_path(message: str, config: dict, index: NameIndex) -> Optional[dict]:
+    """
+    Applies a route command ("start at X", "visit A then B", "solve") without the LLM:
+    the tools run directly, and their calls, their outputs and a reply are added to the
+    thread as if the agent had made them. Returns the new thread state, or None when the
+    message is not a clear command (or the tools reject it) and the LLM should answer.
+    """
+    command = parse_route_command(message, index)
+    if command is None:
+        return None
+    snapshot = graph.get_state(config)
+    if snapshot.next:
+        # the agent is in the middle of a step
+        return None
+    state = dict(snapshot.values)
+    locations = list(state.get("locations") or [])
+    pairs = [
+        (p.visit_location_before, p.visit_location_after) if isinstance(p, Precedence)
+        else (p["visit_location_before"], p["visit_location_after"])
+        for p in state.get("precedences") or []
+    ]
+    starting_point = state.get("starting_point")
+    if command.starting_point is not None:
+        starting_point = command.starting_point
+
+    new_locations = [i for i in command.locations if i not in locations]
+    new_pairs = [p for p in command.precedences if p not in pairs]
+    changed = new_locations or new_pairs or starting_point != state.get("starting_point")
+    if not changed and not command.solve:
+        return None
+    if starting_point is None:
+        return None
+    locations += new_locations
+    if starting_point not in locations:
+        locations.insert(0, starting_point)
+    pairs += new_pairs
+    precedences = [Precedence(visit_location_before=a, visit_location_after=b) for a, b in pairs]
+
+    calls, outputs, replies, update = [], [], [], {}
+    if changed:
+        call_id = f"fast_{uuid.uuid4().hex}"
+        args = {"locations": locations, "starting_point": starting_point,
+                "precedences": [p.model_dump() for p in precedences]}
+        try:
+            validated = validate_route(locations, call_id, starting_point, precedences, state=state)
+        except Exception:
+            # the LLM explains what is wrong
+            return None
+        calls.append({"name": route_validation_tool.name, "args": args, "id": call_id})
+        update = {k: v for k, v in validated.update.items() if k != "messages"}
+        outputs.extend(m.model_copy(update={"name": route_validation_tool.name}) for m in validated.update["messages"])
+        replies.append(format_route_reply(locations, starting_point, pairs))
+        state.update(update)
+
+    if command.solve:
+        call_id = f"fast_{uuid.uuid4().hex}"
+        args = {"route_locations": locations, "starting_point": starting_point,
+                "precedences": [p.model_dump() for p in precedences], "objective": command.objective}
+        try:
+            solution = solve_route(
+                locations, call_id, starting_point, config, precedences, command.objective, state=state
+            )
+        except Exception:
+            return None
+        if not isinstance(solution, dict):
+            return None
+        calls.append({"name": route_solving_tool.name, "args": args, "id": call_id})
+        # as the tool node formats it
+        outputs.append(ToolMessage(json.dumps(solution, ensure_ascii=False), tool_call_id=call_id, name=route_solving_tool.name))
+        replies.append(format_solution_reply(solution))
+
+    messages = [HumanMessage(message), AIMessage(content="", tool_calls=calls), *outputs, AIMessage(" ".join(replies))]
+    graph.update_state(config, {**update, "messages": messages}, as_node="agent")
+    return graph.get_state(config).values
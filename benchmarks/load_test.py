@@ -0,0 +1,225 @@
+"""
+Load test for /plan-route, /directions and /chat: requests are sent at a fixed rate
+(open loop, a slow server does not slow the sender down) and the latency percentiles
+and throughput are reported per endpoint.
+
+Against a running server (start it with the stand-ins to keep Mapbox, Supabase and
+OpenAI out of the measure: MAPBOX_BACKEND=STANDIN SUPABASE_BACKEND=STANDIN LLM_BACKEND=FAKE):
+
+    poetry run python benchmarks/load_test.py --base-url http://127.0.0.1:8000 --rps 50 --duration 30
+
+Or in this process, with the stand-ins, through the ASGI app (client and server then share one core):
+
+    poetry run python benchmarks/load_test.py --in-process --rps 20 --duration 10 --output load.json
+
+The latency of a request is measured from the time it was scheduled, not from the time it
+was sent: a request queued behind a stalled client still counts the time it waited.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)  # the fixtures are loaded with relative paths
+
+import httpx
+import numpy as np
+
+ENDPOINTS = ("plan-route", "directions", "chat")
+DEFAULT_MIX = "plan-route=0.5,directions=0.4,chat=0.1"
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {name}, use one of {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight)
+    return mix
+
+
+class Workload:
+    """
+    The requests to send, drawn with a seeded generator: routes of 2 to 4 locations,
+    directions of the legs already planned (the other legs are not in the cache),
+    and chat messages that the scripted LLM (utils.scripted_llm) understands.
+    """
+    def __init__(self, location_ids: List[int], users: int, seed: int):
+        self.ids = location_ids
+        self.users = users
+        self.rng = random.Random(seed)
+        self.legs: List[Tuple[int, int]] = []
+
+    def plan_route(self) -> dict:
+        route = self.rng.sample(self.ids, self.rng.randint(2, min(4, len(self.ids))))
+        return {"ordered_route": route, "max_mileage": self.rng.choice([60000, 90000, 150000, 250000])}
+
+    def directions(self) -> dict:
+        origin, destination = self.rng.choice(self.legs)
+        return {"origin_id": origin, "destination_id": destination}
+
+    def chat(self) -> dict:
+        a, b, c = self.rng.sample(self.ids, 3)
+        message = self.rng.choice([
+            "Which locations are available?",
+            f"Start at {a}, I want to visit {b} then {c}",
+            f"Please solve the route {a} {b} {c}, starting point {a}",
+        ])
+        user = f"load-{self.rng.randrange(self.users)}"
+        return {"message": message, "user_id": user, "currently_fe_buffered_messages": 0}
+
+
+async def send(client: httpx.AsyncClient, endpoint: str, workload: Workload) -> httpx.Response:
+    if endpoint == "plan-route":
+        payload = workload.plan_route()
+        response = await client.post("/plan-route", json=payload)
+        if response.status_code == 200:
+            route = payload["ordered_route"]
+            workload.legs.extend(zip(route[:-1], route[1:]))
+        return response
+    if endpoint == "directions":
+        return await client.get("/directions", params=workload.directions())
+    return await client.post("/chat", json=workload.chat())
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    ms = np.asarray(latencies) * 1000
+    summary = {"requests": len(latencies) + errors, "ok": len(latencies), "errors": errors,
+               "throughput_rps": len(latencies) / elapsed if elapsed else 0.0}
+    if len(ms):
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        summary.update(p50_ms=float(p50), p95_ms=float(p95), p99_ms=float(p99), max_ms=float(ms.max()))
+    return summary
+
+
+async def run_load(
+        client: httpx.AsyncClient,
+        rps: float,
+        duration: float,
+        mix: Dict[str, float],
+        users: int = 20,
+        max_in_flight: int = 256,
+        seed: int = 0) -> dict:
+    locations = (await client.get("/locations")).json()["locations"]
+    workload = Workload(sorted(int(k) for k in locations), users, seed)
+    # One route planned before starting, so that /directions has a leg to ask for
+    first = workload.plan_route()
+    response = await client.post("/plan-route", json=first)
+    response.raise_for_status()
+    workload.legs.extend(zip(first["ordered_route"][:-1], first["ordered_route"][1:]))
+
+    names, weights = list(mix), [mix[n] for n in mix]
+    latencies: Dict[str, List[float]] = {n: [] for n in names}
+    errors: Dict[str, int] = {n: 0 for n in names}
+    statuses: Dict[str, Dict[int, int]] = {n: {} for n in names}
+    dropped = 0
+    in_flight = set()
+
+    async def one(endpoint: str, scheduled: float):
+        try:
+            response = await send(client, endpoint, workload)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        statuses[endpoint][status] = statuses[endpoint].get(status, 0) + 1
+        if status == 200:
+            latencies[endpoint].append(time.perf_counter() - scheduled)
+        else:
+            errors[endpoint] += 1
+
+    start = time.perf_counter()
+    total = int(rps * duration)
+    for k in range(total):
+        scheduled = start + k / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            dropped += 1
+            continue
+        task = asyncio.create_task(one(workload.rng.choices(names, weights)[0], scheduled))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    elapsed = time.perf_counter() - start
+
+    everything = [t for n in names for t in latencies[n]]
+    return {
+        "target_rps": rps,
+        "duration_s": duration,
+        "elapsed_s": elapsed,
+        "dropped": dropped,
+        "total": summarize(everything, sum(errors.values()), elapsed),
+        "endpoints": {
+            n: {**summarize(latencies[n], errors[n], elapsed), "statuses": statuses[n]} for n in names
+        },
+    }
+
+
+@asynccontextmanager
+async def in_process_client():
+    """The app behind an ASGI transport, started (lifespan) with the stand-ins."""
+    os.environ.setdefault("BOOT_DATA_FROM", "FILE")
+    os.environ.setdefault("DIRECTIONS_WARMUP", "OFF")
+    os.environ.setdefault("MAPBOX_BACKEND", "STANDIN")
+    os.environ.setdefault("SUPABASE_BACKEND", "STANDIN")
+    os.environ.setdefault("LLM_BACKEND", "FAKE")
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=60) as client:
+            yield client
+
+
+def print_report(report: dict):
+    print(f"target {report['target_rps']:.1f} req/s for {report['duration_s']:.0f}s, "
+          f"elapsed {report['elapsed_s']:.1f}s, dropped {report['dropped']}")
+    print(f"{'endpoint':<12} {'ok':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = list(report["endpoints"].items()) + [("total", report["total"])]
+    for name, s in rows:
+        print(f"{name:<12} {s['ok']:>6} {s['errors']:>6} {s['throughput_rps']:>8.1f} "
+              f"{s.get('p50_ms', float('nan')):>9.1f} {s.get('p95_ms', float('nan')):>9.1f} "
+              f"{s.get('p99_ms', float('nan')):>9.1f}")
+
+
+async def amain(args) -> dict:
+    mix = parse_mix(args.mix)
+    if args.in_process:
+        async with in_process_client() as client:
+            return await run_load(client, args.rps, args.duration, mix, args.users, args.max_in_flight, args.seed)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        return await run_load(client, args.rps, args.duration, mix, args.users, args.max_in_flight, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--in-process", action="store_true", help="serve the app in this process, with the stand-ins")
+    parser.add_argument("--rps", type=float, default=20, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"share of each endpoint (default {DEFAULT_MIX})")
+    parser.add_argument("--users", type=int, default=20, help="distinct /chat user ids")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="requests above this are dropped, not queued")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = asyncio.run(amain(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
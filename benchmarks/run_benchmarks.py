@@ -0,0 +1,311 @@
+"""
+Benchmarks for the routing and charge-planning hot paths.
+
+Uses the cached JSON fixtures plus synthetic catalogues (100, 1k, 10k locations),
+and writes the results as JSON so that runs on different commits can be compared:
+
+    poetry run python benchmarks/run_benchmarks.py --output bench.json
+    poetry run python benchmarks/run_benchmarks.py --output new.json --compare bench.json
+
+Mapbox and Supabase are the local stand-ins (utils.standins): no network access is needed.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)  # the fixtures are loaded with relative paths
+
+import numpy as np
+from utils.location import ESTIMATED_SPEED_MPS, Attraction, LocationDistanceMatrix
+from utils.local_directions_cache import LocalDirectionsCache
+from utils.charge_planner import ChargePlanner
+from utils.precedence import Precedence, PrecedenceGraph
+from utils.presolve import RoutePresolve, shortest_ordered_path
+from utils.shared_cache import get_shared_matrix_file
+from utils.geo import estimated_road_distance_m
+
+# Switzerland, see Location.is_in_swiss_bbox
+SWISS_BBOX = (45.817, 47.808, 5.955, 10.492)
+
+
+def measure(fn: Callable[[], object], rounds: int, warmup: int = 1) -> Dict[str, float]:
+    """Runs `fn` `rounds` times and returns timing statistics in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(rounds):
+        t = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t) * 1000)
+    samples.sort()
+    return {
+        "rounds": rounds,
+        "min_ms": samples[0],
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "p95_ms": samples[min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)],
+        "max_ms": samples[-1],
+    }
+
+
+def synthetic_attractions(n: int, seed: int = 42) -> List[Attraction]:
+    rng = random.Random(seed)
+    lat_min, lat_max, lon_min, lon_max = SWISS_BBOX
+    return [
+        Attraction(
+            id=i + 1,
+            lat=rng.uniform(lat_min, lat_max),
+            lon=rng.uniform(lon_min, lon_max),
+            name=f"Synthetic {i + 1}",
+            myswitzerland_id=f"synthetic-{i + 1}",
+        )
+        for i in range(n)
+    ]
+
+
+def synthetic_distances(attractions: List[Attraction]) -> np.ndarray:
+    """Great-circle distances (metres) inflated by a detour factor, as a Mapbox-like matrix."""
+    lat = np.array([a.lat for a in attractions])
+    lon = np.array([a.lon for a in attractions])
+    return estimated_road_distance_m(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+
+def synthetic_directions(start: Attraction, end: Attraction, distance: float, points: int = 200) -> dict:
+    """A Mapbox-like directions response with a straight, densely sampled geometry."""
+    coordinates = [
+        [start.lon + (end.lon - start.lon) * t, start.lat + (end.lat - start.lat) * t]
+        for t in np.linspace(0, 1, points)
+    ]
+    return {
+        "routes": [{
+            "distance": distance,
+            "duration": distance / 20,
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+        }],
+        "code": "Ok",
+    }
+
+
+class Catalogue:
+    """A synthetic catalogue written to disk in the same formats as the cached fixtures."""
+    def __init__(self, n: int, workdir: Path, write_json: bool):
+        self.n = n
+        self.attractions = synthetic_attractions(n)
+        distances = synthetic_distances(self.attractions)
+        self.json_filename = None
+        if write_json:
+            self.json_filename = str(workdir / f"distances_{n}.json")
+            with open(self.json_filename, "w", encoding="utf-8") as f:
+                json.dump({"code": "Ok", "distances": distances.tolist()}, f)
+            self.npy_filename = get_shared_matrix_file(self.json_filename)
+        else:
+            self.npy_filename = str(workdir / f"distances_{n}.npy")
+            np.save(self.npy_filename, np.stack([distances, distances / ESTIMATED_SPEED_MPS]))
+        self.matrix = LocationDistanceMatrix(self.attractions, filename=self.npy_filename)
+
+    def route(self, length: int, seed: int = 0) -> List[int]:
+        rng = random.Random(seed)
+        return rng.sample([a.id for a in self.attractions], length)
+
+    def directions_cache(self, route: List[int], filename: str) -> LocalDirectionsCache:
+        by_id = {a.id: a for a in self.attractions}
+        cache = LocalDirectionsCache(filename=filename)
+        for a, b in zip(route[:-1], route[1:]):
+            cache.add(a, b, synthetic_directions(by_id[a], by_id[b], self.matrix.get_distance_between_ids(a, b)))
+        return cache
+
+
+class Runner:
+    def __init__(self, rounds: int):
+        self.rounds = rounds
+        self.results: List[dict] = []
+
+    def run(self, name: str, params: dict, fn: Callable[[], object], rounds: Optional[int] = None):
+        stats = measure(fn, rounds or self.rounds)
+        self.results.append({"name": name, "params": params, "stats": stats})
+        print(f"{name:<40} {json.dumps(params):<40} median={stats['median_ms']:.3f}ms p95={stats['p95_ms']:.3f}ms")
+
+    def skip(self, name: str, params: dict, reason: str):
+        self.results.append({"name": name, "params": params, "skipped": reason})
+        print(f"{name:<40} {json.dumps(params):<40} skipped: {reason}")
+
+
+def bench_distance_matrix(runner: Runner, catalogues: List[Catalogue]):
+    attractions = Attraction.load_list_from_json("cached_attractions.json")
+    runner.run("matrix.load_json", {"n": len(attractions), "fixture": True},
+               lambda: LocationDistanceMatrix(attractions, filename="cached_distances.json"))
+    for c in catalogues:
+        if c.json_filename is not None:
+            runner.run("matrix.load_json", {"n": c.n}, lambda c=c: LocationDistanceMatrix(c.attractions, filename=c.json_filename),
+                       rounds=max(3, runner.rounds // 10))
+        runner.run("matrix.load_npy_mmap", {"n": c.n}, lambda c=c: LocationDistanceMatrix(c.attractions, filename=c.npy_filename))
+        for k in (10, 50):
+            subset = c.route(min(k, c.n))
+            runner.run("matrix.get_sub_matrix", {"n": c.n, "k": len(subset)}, lambda c=c, s=subset: c.matrix.get_sub_matrix(s))
+            runner.run("matrix.get_distance_matrix_as_dict", {"n": c.n, "k": len(subset)},
+                       lambda c=c, s=subset: c.matrix.get_distance_matrix_as_dict(s))
+
+
+def bench_charge_planner(runner: Runner, catalogues: List[Catalogue], workdir: Path):
+    for c in catalogues:
+        route = c.route(min(30, c.n))
+        cache = c.directions_cache(route, str(workdir / f"directions_{c.n}.json"))
+        total = c.matrix.get_distance_between_ids(route[0], route[1]) * 5
+        runner.run("charge_planner.init", {"n": c.n, "stops": len(route)},
+                   lambda: ChargePlanner(route, total, c.matrix, cache))
+        planner = ChargePlanner(route, total, c.matrix, cache)
+        runner.run("charge_planner.max_reach", {"n": c.n, "stops": len(route)},
+                   lambda: planner.find_coords_of_max_mileage_reach())
+        mileages = list(np.linspace(1000, total * 3, 100))
+        runner.run("charge_planner.max_reach_many", {"n": c.n, "stops": len(route), "mileages": len(mileages)},
+                   lambda: ChargePlanner(route, total, c.matrix, cache).find_coords_of_max_mileage_reach_many(mileages))
+
+
+def bench_presolve(runner: Runner, catalogue: Catalogue):
+    """The precedence presolve and DP fast path, which need no MILP solver."""
+    for n, constrained in ((10, 0), (12, 0), (20, 15), (30, 28)):
+        route = catalogue.route(n)
+        graph = PrecedenceGraph()
+        graph.sync([Precedence(visit_location_before=a, visit_location_after=b) for a, b in zip(route[1:-1], route[2:])][:constrained])
+        distances = catalogue.matrix.get_distance_matrix_as_dict(route)
+        params = {"n": n, "precedences": constrained}
+        runner.run("presolve.closure", params, lambda r=route, g=graph: RoutePresolve(r, r[0], g))
+        presolve = RoutePresolve(route, route[0], graph)
+        runner.run("presolve.shortest_ordered_path", params,
+                   lambda p=presolve, d=distances: shortest_ordered_path(p, d),
+                   rounds=max(3, runner.rounds // 10))
+
+
+def bench_solve_route(runner: Runner, catalogue: Catalogue):
+    from tools import solve_route
+    import pyomo.environ as pyo
+    solver_available = any(pyo.SolverFactory(s).available(exception_flag=False) for s in ("glpk", "cbc"))
+    for n in (5, 8, 12):
+        route = catalogue.route(n)
+        chain = [Precedence(visit_location_before=a, visit_location_after=b) for a, b in zip(route[1:-1], route[2:])][: n // 2]
+        for precedences in (None, chain):
+            params = {"n": n, "precedences": len(precedences or [])}
+            if not solver_available:
+                runner.skip("solve_route", params, "no GLPK or CBC solver installed")
+                continue
+            config = {"configurable": {"matrix": catalogue.matrix}}
+            runner.run("solve_route", params,
+                       lambda r=route, p=precedences: solve_route(r, "bench", r[0], config, p),
+                       rounds=max(3, runner.rounds // 10))
+
+
+def bench_directions_cache(runner: Runner, workdir: Path):
+    runner.run("directions_cache.load", {"fixture": True}, lambda: LocalDirectionsCache())
+    cache = LocalDirectionsCache()
+    runner.run("directions_cache.get", {"fixture": True}, lambda: cache.get(578, 497))
+
+    attractions = synthetic_attractions(100)
+    filename = str(workdir / "directions_load.json")
+    cache = LocalDirectionsCache(filename=filename)
+    for a, b in zip(attractions[:-1], attractions[1:]):
+        cache.add(a.id, b.id, synthetic_directions(a, b, 100000.0))
+    cache.save_cache()
+    runner.run("directions_cache.load", {"legs": len(attractions) - 1},
+               lambda: LocalDirectionsCache(filename=filename), rounds=max(3, runner.rounds // 10))
+
+
+def bench_plan_route_endpoint(runner: Runner):
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["BOOT_DATA_FROM"] = "FILE"
+    os.environ["DIRECTIONS_WARMUP"] = "OFF"
+    # No network: Mapbox and Supabase are the local stand-ins (utils.standins), without latency
+    os.environ.setdefault("MAPBOX_BACKEND", "STANDIN")
+    os.environ.setdefault("SUPABASE_BACKEND", "STANDIN")
+    # The same request is sent again and again: time the computation, not the response cache
+    os.environ.setdefault("PLAN_ROUTE_CACHE_TTL_SECONDS", "0")
+    from fastapi.testclient import TestClient
+    import main
+
+    payload = {"ordered_route": [578, 497, 881], "max_mileage": 90000}
+    batch = {"requests": [{"ordered_route": [578, 497, 881], "max_mileage": m} for m in range(10000, 300000, 10000)]}
+    with TestClient(main.app) as client:
+        assert client.post("/plan-route", json=payload).status_code == 200
+        runner.run("endpoint.plan_route", {"stops": 3}, lambda: client.post("/plan-route", json=payload))
+        runner.run("endpoint.plan_route_batch", {"stops": 3, "requests": len(batch["requests"])},
+                   lambda: client.post("/plan-route/batch", json=batch))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[dict], baseline_filename: str):
+    """Prints the median ratio (new / baseline) of the benchmarks present in both runs."""
+    with open(baseline_filename, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    key = lambda r: (r["name"], json.dumps(r["params"], sort_keys=True))
+    old = {key(r): r for r in baseline["results"] if "stats" in r}
+    print(f"\nCompared with {baseline_filename} ({baseline.get('commit')}):")
+    for r in results:
+        if "stats" not in r or key(r) not in old:
+            continue
+        ratio = r["stats"]["median_ms"] / old[key(r)]["stats"]["median_ms"]
+        flag = "  <-- slower" if ratio > 1.2 else ""
+        print(f"{r['name']:<40} {json.dumps(r['params']):<40} x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a previous results file to compare against")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--json-max-size", type=int, default=1000,
+                        help="above this size the synthetic matrix is only written as .npy")
+    parser.add_argument("--only", nargs="+", choices=["matrix", "planner", "solver", "cache", "endpoint"])
+    args = parser.parse_args()
+
+    selected = set(args.only or ["matrix", "planner", "solver", "cache", "endpoint"])
+    runner = Runner(args.rounds)
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        catalogues = [Catalogue(n, workdir, write_json=n <= args.json_max_size) for n in args.sizes]
+        if "matrix" in selected:
+            bench_distance_matrix(runner, catalogues)
+        if "planner" in selected:
+            bench_charge_planner(runner, catalogues, workdir)
+        if "solver" in selected:
+            bench_presolve(runner, catalogues[0])
+            bench_solve_route(runner, catalogues[0])
+        if "cache" in selected:
+            bench_directions_cache(runner, workdir)
+        if "endpoint" in selected:
+            bench_plan_route_endpoint(runner)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": runner.results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(runner.results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,267 @@
+import json
 import os
+import time
 from dotenv import load_dotenv
-from typing import Dict
-from utils.location import Location, Attraction, LocationDistanceMatrix
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from utils.location import Location, LocationDistanceMatrix
+from utils.catalogue import LocationCatalogue
 from utils.local_directions_cache import LocalDirectionsCache
-from utils.charge_planner import ChargePlanner, RouteRequest, CoordsMaxMileageReach
-from utils.charging_station import ChargingStation
+from utils.shared_cache import SharedDirectionsCache, get_shared_matrix_file
+from utils.charge_planner import ChargePlanner, RouteRequest, BatchRouteRequest, CoordsMaxMileageReach
+from utils.charging_station import ChargingStation, ChargingStationIndex
+from utils.reachability import compute_reachability
+from utils.charger_corridor import ChargerCorridors
+from utils.charger_graph import ChargerGraph, ChargingStopsRequest
+from utils.trip_days import TripDayPlanner, TripDaysRequest
 from utils.directions import Directions
-from fastapi import HTTPException, FastAPI, Query
+from utils.backends import backend_name, get_backend, open_async_backend
+from utils.directions_warmup import DEFAULT_WARMUP_TOP_K, WarmupProgress, warm_up_directions
+from utils.route_cache import SingleFlightCache, request_key
+from utils.command_parser import NameIndex
+from utils.http_cache import CompressionMiddleware, RenderedBodies, conditional_response
+from utils.metrics import REQUEST_METRIC, registry, span, start_request_spans, server_timing_header
+from fastapi import HTTPException, FastAPI, Query, Request, Response
+from utils.profiler import ProfileInfo, ProfileStore, SamplingProfiler
+from fastapi.responses import PlainTextResponse, JSONResponse
+import random
+import uuid
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
-from supabase import create_client, Client
+from contextlib import AsyncExitStack, asynccontextmanager
+import asyncio
 from pydantic import BaseModel, Field
 
+if TYPE_CHECKING:
+    from supabase import AsyncClient, Client
+
 
 load_dotenv()  # loads .env into os.environ (for dev)
+# MAPBOX_BACKEND, SUPABASE_BACKEND (LIVE or STANDIN) and LLM_BACKEND (OPENAI or FAKE)
+# pick the external services, see utils.backends
 openai_api_key = os.getenv("OPENAI_API_KEY")
-if not openai_api_key:
+if not openai_api_key and backend_name("llm") == "OPENAI":
     raise RuntimeError("Missing OPENAI_API_KEY")
 
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(url, key)
 source: str = os.environ.get("BOOT_DATA_FROM")
-if source == "LIVE":
-    attractions = Attraction.get_random(supabase, count=10)
-    distance_matrix = LocationDistanceMatrix(attractions)
-    #TODO: have a proper cache
-    directions_cache = LocalDirectionsCache() 
-elif source == "FILE":
-    attractions = Attraction.load_list_from_json("cached_attractions.json")
-    distance_matrix = LocationDistanceMatrix(attractions, filename="cached_distances.json")
-    directions_cache = LocalDirectionsCache() 
-else:
+if source not in ("LIVE", "FILE"):
     raise RuntimeError("BOOT_DATA_FROM should be either SUPABASE or a file")
+# SHARED: the directions and the distance matrix live in memory-mapped files
+# shared by all the workers (fastapi run --workers N). LOCAL: one copy per worker
+cache_backend: str = os.environ.get("CACHE_BACKEND", "LOCAL")
+
+# Nothing is loaded at import time: boot() fills these from the lifespan hook
+attractions: LocationCatalogue = LocationCatalogue.from_locations([])
+# Incremented by every boot: identifies the attractions served by /locations
+catalogue_version = 0
+distance_matrix: Optional[LocationDistanceMatrix] = None
+directions_cache: Optional[LocalDirectionsCache] = None
+startup_timings: Dict[str, float] = {}
+
+
+def get_supabase() -> "Client":
+    """The Supabase client (or its stand-in), created (and its package imported) on first use."""
+    return get_backend("supabase")
+
+
+# The async Supabase client and its connection pool, bound to the event loop:
+# opened on first use, closed at shutdown
+_async_supabase: Optional["AsyncClient"] = None
+_async_supabase_lock = asyncio.Lock()
+_async_clients = AsyncExitStack()
+
+
+async def get_async_supabase() -> "AsyncClient":
+    """The async Supabase client (or its stand-in), used by the request handlers."""
+    global _async_supabase
+    async with _async_supabase_lock:
+        if _async_supabase is None:
+            _async_supabase = await _async_clients.enter_async_context(open_async_backend("supabase"))
+    return _async_supabase
+
+
+async def close_async_clients():
+    global _async_supabase
+    await _async_clients.aclose()
+    _async_supabase = None
+
+
+# Incremented whenever the charging station data used by the handlers changes
+station_data_version = 0
+# Every charging station, loaded from Supabase on first use
+_charging_station_index: Optional[ChargingStationIndex] = None
+_charging_station_lock = asyncio.Lock()
+
+
+async def get_charging_station_index() -> ChargingStationIndex:
+    global _charging_station_index, station_data_version
+    async with _charging_station_lock:
+        if _charging_station_index is None:
+            stations = await asyncio.to_thread(ChargingStation.get_all, get_supabase(), trusted=True)
+            _charging_station_index = ChargingStationIndex(stations)
+            station_data_version += 1
+            print(f"Loaded {len(stations)} charging stations")
+    return _charging_station_index
+
+
+_charger_graph: Optional[ChargerGraph] = None
+
+
+async def get_charger_graph() -> ChargerGraph:
+    """The attractions + charging stations routing graph, built on first use."""
+    global _charger_graph
+    if _charger_graph is None:
+        chargers = await get_charging_station_index()
+        _charger_graph = ChargerGraph(distance_matrix, chargers)
+    return _charger_graph
+
+
+# Chargers along every cached directions leg, precomputed in the background (see lifespan)
+charger_corridors: Optional[ChargerCorridors] = None
+
+
+def get_agent():
+    """
+    The LangGraph agent module. LangGraph and langchain-openai are slow to import,
+    so they are only loaded by the first /chat (or /memory) call.
+    """
+    import agent
+    return agent
+
+
+def boot() -> Dict[str, float]:
+    """
+    Loads the attractions, the distance matrix and the directions cache.
+    Returns how long each step took, in seconds.
+    """
+    global attractions, distance_matrix, directions_cache, catalogue_version
+    timings = {}
+
+    t = time.perf_counter()
+    if cache_backend == "SHARED":
+        directions_cache = SharedDirectionsCache()
+    else:
+        directions_cache = LocalDirectionsCache()
+    timings["directions_cache"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    if source == "LIVE":
+        attractions = LocationCatalogue.get_random(get_supabase(), count=10)
+    else:
+        attractions = LocationCatalogue.from_json("cached_attractions.json")
+    catalogue_version += 1
+    timings["attractions"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    if source == "LIVE":
+        distance_matrix = LocationDistanceMatrix(attractions)
+        #TODO: have a proper cache
+    else:
+        distances_filename = "cached_distances.json"
+        if cache_backend == "SHARED":
+            distances_filename = get_shared_matrix_file(distances_filename)
+        distance_matrix = LocationDistanceMatrix(attractions, filename=distances_filename)
+    timings["distance_matrix"] = time.perf_counter() - t
+    return timings
+
+
+# Directions warm-up: an integer K (default DEFAULT_WARMUP_TOP_K) fetches the K nearest destinations
+# of every location, ALL every pair (N² legs, opt-in), OFF disables it
+warmup_mode: str = os.environ.get("DIRECTIONS_WARMUP", str(DEFAULT_WARMUP_TOP_K))
+warmup_concurrency: int = int(os.environ.get("DIRECTIONS_WARMUP_CONCURRENCY", "4"))
+warmup_progress = WarmupProgress()
+# With CACHE_BACKEND=SHARED, how often the other workers check that the warm-up leader is alive
+warmup_lead_retry: float = float(os.environ.get("DIRECTIONS_WARMUP_LEAD_RETRY_SECONDS", "30"))
+# Return the per-request span timings as a Server-Timing header
+server_timing: bool = os.environ.get("SERVER_TIMING", "0") == "1"
+# Opt-in sampling profiler: PROFILER_ENABLED=1 allows profiling requests sent with
+# an `X-Profile: 1` header or a `profile=1` query flag, plus a random
+# PROFILER_SAMPLE_RATE fraction of all requests
+profiler_enabled: bool = os.environ.get("PROFILER_ENABLED", "0") == "1"
+profiler_sample_rate: float = float(os.environ.get("PROFILER_SAMPLE_RATE", "0"))
+profiler_interval: float = float(os.environ.get("PROFILER_INTERVAL_MS", "5")) / 1000
+profile_store = ProfileStore(directory=os.environ.get("PROFILER_DIR"))
+# Charger corridors: ON precomputes the chargers within CHARGER_CORRIDOR_BUFFER_M of every
+# cached leg (this loads every charging station, so it defaults to ON with live data only).
+# A planned stop then gets the chargers in the last CHARGER_CORRIDOR_WINDOW_M before it.
+corridors_mode: str = os.environ.get("CHARGER_CORRIDORS", "ON" if source == "LIVE" else "OFF")
+corridor_buffer: float = float(os.environ.get("CHARGER_CORRIDOR_BUFFER_M", "2000"))
+corridor_window: float = float(os.environ.get("CHARGER_CORRIDOR_WINDOW_M", "20000"))
+# New directions are appended to the cache journal every DIRECTIONS_CACHE_FLUSH_SECONDS
+flush_interval: float = float(os.environ.get("DIRECTIONS_CACHE_FLUSH_SECONDS", "5"))
+# Directions answered by a Mapbox stand-in stay in memory, out of the cache files
+persist_directions: bool = backend_name("mapbox") == "LIVE"
+# /plan-route responses: identical concurrent requests are computed once, and the results are kept
+# PLAN_ROUTE_CACHE_TTL_SECONDS (default 300, 0 disables the cache) for the last PLAN_ROUTE_CACHE_SIZE requests
+plan_route_cache = SingleFlightCache(
+    max_entries=int(os.environ.get("PLAN_ROUTE_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("PLAN_ROUTE_CACHE_TTL_SECONDS", "300"))
+)
+# HTTP caching: /locations and /directions answer with a strong ETag (a 304 when the
+# If-None-Match header has it) and these Cache-Control headers. The catalogue changes
+# with every boot, so it is revalidated; a cached leg does not change.
+locations_cache_control: str = os.environ.get("LOCATIONS_CACHE_CONTROL", "no-cache")
+directions_cache_control: str = os.environ.get("DIRECTIONS_CACHE_CONTROL", "public, max-age=86400")
+rendered_bodies = RenderedBodies(max_entries=int(os.environ.get("RENDERED_BODIES_CACHE_SIZE", "256")))
+# /chat fast path: ON (default) applies clear route commands ("start at X", "visit A then B",
+# "solve") directly, the other messages go to the LLM
+chat_fast_path: bool = os.environ.get("CHAT_FAST_PATH", "ON").upper() == "ON"
+# JSON responses of at least COMPRESSION_MIN_BYTES are compressed (brotli if installed, else gzip)
+compression_min_bytes: int = int(os.environ.get("COMPRESSION_MIN_BYTES", "1024"))
+
+
+def start_directions_warmup() -> Optional[asyncio.Task]:
+    if warmup_mode.upper() == "OFF":
+        return None
+    if not os.getenv("MAPBOX_TOKEN") and backend_name("mapbox") == "LIVE":
+        print("MAPBOX_TOKEN not set, skipping directions warm-up")
+        return None
+    top_k = None if warmup_mode.upper() == "ALL" else int(warmup_mode)
+    warmup = lambda: warm_up_directions(
+        attractions,
+        directions_cache,
+        warmup_progress,
+        distance_matrix=distance_matrix,
+        top_k=top_k,
+        concurrency=warmup_concurrency
+    )
+    if cache_backend == "SHARED":
+        return asyncio.create_task(lead_directions_warmup(warmup))
+    return asyncio.create_task(warmup())
+
+
+async def lead_directions_warmup(warmup: Callable[[], Awaitable[None]]):
+    """
+    One worker runs the warm-up; the others wait while it is unfinished, and one of them
+    takes over if the leader exits before the end (crash, recycled worker).
+    """
+    announced = False
+    while not directions_cache.try_lead("warmup"):
+        if directions_cache.lead_finished("warmup"):
+            return
+        if not announced:
+            print("Directions warm-up already running in another worker")
+            announced = True
+        await asyncio.sleep(warmup_lead_retry)
+    finished = False
+    try:
+        await warmup()
+        finished = True
+    finally:
+        directions_cache.release_lead("warmup", finished)
+
+
+async def precompute_charger_corridors():
+    global charger_corridors, station_data_version
+    try:
+        chargers = await get_charging_station_index()
+        corridors = ChargerCorridors(chargers, buffer_m=corridor_buffer)
+        t = time.perf_counter()
+        built = await asyncio.to_thread(corridors.precompute, directions_cache)
+        charger_corridors = corridors
+        station_data_version += 1
+        print(f"Precomputed {built} charger corridors in {(time.perf_counter() - t) * 1000:.1f}ms")
+    except Exception as e:
+        print(f"Error precomputing charger corridors: {e}")
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -40,12 +269,38 @@ async def lifespan(app: FastAPI):
         This function handles the startup and shutdown logic.
     """
     print("Server is starting up...")
+    t = time.perf_counter()
+    startup_timings.update(boot())
+    plan_route_cache.clear()
+    rendered_bodies.clear()
+    startup_timings["total"] = time.perf_counter() - t
+    print("Startup timings: " + ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in startup_timings.items()))
+    # Fill the directions cache in the background, requests are served meanwhile
+    warmup_task = start_directions_warmup()
+    write_behind_task = None
+    if persist_directions:
+        write_behind_task = asyncio.create_task(directions_cache.run_write_behind(flush_interval))
+    corridors_task = None
+    if corridors_mode.upper() == "ON":
+        corridors_task = asyncio.create_task(precompute_charger_corridors())
     
     yield  # The application runs while paused here
     
     # --- Shutdown Logic (Triggered by Ctrl+C) ---
     print("Shutting down... cleaning up resources.")
-    directions_cache.save_cache()
+    if warmup_task is not None:
+        warmup_task.cancel()
+    if write_behind_task is not None:
+        write_behind_task.cancel()
+        # Wait for a flush or a compaction still running in its thread
+        await asyncio.gather(write_behind_task, return_exceptions=True)
+    if corridors_task is not None:
+        corridors_task.cancel()
+    if persist_directions:
+        # Only the entries added since the last flush are left to write
+        flushed = directions_cache.flush()
+        print(f"Flushed {flushed} new directions.")
+    await close_async_clients()
 
 
 origins = [
@@ -60,8 +315,60 @@ app.add_middleware(
     allow_methods=["*"],   # allow GET, POST, etc.
     allow_headers=["*"],   # allow any headers
 )
+app.add_middleware(CompressionMiddleware, minimum_size=compression_min_bytes)
+
+
+@app.middleware("http")
+async def record_request_timings(request: Request, call_next):
+    """Feeds the request latency histograms, and optionally the Server-Timing header."""
+    spans = start_request_spans()
+    t = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - t
+    route = request.scope.get("route")
+    registry.observe(REQUEST_METRIC, {
+        "method": request.method,
+        # the route template, not the raw path, to keep the number of series bounded
+        "path": route.path if route is not None else "unmatched",
+        "status": str(response.status_code)
+    }, elapsed)
+    if server_timing:
+        response.headers["Server-Timing"] = server_timing_header(spans, elapsed)
+    return response
+
+
+def should_profile(request: Request) -> bool:
+    if not profiler_enabled or request.url.path.startswith("/profiles"):
+        return False
+    if request.headers.get("X-Profile") == "1" or request.query_params.get("profile") == "1":
+        return True
+    return random.random() < profiler_sample_rate
+
 
-from agent import graph, memory
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """Wraps the flagged requests in a sampling profiler, stored under the returned X-Profile-Id."""
+    if not should_profile(request):
+        return await call_next(request)
+    request_id = uuid.uuid4().hex
+    # Every thread is sampled: the endpoints run on the event loop thread, but the agent's
+    # tools, the leg downloads and the charger graph run in worker threads
+    profiler = SamplingProfiler(interval=profiler_interval)
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+        profile_store.add(ProfileInfo(
+            request_id=request_id,
+            method=request.method,
+            path=request.url.path,
+            duration_ms=profiler.duration * 1000,
+            samples=sum(profiler.samples.values()),
+            interval_ms=profiler.interval * 1000
+        ), profiler)
+    response.headers["X-Profile-Id"] = request_id
+    return response
 
 
 def to_feature(item, geometry_type="Point"):
@@ -81,76 +388,311 @@ def to_feature(item, geometry_type="Point"):
         "properties": properties
     }
 
+async def download_leg(start_loc_id: int, end_loc_id: int) -> dict:
+    print(f"Downloading directions({start_loc_id}, {end_loc_id})")
+    start_loc = attractions.get(start_loc_id)
+    end_loc = attractions.get(end_loc_id)
+    return await asyncio.to_thread(Directions.get_from_mapbox, start_loc, end_loc, directions_cache)
+
+
+def start_leg_downloads(
+        ordered_route: List[int],
+        legs: Optional[Dict[Tuple[int, int], asyncio.Future]] = None) -> List[asyncio.Future]:
+    """
+    The directions of every leg of the route, as futures: the cached legs are already done,
+    the missing ones are all downloaded at the same time.
+    `legs` can be shared across several routes, so that each leg is looked up once.
+    """
+    if legs is None:
+        legs = {}
+    for start_loc_id, end_loc_id in zip(ordered_route[:-1], ordered_route[1:]):
+        key = (start_loc_id, end_loc_id)
+        if key not in legs:
+            data = directions_cache.get(start_loc_id, end_loc_id)
+            if data is None:
+                legs[key] = asyncio.ensure_future(download_leg(start_loc_id, end_loc_id))
+            else:
+                legs[key] = asyncio.get_running_loop().create_future()
+                legs[key].set_result(data)
+    return [legs[key] for key in zip(ordered_route[:-1], ordered_route[1:])]
+
+
+async def settle(futures: Iterable[asyncio.Future]):
+    """
+    Cancels the futures still pending after a request failed, and retrieves their outcome:
+    no orphan download keeps running, no "exception was never retrieved" warning.
+    """
+    futures = list(futures)
+    for future in futures:
+        future.cancel()
+    await asyncio.gather(*futures, return_exceptions=True)
+
+
+async def load_directions_for_route(
+        ordered_route: List[int],
+        legs: Optional[Dict[Tuple[int, int], asyncio.Future]] = None) -> List[dict]:
+    """Returns the directions of every leg of the route, downloading the missing ones concurrently."""
+    return list(await asyncio.gather(*start_leg_downloads(ordered_route, legs)))
+
+
+async def find_charging_stations(
+        planned_stop: CoordsMaxMileageReach,
+        lookups: Optional[Dict[Tuple[float, float], asyncio.Future]] = None) -> List[ChargingStation]:
+    """
+    Chargers around a planned stop: the ones of the leg's corridor in the last
+    `corridor_window` metres before the stop, or else the ones whose isochrone
+    covers the stop (async RPC). `lookups` deduplicates the calls for stops sharing the
+    same coordinates, also while they are running.
+    """
+    if planned_stop.reached_endpoint:
+        # No charge needed, nothing to look up
+        return []
+    if lookups is None:
+        lookups = {}
+    key = (planned_stop.lat, planned_stop.lon)
+    if key not in lookups and charger_corridors is not None and planned_stop.next_location is not None:
+        reach = planned_stop.remaining_mileage_from_last_location_reached
+        stations = charger_corridors.chargers_between(
+            planned_stop.max_reach_location,
+            planned_stop.next_location,
+            reach - corridor_window,
+            reach,
+            directions_cache
+        )
+        if stations:
+            # closest to the stop first
+            lookups[key] = asyncio.get_running_loop().create_future()
+            lookups[key].set_result(stations[::-1])
+    if key not in lookups:
+        lookups[key] = asyncio.ensure_future(ChargingStation.afind_by_isochrones(
+            planned_stop.lat,
+            planned_stop.lon,
+            supabase=await get_async_supabase()
+        ))
+    return await lookups[key]
+
+
+def build_route_response(
+        planned_stop: CoordsMaxMileageReach,
+        charging_stations_on_route: List[ChargingStation],
+        line_coordinates: list) -> dict:
+    return {
+        "status": "success",
+        "planned_stops": {
+            "type": "FeatureCollection",
+            "features": [
+                to_feature(planned_stop)
+            ] #TODO: in the future this will be a real list 
+        },
+        "charging_stations_on_route": {
+            "type": "FeatureCollection",
+            "features": [
+                to_feature(cs) for cs in charging_stations_on_route
+            ]
+        },
+        "route": {
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "properties": {"name": "Full Route Path "},
+                "geometry": {
+                "type": "MultiLineString",
+                "coordinates": line_coordinates
+                }
+            }]
+        },
+    }
+
+
+def data_version(ordered_route: List[int]) -> Tuple[Tuple[int, ...], int]:
+    """
+    Version of the data a /plan-route response is computed from: the directions of its own
+    legs and the station data. Legs added for other routes (the warm-up) do not change it.
+    """
+    legs = tuple(directions_cache.leg_version(a, b) for a, b in zip(ordered_route[:-1], ordered_route[1:]))
+    return legs, station_data_version
+
+
 @app.post("/plan-route")
 async def plan_route(request: RouteRequest):
     """
     Takes a list of location IDs and a vehicle range, 
     then inserts necessary charging stops.
+    Identical requests share one computation and its cached result (X-Cache: HIT, COALESCED or MISS).
     """
+    body, cache_status = await plan_route_cache.get_or_compute(
+        request_key(request),
+        data_version(request.ordered_route),
+        lambda: compute_plan_route(request),
+        # the missing legs are downloaded by the computation: stored under their new version
+        version_after=lambda: data_version(request.ordered_route)
+    )
+    return Response(content=body, media_type="application/json", headers={"X-Cache": cache_status})
 
-    try:    
-        ordered_route = request.ordered_route
-        data_directions_for_route = []
-        for i, v in enumerate(ordered_route[:-1]):
-            j = i + 1
-            start_loc_id = ordered_route[i]
-            end_loc_id = ordered_route[j]
-            if (start_loc_id, end_loc_id) not in directions_cache.directions:
-                print(f"Downloading directions({ordered_route[i]}, {ordered_route[j]})")
-                start_loc = next((a for a in attractions if a.id == start_loc_id), None)
-                end_loc = next((a for a in attractions if a.id == end_loc_id), None)
-                data = Directions.get_from_mapbox(start_loc, end_loc, directions_cache)
-            else:
-                data = directions_cache.directions[(start_loc_id, end_loc_id)]
-            data_directions_for_route.append(data)
-        line_coordinates = [
-            d["routes"][0]["geometry"]["coordinates"]
-            for d in data_directions_for_route
-        ]
 
+async def compute_plan_route(request: RouteRequest) -> bytes:
+    """The /plan-route response, rendered once: a cache hit is sent as it is."""
+    return JSONResponse(await plan_route_response(request)).body
+
+
+async def plan_route_response(request: RouteRequest) -> dict:
+    leg_downloads: List[asyncio.Future] = []
+    try:    
+        leg_downloads = start_leg_downloads(request.ordered_route)
         planner = ChargePlanner(
             request.ordered_route, 
             request.max_mileage,
             distance_matrix,
             directions_cache
             )
-        
+        # The prefix sums (from the matrix) tell on which leg the charge runs out:
+        # the stop only waits for that leg, then its charger lookup runs while
+        # the other legs are still downloading
+        stop_leg = int(planner.find_max_reach_indices([request.max_mileage])[0])
+        if stop_leg < len(leg_downloads):
+            await leg_downloads[stop_leg]
         planned_stop: CoordsMaxMileageReach = planner.find_coords_of_max_mileage_reach()
-        charging_stations_on_route = ChargingStation.find_by_isochrones(
-            planned_stop.lat, 
-            planned_stop.lon,
-            supabase=supabase
+        charging_stations_on_route, data_directions_for_route = await asyncio.gather(
+            find_charging_stations(planned_stop),
+            asyncio.gather(*leg_downloads)
         )
+        line_coordinates = [
+            d["routes"][0]["geometry"]["coordinates"]
+            for d in data_directions_for_route
+        ]
+
+        return build_route_response(planned_stop, charging_stations_on_route, line_coordinates)
+
+    except ValueError as ve:
+        # Handle cases where the route is impossible with the given mileage
+        raise HTTPException(status_code=400, detail=str(ve)) from ve
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+    finally:
+        await settle(leg_downloads)
 
+
+@app.post("/plan-route/batch")
+async def plan_route_batch(batch: BatchRouteRequest):
+    """
+    Evaluates several RouteRequests in one call.
+    Legs are loaded once, requests with the same ordered_route share one planner
+    (and its prefix sums) and their mileages are solved in a single vectorized pass.
+    Identical planned stops share one charger lookup.
+    Results are returned in the same order as the requests.
+    The legs of all the routes are downloaded, and the charger lookups run, concurrently.
+    """
+    legs: Dict[Tuple[int, int], asyncio.Future] = {}
+    lookups: Dict[Tuple[float, float], asyncio.Future] = {}
+    try:
+        results: List[Optional[dict]] = [None] * len(batch.requests)
+
+        # group the requests by ordered route
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        for k, request in enumerate(batch.requests):
+            groups.setdefault(tuple(request.ordered_route), []).append(k)
+        for ordered_route in groups:
+            start_leg_downloads(list(ordered_route), legs)
+
+        # (request index, planned stop, route coordinates) of the requests left to answer
+        planned: List[Tuple[int, CoordsMaxMileageReach, list]] = []
+        for ordered_route, request_indices in groups.items():
+            ordered_route = list(ordered_route)
+            try:
+                data_directions_for_route = await load_directions_for_route(ordered_route, legs)
+                line_coordinates = [
+                    d["routes"][0]["geometry"]["coordinates"]
+                    for d in data_directions_for_route
+                ]
+                mileages = [batch.requests[k].max_mileage for k in request_indices]
+                planner = ChargePlanner(ordered_route, mileages[0], distance_matrix, directions_cache)
+                planned_stops = planner.find_coords_of_max_mileage_reach_many(mileages)
+            except ValueError as ve:
+                for k in request_indices:
+                    results[k] = {"status": "error", "detail": str(ve)}
+                continue
+            planned.extend((k, stop, line_coordinates) for k, stop in zip(request_indices, planned_stops))
+
+        stations = await asyncio.gather(*(find_charging_stations(stop, lookups) for _, stop, _ in planned))
+        for (k, planned_stop, line_coordinates), charging_stations_on_route in zip(planned, stations):
+            results[k] = build_route_response(planned_stop, charging_stations_on_route, line_coordinates)
+
+        # Rendered directly: the route geometries are large, and already plain JSON
+        return JSONResponse({"status": "success", "results": results})
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+    finally:
+        await settle([*legs.values(), *lookups.values()])
+
+
+@app.post("/plan-route/charging-stops")
+async def plan_charging_stops(request: ChargingStopsRequest):
+    """
+    For every leg of an ordered route, the fastest sequence of charging stops
+    (energy-constrained search over the attractions and charging stations).
+    """
+    try:
+        graph = await get_charger_graph()
+        legs = await asyncio.to_thread(
+            graph.plan_route,
+            request.ordered_route,
+            request.max_mileage,
+            request.initial_range,
+            request.charge_minutes * 60,
+            request.avg_speed_kmh / 3.6
+        )
         return {
             "status": "success",
-            "planned_stops": {
+            "legs": legs,
+            "charging_stops": {
                 "type": "FeatureCollection",
                 "features": [
-                    to_feature(planned_stop)
-                ] #TODO: in the future this will be a real list 
-            },
-            "charging_stations_on_route": {
-                "type": "FeatureCollection",
-                "features": [
-                    to_feature(cs) for cs in charging_stations_on_route
+                    to_feature(stop) for leg in legs for stop in leg.stops
                 ]
-            },
-            "route": {
-                "type": "FeatureCollection",
-                "features": [{
+            }
+        }
+    except (ValueError, KeyError) as ve:
+        raise HTTPException(status_code=400, detail=str(ve)) from ve
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+
+
+@app.post("/plan-trip-days")
+async def plan_trip_days(request: TripDaysRequest):
+    """
+    Splits an ordered route into days that fit the daily driving + charging budget
+    (the fewest days, then the shortest longest day), with the charging stops of every day.
+    """
+    try:
+        data_directions_for_route = await load_directions_for_route(request.ordered_route)
+        planner = TripDayPlanner(request.ordered_route, request.max_mileage, distance_matrix, directions_cache)
+        days = planner.plan(request.max_daily_hours * 3600, request.charge_minutes * 60)
+        response_days = []
+        first_leg = 0
+        for day in days:
+            legs = len(day.ordered_route) - 1
+            response_days.append({
+                **day.model_dump(exclude={"charging_stops"}),
+                "charging_stops": {
+                    "type": "FeatureCollection",
+                    "features": [to_feature(stop) for stop in day.charging_stops]
+                },
+                "route": {
                     "type": "Feature",
-                    "properties": {"name": "Full Route Path "},
+                    "properties": {"day": day.day},
                     "geometry": {
-                    "type": "MultiLineString",
-                    "coordinates": line_coordinates
+                        "type": "MultiLineString",
+                        "coordinates": [
+                            d["routes"][0]["geometry"]["coordinates"]
+                            for d in data_directions_for_route[first_leg:first_leg + legs]
+                        ]
                     }
-                }]
-            },
-        }
-
-    except ValueError as ve:
-        # Handle cases where the route is impossible with the given mileage
+                }
+            })
+            first_leg += legs
+        return {"status": "success", "days": response_days}
+    except (ValueError, KeyError) as ve:
         raise HTTPException(status_code=400, detail=str(ve)) from ve
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error") from e
@@ -161,15 +703,68 @@ async def root():
     return {"message": "LangGraph backend is running 🚀"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Latency histograms in the Prometheus text format."""
+    return PlainTextResponse(registry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/profiles", response_model=List[ProfileInfo])
+async def list_profiles():
+    """The stored request profiles, most recent first."""
+    if not profiler_enabled:
+        raise HTTPException(status_code=404, detail="Profiler disabled")
+    return profile_store.list()
+
+
+@app.get("/profiles/{request_id}")
+async def get_profile(
+    request_id: str,
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed)$", description="speedscope or collapsed")
+    ):
+    """Downloads a profile, as a speedscope file or as collapsed stacks."""
+    if not profiler_enabled:
+        raise HTTPException(status_code=404, detail="Profiler disabled")
+    stored = profile_store.get(request_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"No profile for request {request_id}")
+    info, profiler = stored
+    if format == "collapsed":
+        return PlainTextResponse(
+            profiler.collapsed(),
+            headers={"Content-Disposition": f'attachment; filename="{request_id}.collapsed.txt"'}
+        )
+    return JSONResponse(
+        profiler.speedscope(f"{info.method} {info.path}"),
+        headers={"Content-Disposition": f'attachment; filename="{request_id}.speedscope.json"'}
+    )
+
+
+@app.get("/startup")
+async def get_startup_timings() -> Dict[str, float]:
+    """How long each boot step took, in seconds."""
+    return startup_timings
+
+
+@app.get("/directions/warmup", response_model=WarmupProgress)
+async def get_directions_warmup():
+    return warmup_progress
+
+
 @app.get("/directions")
 async def get_directions(
+    request: Request,
     origin_id: int = Query(..., description="The ID of the starting location"),
     destination_id: int = Query(..., description="The ID of the destination location")
     ):
-
+    """The cached directions of a leg, with an ETag: a client that has them gets a 304."""
     cached_data = directions_cache.get(origin_id, destination_id)
     if cached_data:
-        return {"source": "cache", "data": cached_data}
+        key = ("directions", origin_id, destination_id, directions_cache.leg_version(origin_id, destination_id))
+        body, etag = rendered_bodies.get_or_render(
+            key, lambda: JSONResponse({"source": "cache", "data": cached_data}).body
+        )
+        return conditional_response(request.headers.get("if-none-match"), body, etag, directions_cache_control)
     else:
         raise HTTPException(
             status_code=500,
@@ -177,12 +772,33 @@ async def get_directions(
         )
 
 
+@app.get("/reachability")
+async def get_reachability(
+    location_id: int = Query(..., description="The ID of the starting location"),
+    max_mileage: float = Query(..., gt=0, description="Range left, in metres"),
+    full_range: Optional[float] = Query(None, gt=0, description="Range after charging, enables the two-hop destinations"),
+    include_chargers: bool = Query(True, description="Also return the reachable chargers")
+    ):
+    """
+    Every attraction and charger reachable from a location within `max_mileage`
+    (and, with `full_range`, every attraction reachable after one charge), as GeoJSON.
+    """
+    try:
+        chargers = await get_charging_station_index() if include_chargers else None
+        return compute_reachability(location_id, max_mileage, distance_matrix, chargers, full_range)
+    except KeyError as ke:
+        raise HTTPException(status_code=404, detail=str(ke)) from ke
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+
+
 @app.delete("/memory")
 async def flush_all_memory() -> Dict[str, str]:
     """
     Flush all memory - clear all checkpoints.
     """
     try:
+        memory = get_agent().memory
         checkpoint_count = len(memory.storage)
         memory.storage.clear()
         
@@ -194,6 +810,17 @@ async def flush_all_memory() -> Dict[str, str]:
         raise HTTPException(status_code=500, detail=f"Error flushing memory: {str(e)}") from e
 
 
+# The attraction names of the current catalogue, for the /chat fast path
+_name_index: Optional[Tuple[int, NameIndex]] = None
+
+
+def get_name_index() -> NameIndex:
+    global _name_index
+    if _name_index is None or _name_index[0] != catalogue_version:
+        _name_index = (catalogue_version, NameIndex(attractions))
+    return _name_index[1]
+
+
 class ChatRequest(BaseModel):
     message: str
     user_id: str  # optional, for per-user memory
@@ -211,20 +838,31 @@ async def chat(req: ChatRequest):
             "eligible_locations": attractions
         }}
 
-    result = graph.invoke(
-        {"messages": [
-            {"role": "user", "content": req.message},
-        ]},
-        config=config,
-        return_intermediate_steps=True
-    )
+    agent = get_agent()
+    if chat_fast_path:
+        with span("chat_fast_path"):
+            result = agent.run_fast_path(req.message, config, get_name_index())
+        if result is not None:
+            return result
+    graph = agent.graph
+    with span("agent_invoke"):
+        result = graph.invoke(
+            {"messages": [
+                {"role": "user", "content": req.message},
+            ]},
+            config=config,
+            return_intermediate_steps=True
+        )
     #new_messages = result["messages"][req.currently_fe_buffered_messages:]
     # The last message in the updated state is the agent's reply
     return result
 
 
 @app.get("/locations", response_model=Dict[str, Dict[int, Location]])
-async def get_locations():
-    return {
-        "locations": {a.id: a for a in attractions}
-    }
\ No newline at end of file
+async def get_locations(request: Request):
+    """The attractions, rendered once per boot, with an ETag: a client that has them gets a 304."""
+    body, etag = rendered_bodies.get_or_render(
+        ("locations", catalogue_version),
+        lambda: json.dumps({"locations": attractions.records()}, ensure_ascii=False, separators=(",", ":")).encode()
+    )
+    return conditional_response(request.headers.get("if-none-match"), body, etag, locations_cache_control)
\ No newline at end of file
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from utils.catalogue import LocationCatalogue, as_catalogue
+from utils.geo import haversine_m
+from utils.location import Attraction, Location, LocationDistanceMatrix
+
+
+@pytest.fixture(scope="module")
+def attractions():
+    return Attraction.load_list_from_json("cached_attractions.json")
+
+
+@pytest.fixture
+def catalogue():
+    return LocationCatalogue.from_json("cached_attractions.json")
+
+
+def test_columns_and_views(catalogue, attractions):
+    assert len(catalogue) == len(attractions)
+    assert catalogue.ids.tolist() == [a.id for a in attractions]
+    view = catalogue.get(attractions[3].id)
+    assert isinstance(view, Location)
+    assert (view.id, view.lat, view.lon, view.name) == (
+        attractions[3].id, attractions[3].lat, attractions[3].lon, attractions[3].name
+    )
+    assert [loc.id for loc in catalogue] == catalogue.ids.tolist()
+    assert catalogue[-1].id == attractions[-1].id
+    assert catalogue.get(-5) is None and -5 not in catalogue and attractions[0].id in catalogue
+    assert catalogue.rows_of([attractions[2].id, -5, attractions[0].id]).tolist() == [2, -1, 0]
+
+
+def test_text_fields_are_loaded_on_first_use(catalogue, attractions):
+    assert catalogue._text._fields is None
+    full = catalogue.attraction(attractions[1].id)
+    assert catalogue._text._fields is not None
+    assert full.abstract == attractions[1].abstract
+    assert full.myswitzerland_id == attractions[1].myswitzerland_id
+    # A sub-catalogue shares them
+    assert catalogue[1:].attraction(attractions[1].id).abstract == attractions[1].abstract
+
+
+def test_vectorized_filters(catalogue, attractions):
+    assert catalogue.in_swiss_bbox().ids.tolist() == [a.id for a in attractions if a.is_in_swiss_bbox()]
+    assert len(catalogue.within_bbox(0, 0, 1, 1)) == 0
+
+    center = attractions[0]
+    nearby = catalogue.within_radius(center.lat, center.lon, 30_000)
+    expected = [a.id for a in attractions if haversine_m(center.lat, center.lon, a.lat, a.lon) <= 30_000]
+    assert nearby.ids.tolist() == expected
+    assert center.id in nearby
+
+
+def test_catalogue_replaces_the_list(catalogue, attractions):
+    from tools import get_available_locations
+    for_list = LocationDistanceMatrix(attractions, filename="cached_distances.json")
+    for_catalogue = LocationDistanceMatrix(catalogue, filename="cached_distances.json")
+    assert for_catalogue._get_coords_string() == for_list._get_coords_string()
+    assert for_catalogue._get_coords_string([2, 0]) == for_list._get_coords_string([2, 0])
+    assert for_catalogue.id_to_index == for_list.id_to_index
+    np.testing.assert_array_equal(for_catalogue.lats, for_list.lats)
+
+    config = {"configurable": {"eligible_locations": catalogue}}
+    assert get_available_locations(config) == get_available_locations({"configurable": {"eligible_locations": attractions}})
+    assert as_catalogue(attractions).names == catalogue.names
@@ -88,4 +88,17 @@ def test_coordinates_with_geometry(setup_data):
     # Corresponding to Erlenweg 23, 4528 Zuchwil
     # 91km from Longstreet bar (id=578)
     assert coords_max_reach.lat == pytest.approx(47.19537929153277)
-    assert coords_max_reach.lon == pytest.approx(7.550145924658294)
\ No newline at end of file
+    assert coords_max_reach.lon == pytest.approx(7.550145924658294)
+
+def test_find_coords_of_max_mileage_reach_many(setup_data):
+    attractions, dm, directions_cache = setup_data
+    ordered_route = [578, 497, 881]
+    mileages = [0.0, 1.0, 90000.0, 116000.0, 260000.0]
+    planner = ChargePlanner(ordered_route, mileages[0], dm, directions_cache)
+    results = planner.find_coords_of_max_mileage_reach_many(mileages)
+    assert len(results) == len(mileages)
+    for mileage, result in zip(mileages, results):
+        single = ChargePlanner(ordered_route, mileage, dm, directions_cache).find_coords_of_max_mileage_reach()
+        assert result == single
+    assert results[2].lat == pytest.approx(47.19537929153277)
+    assert results[-1].reached_endpoint is True
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import LineString
+from utils.charging_station import ChargingStation, ChargingStationIndex
+from utils.charger_corridor import ChargerCorridors
+from utils.local_directions_cache import LocalDirectionsCache
+
+
+@pytest.fixture(scope="module")
+def cache():
+    return LocalDirectionsCache()
+
+
+def make_station(id, lat, lon):
+    return ChargingStation.model_construct(id=id, operator_id="OP", operator_name="Operator", lat=lat, lon=lon)
+
+
+def test_corridor_offsets_follow_the_route(cache):
+    route = cache.get(578, 497)["routes"][0]
+    line = LineString(route["geometry"]["coordinates"])
+    # on the route at 25%, 50% and 75%, plus one far away
+    stations = []
+    for k, fraction in enumerate([0.75, 0.25, 0.5]):
+        point = shapely.line_interpolate_point(line, fraction, normalized=True)
+        stations.append(make_station(k, point.y, point.x))
+    stations.append(make_station(3, 45.0, 6.0))
+    corridors = ChargerCorridors(ChargingStationIndex(stations), buffer_m=500)
+
+    corridor = corridors.get(578, 497, cache)
+    assert [stations[i].id for i in corridor.stations] == [1, 2, 0]
+    np.testing.assert_allclose(corridor.offsets, [0.25, 0.5, 0.75] * np.array(route["distance"]), rtol=1e-6)
+    assert corridor.lateral.max() < 1
+
+    between = corridors.chargers_between(578, 497, 0.2 * route["distance"], 0.6 * route["distance"], cache)
+    assert [s.id for s in between] == [1, 2]
+    assert corridors.chargers_between(578, 497, 0, 1000, cache) == []
+
+
+def test_precompute_and_unknown_leg(cache):
+    corridors = ChargerCorridors(ChargingStationIndex([make_station(1, 47.0, 8.0)]))
+    assert corridors.precompute(cache) == len(cache.directions)
+    assert corridors.precompute(cache) == 0
+    assert corridors.chargers_between(1, 2, 0, 1000, cache) is None
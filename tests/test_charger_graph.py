@@ -0,0 +1,90 @@
+import threading
+import numpy as np
+import pytest
+from shapely import wkb
+from shapely.geometry import Point
+from utils.location import Attraction, LocationDistanceMatrix
+from utils.charging_station import ChargingStation, ChargingStationIndex
+from utils.charger_graph import CHARGER_ID_OFFSET, GRAPH_CACHE_SIZE, GRAPH_RANGE_STEP_M, ChargerGraph
+
+
+@pytest.fixture(scope="module")
+def dm():
+    attractions = Attraction.load_list_from_json("cached_attractions.json")
+    return LocationDistanceMatrix(attractions, filename="cached_distances.json")
+
+
+def make_station(id, lat, lon):
+    return ChargingStation(
+        id=id, operator_id="OP", operator_name="Operator", lat=lat, lon=lon,
+        location=wkb.dumps(Point(lon, lat), hex=True, srid=4326)
+    )
+
+
+def corridor_chargers(start, end, count):
+    """Chargers evenly spread on the straight line between two locations."""
+    return ChargingStationIndex([
+        make_station(i + 1, start.lat + (end.lat - start.lat) * t, start.lon + (end.lon - start.lon) * t)
+        for i, t in enumerate(np.linspace(0.05, 0.95, count))
+    ])
+
+
+def test_no_stop_when_in_range(dm):
+    graph = ChargerGraph(dm, ChargingStationIndex([]))
+    leg = graph.plan_leg(578, 497, max_range=200000, initial_range=200000)
+    assert leg.stops == []
+    assert leg.remaining_range == pytest.approx(200000 - dm.get_distance_between_ids(578, 497))
+
+
+def test_leg_with_charging_stops(dm):
+    start = dm.locations[dm.get_idx(578)]
+    end = dm.locations[dm.get_idx(881)]
+    chargers = corridor_chargers(start, end, 30)
+    graph = ChargerGraph(dm, chargers)
+    max_range = 80000
+
+    leg = graph.plan_leg(578, 881, max_range=max_range, initial_range=max_range)
+
+    assert len(leg.stops) >= 2
+    assert all(stop.node_id == CHARGER_ID_OFFSET + stop.id for stop in leg.stops)
+    assert all(stop.distance_from_previous <= max_range for stop in leg.stops)
+    assert max_range - leg.remaining_range <= max_range
+    # fewer stops than chargers: the hops are long, not charger to next charger
+    assert len(leg.stops) < 10
+
+
+def test_infeasible_leg_raises(dm):
+    start = dm.locations[dm.get_idx(578)]
+    end = dm.locations[dm.get_idx(881)]
+    graph = ChargerGraph(dm, corridor_chargers(start, end, 3))
+    with pytest.raises(ValueError):
+        graph.plan_leg(578, 881, max_range=20000, initial_range=20000)
+
+
+def test_plan_route_carries_range_over(dm):
+    start = dm.locations[dm.get_idx(578)]
+    end = dm.locations[dm.get_idx(881)]
+    graph = ChargerGraph(dm, corridor_chargers(start, end, 30))
+    legs = graph.plan_route([578, 497], max_range=300000, initial_range=120000)
+    assert legs[0].stops == []
+    assert legs[0].remaining_range == pytest.approx(120000 - dm.get_distance_between_ids(578, 497))
+
+
+def test_graphs_are_built_once_per_range_step(dm, monkeypatch):
+    start = dm.locations[dm.get_idx(578)]
+    end = dm.locations[dm.get_idx(881)]
+    graph = ChargerGraph(dm, corridor_chargers(start, end, 30))
+    builds = []
+    build = graph._build
+    monkeypatch.setattr(graph, "_build", lambda max_range: builds.append(max_range) or build(max_range))
+
+    threads = [threading.Thread(target=graph._graph, args=(80000 + k,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert builds == [80000]
+
+    for k in range(GRAPH_CACHE_SIZE + 2):
+        graph._graph(100000 + k * GRAPH_RANGE_STEP_M)
+    assert len(graph._graphs) == GRAPH_CACHE_SIZE
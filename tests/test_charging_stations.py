@@ -4,4 +4,52 @@
 # found_nearby 1: 47.195971, 7.54692
 # found_nearby 2: 47.190676, 7.553462
 # found_nearby 3: 47.198804, 7.541184,
-# Finds the 5 closest chargers to a given route point
\ No newline at end of file
+# Finds the 5 closest chargers to a given route point
+import json
+import pytest
+from pydantic import ValidationError
+from shapely import wkb
+from shapely.geometry import Point
+from utils.charging_station import ChargingStation, decode_points, hex_to_point
+from utils.location import Attraction
+
+
+def station_row(id, lat, lon):
+    return {"id": id, "operator_id": "OP", "operator_name": "Operator", "lat": lat, "lon": lon,
+            "location": wkb.dumps(Point(lon, lat), hex=True, srid=4326)}
+
+
+def test_bulk_decoding_matches_per_row():
+    rows = [station_row(k, 46 + k / 100, 7 + k / 100) for k in range(50)]
+    stations = ChargingStation.from_rows(rows)
+    for row, station in zip(rows, stations):
+        one = ChargingStation(**row)
+        assert station.model_dump() == one.model_dump()
+        assert station.location.equals(one.location)
+    assert ChargingStation.from_rows([]) == []
+    trusted = ChargingStation.from_rows(rows, trusted=True)
+    assert [s.model_dump() for s in trusted] == [s.model_dump() for s in stations]
+    assert all(t.location.equals(s.location) for t, s in zip(trusted, stations))
+
+
+def test_decoded_points_pass_through():
+    point = Point(7.4, 46.9)
+    assert hex_to_point(point) is point
+    column = decode_points([point, wkb.dumps(Point(8, 47), hex=True, srid=4326), wkb.dumps(Point(9, 46))])
+    assert column[0] is point
+    assert [(p.x, p.y) for p in column[1:]] == [(8, 47), (9, 46)]
+
+
+def test_invalid_rows_are_rejected():
+    with pytest.raises(ValidationError):
+        ChargingStation.from_rows([{**station_row(1, 46.5, 7.5), "lat": "north"}])
+
+
+def test_attractions_from_rows():
+    with open("cached_attractions.json", "r", encoding="utf-8") as f:
+        rows = json.load(f)
+    validated = Attraction.from_rows(rows)
+    assert validated == [Attraction(**row) for row in rows]
+    assert Attraction.load_list_from_json("cached_attractions.json") == validated
+    trusted = Attraction.load_list_from_json("cached_attractions.json", trusted=True)
+    assert [(a.id, a.lat, a.lon, a.name) for a in trusted] == [(a.id, a.lat, a.lon, a.name) for a in validated]
@@ -0,0 +1,73 @@
+import json
+import pytest
+from utils.command_parser import NameIndex, RouteCommand, format_solution_reply, parse_route_command
+from utils.location import Attraction, LocationDistanceMatrix
+
+
+@pytest.fixture(scope="module")
+def attractions():
+    return Attraction.load_list_from_json("cached_attractions.json")
+
+
+@pytest.fixture(scope="module")
+def index(attractions):
+    return NameIndex(attractions)
+
+
+def test_route_commands(index):
+    assert parse_route_command("Start at Longstreet Bar, visit Moods then Niesen", index) == RouteCommand(
+        locations=[578, 1771, 448], starting_point=578, precedences=[(1771, 448)]
+    )
+    # Names with commas and "and", partial names, ids and location tags
+    assert parse_route_command("visit Griesalp then snowshoes, moon and fondue", index).precedences == [(1313, 517)]
+    assert parse_route_command('start from [[loc:"578"]] and visit 881', index).locations == [578, 881]
+    # A typo is corrected when only one name word is close
+    assert parse_route_command("visit Griesslp", index).locations == [1313]
+    assert parse_route_command("please find the fastest route", index) == RouteCommand(solve=True, objective="duration")
+
+
+@pytest.mark.parametrize("message", [
+    "What is the weather?",
+    "start at",
+    "visit Moods then",
+    "visit the bar",         # no single location
+    "don't visit Moods",
+    "visit 12345",           # not in the catalogue
+    "start at Moods, start at Niesen",
+])
+def test_unclear_messages_go_to_the_llm(index, message):
+    assert parse_route_command(message, index) is None
+
+
+def test_fast_path_updates_the_thread(attractions, index):
+    agent = pytest.importorskip("agent")
+    dm = LocationDistanceMatrix(attractions, filename="cached_distances.json")
+    config = {"configurable": {"thread_id": "fast-path", "matrix": dm, "eligible_locations": attractions}}
+
+    # Without a starting point the route is not valid: the LLM asks for it
+    assert agent.run_fast_path("visit Moods", config, index) is None
+
+    state = agent.run_fast_path("Start at Longstreet Bar, visit tobogganing then Frinvillier", config, index)
+    assert state["locations"] == [578, 881, 497] and state["starting_point"] == 578
+    assert [(p.visit_location_before, p.visit_location_after) for p in state["precedences"]] == [(881, 497)]
+    human, call, output, reply = state["messages"][-4:]
+    assert call.tool_calls[0]["name"] == "route_validation_tool"
+    assert output.tool_call_id == call.tool_calls[0]["id"] and output.content == "The route is valid"
+    assert '[[loc:"881"]] before [[loc:"497"]]' in reply.content
+
+    state = agent.run_fast_path("solve", config, index)
+    solution = json.loads(state["messages"][-2].content)
+    assert solution["ordered_route"] == [578, 881, 497]
+    assert state["messages"][-1].content.startswith("Optimal route")
+    # The thread is left where the agent stops: the next message starts a new turn
+    assert not agent.graph.get_state(config).next
+
+    # Nothing new to do: the LLM answers
+    assert agent.run_fast_path("visit tobogganing", config, index) is None
+
+
+def test_solution_reply_wording():
+    solution = {"ordered_route": [578, 881], "total_distance": 12_000, "method": "exact", "gap": 0.0}
+    assert format_solution_reply(solution).startswith("Optimal route")
+    reply = format_solution_reply({**solution, "method": "heuristic", "gap": 0.04})
+    assert reply.startswith("Best route found") and "within 4% of the optimum" in reply
@@ -0,0 +1,87 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from utils.conversation_window import split_turns, window_messages
+from utils.location import Attraction, LocationDistanceMatrix
+from utils.precedence import Precedence
+
+
+def tool_turn(k: int, question: str, tool: str, output: str, answer: str):
+    call_id = f"call_{k}"
+    return [
+        HumanMessage(question),
+        AIMessage("", tool_calls=[{"name": tool, "args": {}, "id": call_id}]),
+        ToolMessage(output, tool_call_id=call_id, name=tool),
+        AIMessage(answer),
+    ]
+
+
+def test_turns_are_cut_at_user_messages():
+    messages = tool_turn(0, "q0", "route_validation_tool", "ok", "a0") + [HumanMessage("q1"), AIMessage("a1")]
+    assert [len(t) for t in split_turns(messages)] == [4, 2]
+
+
+def test_superseded_outputs_and_summary():
+    messages = (
+        tool_turn(0, "which locations?", "get_available_locations", "[{'id': 1, 'name': 'Bern'}]", "Bern")
+        + tool_turn(1, "visit 1 and 2", "route_solving_tool", "first solve", "done")
+        + tool_turn(2, "solve again", "route_solving_tool", "second solve", "done again")
+        + [HumanMessage("thanks")]
+    )
+    state = {
+        "locations": [1, 2],
+        "starting_point": 1,
+        "precedences": [Precedence(visit_location_before=1, visit_location_after=2)],
+    }
+    window = window_messages(messages, state, history_turns=3)
+    context, kept = window[0], window[1:]
+    assert isinstance(context, SystemMessage)
+    # The first turn is summarized, its locations list carried over
+    assert "User: which locations?" in context.content and "Assistant: Bern" in context.content
+    assert "Available locations: [{'id': 1, 'name': 'Bern'}]" in context.content
+    assert "locations [1, 2], starting point 1, precedences: 1 before 2" in context.content
+    assert kept[0].content == "visit 1 and 2"
+    tool_outputs = [m.content for m in kept if isinstance(m, ToolMessage)]
+    assert tool_outputs == ["[superseded by a later route_solving_tool call]", "second solve"]
+    # Every tool call still has its answer
+    call_ids = {c["id"] for m in kept if isinstance(m, AIMessage) for c in m.tool_calls}
+    assert call_ids == {m.tool_call_id for m in kept if isinstance(m, ToolMessage)}
+
+
+def test_short_conversation_is_sent_as_is():
+    messages = [HumanMessage("hi"), AIMessage("hello")]
+    assert window_messages(messages, {}) == messages
+
+
+def test_prompt_stays_bounded_in_a_long_session():
+    pytest.importorskip("langgraph")
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.prebuilt import create_react_agent
+    from tools import RoutingAgentState, get_available_locations_tool, route_solving_tool, route_validation_tool
+    from utils.conversation_window import pre_model_hook
+    from utils.scripted_llm import ScriptedChatModel
+
+    prompt_sizes = []
+
+    class RecordingModel(ScriptedChatModel):
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            prompt_sizes.append(sum(len(str(m.content)) for m in messages))
+            return super()._generate(messages, stop, run_manager, **kwargs)
+
+    graph = create_react_agent(
+        RecordingModel(latency_ms="0", error_rate=0),
+        [route_validation_tool, route_solving_tool, get_available_locations_tool],
+        state_schema=RoutingAgentState,
+        checkpointer=MemorySaver(),
+        pre_model_hook=pre_model_hook,
+    )
+    attractions = Attraction.load_list_from_json("cached_attractions.json")
+    dm = LocationDistanceMatrix(attractions, filename="cached_distances.json")
+    config = {"configurable": {"thread_id": "long", "matrix": dm, "eligible_locations": attractions}}
+    messages = ["Which locations are available?", "Start at 578, visit 881 then 497",
+                "Solve the route 578 497 881, 881 before 497"]
+    for k in range(30):
+        result = graph.invoke({"messages": [{"role": "user", "content": messages[k % 3]}]}, config=config)
+    # The whole conversation is still saved, the LLM only gets a window of it
+    assert len(result["messages"]) == 30 * 4
+    assert max(prompt_sizes[-30:]) <= 1.2 * max(prompt_sizes[12:24])
+    assert '"ordered_route": [578, 881, 497]' in result["messages"][-1].content
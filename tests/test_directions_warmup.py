@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from utils.location import Attraction, LocationDistanceMatrix
+from utils.local_directions_cache import LocalDirectionsCache
+from utils.directions import Directions
+from utils.directions_warmup import DEFAULT_WARMUP_TOP_K, WarmupProgress, get_warmup_pairs, warm_up_directions
+
+
+@pytest.fixture
+def setup_data(tmp_path):
+    attractions = Attraction.load_list_from_json("cached_attractions.json")[:4]
+    dm = LocationDistanceMatrix(
+        Attraction.load_list_from_json("cached_attractions.json"),
+        filename="cached_distances.json"
+    )
+    directions_cache = LocalDirectionsCache(filename=str(tmp_path / "directions.json"))
+    return attractions, dm, directions_cache
+
+
+def test_get_warmup_pairs_top_k(setup_data):
+    attractions, dm, directions_cache = setup_data
+    directions_cache.add(attractions[0].id, attractions[1].id, {"routes": []})
+
+    pairs, skipped = get_warmup_pairs(attractions, directions_cache, top_k=None)
+    assert len(pairs) == 4 * 3 - 1
+    assert skipped == 1
+
+    pairs, _ = get_warmup_pairs(attractions, directions_cache, dm, top_k=1)
+    starts = [start.id for start, _ in pairs]
+    assert len(set(starts)) == len(starts)
+
+
+def test_get_warmup_pairs_is_bounded_by_default(setup_data):
+    attractions, dm, directions_cache = setup_data
+    everywhere = Attraction.load_list_from_json("cached_attractions.json")
+    pairs, _ = get_warmup_pairs(everywhere, directions_cache, dm)
+    assert pairs == get_warmup_pairs(everywhere, directions_cache, dm, top_k=DEFAULT_WARMUP_TOP_K)[0]
+    pairs, _ = get_warmup_pairs(everywhere, directions_cache, dm, top_k=3)
+    assert len(pairs) == len(everywhere) * 3
+
+    with pytest.raises(ValueError):
+        get_warmup_pairs(attractions, directions_cache)
+
+
+def test_warm_up_directions_fills_cache(setup_data, monkeypatch):
+    attractions, dm, directions_cache = setup_data
+
+    def fake_get_from_mapbox(start_loc, end_loc, directions_cache):
+        if end_loc.id == attractions[3].id:
+            raise ValueError("Mapbox is down")
+        directions_cache.add(start_loc.id, end_loc.id, {"routes": []})
+
+    monkeypatch.setattr(Directions, "get_from_mapbox", fake_get_from_mapbox)
+    progress = WarmupProgress()
+    asyncio.run(warm_up_directions(attractions, directions_cache, progress, top_k=None, concurrency=2))
+
+    assert progress.total == 12
+    assert progress.failed == 3
+    assert progress.done == 9
+    assert not progress.running
+    assert directions_cache.get(attractions[0].id, attractions[1].id) is not None
+
+    # A second run counts its own legs only: the 3 failed ones
+    asyncio.run(warm_up_directions(attractions, directions_cache, progress, top_k=None, concurrency=2))
+    assert (progress.total, progress.skipped, progress.failed, progress.done) == (3, 9, 3, 0)
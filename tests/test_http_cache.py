@@ -0,0 +1,120 @@
+import gzip
+import pytest
+from fastapi.testclient import TestClient
+import main
+from utils.http_cache import RenderedBodies, choose_encoding, compress, etag_matches, make_etag
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as c:
+        yield c
+
+
+def test_etag_matching():
+    etag = make_etag(b"body")
+    assert etag == make_etag(b"body") != make_etag(b"other")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"x", {etag}', etag)
+    assert etag_matches("W/" + etag, etag)
+    assert etag_matches(etag[:-1] + '-gzip"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"x"', etag)
+
+
+def test_rendered_bodies_render_once_per_version():
+    bodies = RenderedBodies(max_entries=2)
+    renders = []
+
+    def render():
+        renders.append(1)
+        return b"{}"
+
+    assert bodies.get_or_render(("leg", 1), render) == bodies.get_or_render(("leg", 1), render)
+    assert len(renders) == 1
+    bodies.get_or_render(("leg", 2), render)
+    bodies.get_or_render(("leg", 3), render)
+    assert len(bodies) == 2
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("") is None
+
+
+def test_directions_revalidation_and_compression(client):
+    params = {"origin_id": 578, "destination_id": 497}
+    plain = client.get("/directions", params=params, headers={"Accept-Encoding": "identity"})
+    assert plain.status_code == 200
+    assert plain.headers["cache-control"] == main.directions_cache_control
+    assert "content-encoding" not in plain.headers
+    assert plain.json()["data"] == main.directions_cache.get(578, 497)
+
+    compressed = client.get("/directions", params=params, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["vary"] == "Accept-Encoding"
+    assert int(compressed.headers["content-length"]) < len(plain.content)
+    assert compressed.json() == plain.json()
+
+    # Either tag revalidates the leg, the 304 names the variant the client has
+    for etag in (plain.headers["etag"], compressed.headers["etag"]):
+        response = client.get(
+            "/directions", params=params, headers={"If-None-Match": etag, "Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 304 and response.content == b""
+        assert response.headers["etag"] == etag and response.headers["vary"] == "Accept-Encoding"
+
+    # Another leg does not
+    response = client.get(
+        "/directions",
+        params={"origin_id": 497, "destination_id": 881},
+        headers={"If-None-Match": plain.headers["etag"]}
+    )
+    assert response.status_code == 200
+
+
+def test_locations_etag_and_small_bodies_uncompressed(client, monkeypatch):
+    first = client.get("/locations", headers={"Accept-Encoding": "gzip"})
+    assert first.headers["cache-control"] == main.locations_cache_control
+    # Below the threshold: sent as is
+    assert len(first.content) < main.compression_min_bytes
+    assert "content-encoding" not in first.headers
+    assert set(first.json()["locations"]) == {str(a.id) for a in main.attractions}
+
+    response = client.get("/locations", headers={"If-None-Match": first.headers["etag"]})
+    assert response.status_code == 304
+
+    # A new catalogue gets a new tag
+    monkeypatch.setattr(main, "catalogue_version", main.catalogue_version + 1)
+    monkeypatch.setattr(main, "attractions", main.attractions[:-1])
+    response = client.get("/locations", headers={"If-None-Match": first.headers["etag"]})
+    assert response.status_code == 200 and response.headers["etag"] != first.headers["etag"]
+
+
+def test_gzip_body_is_deterministic():
+    # mtime=0: the compressed body of a tagged response can be kept and sent again
+    assert compress(b"x" * 2000, "gzip") == compress(b"x" * 2000, "gzip")
+    assert gzip.decompress(compress(b"x" * 2000, "gzip")) == b"x" * 2000
+
+
+def test_streaming_responses_pass_through():
+    from starlette.applications import Starlette
+    from starlette.responses import StreamingResponse
+    from starlette.routing import Route
+    from utils.http_cache import CompressionMiddleware
+
+    async def stream(request):
+        async def chunks():
+            for _ in range(4):
+                yield b"[" + b"0," * 1000 + b"0]\n"
+        return StreamingResponse(chunks(), media_type="application/json")
+
+    app = Starlette(routes=[Route("/stream", stream)])
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+    with TestClient(app) as c:
+        response = c.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.content == (b"[" + b"0," * 1000 + b"0]\n") * 4
@@ -0,0 +1,84 @@
+import asyncio
+import json
+import threading
+from utils.local_directions_cache import LocalDirectionsCache
+
+
+def test_flush_appends_to_journal_and_reloads(tmp_path):
+    filename = str(tmp_path / "directions.json")
+    cache = LocalDirectionsCache(filename=filename)
+    cache.add(1, 2, {"routes": [1]})
+    cache.add(2, 3, {"routes": [2]})
+
+    assert cache.flush() == 2
+    assert cache.flush() == 0
+    # the cache file is not rewritten, entries only live in the journal
+    assert not (tmp_path / "directions.json").exists()
+
+    reloaded = LocalDirectionsCache(filename=filename)
+    assert reloaded.get(1, 2) == {"routes": [1]}
+    assert reloaded.get(2, 3) == {"routes": [2]}
+
+
+def test_compaction_rewrites_cache_and_drops_journal(tmp_path):
+    filename = str(tmp_path / "directions.json")
+    cache = LocalDirectionsCache(filename=filename, compact_every=2)
+    cache.add(1, 2, {"routes": [1]})
+    cache.flush()
+    assert (tmp_path / "directions.json.journal").exists()
+    cache.add(2, 3, {"routes": [2]})
+    cache.flush()
+
+    assert not (tmp_path / "directions.json.journal").exists()
+    with open(filename, "r", encoding="utf-8") as f:
+        assert json.load(f) == {"1-2": {"routes": [1]}, "2-3": {"routes": [2]}}
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_torn_journal_entry_is_skipped(tmp_path):
+    filename = str(tmp_path / "directions.json")
+    cache = LocalDirectionsCache(filename=filename)
+    cache.add(1, 2, {"routes": [1]})
+    cache.flush()
+    with open(tmp_path / "directions.json.journal", "a", encoding="utf-8") as f:
+        f.write('{"key": "2-3", "da')
+
+    reloaded = LocalDirectionsCache(filename=filename)
+    assert reloaded.get(1, 2) == {"routes": [1]}
+    assert reloaded.get(2, 3) is None
+    # the torn journal has been compacted away
+    assert not (tmp_path / "directions.json.journal").exists()
+
+
+def test_compaction_keeps_the_pending_entries(tmp_path):
+    filename = str(tmp_path / "directions.json")
+    cache = LocalDirectionsCache(filename=filename)
+    cache.add(1, 2, {"routes": [1]})
+    cache.compact()
+    # the entry is in the cache file, nothing is left to journal
+    assert cache.flush() == 0
+    assert LocalDirectionsCache(filename=filename).get(1, 2) == {"routes": [1]}
+
+
+def test_cancelled_write_behind_waits_for_its_flush(tmp_path):
+    cache = LocalDirectionsCache(filename=str(tmp_path / "directions.json"))
+    started, release = threading.Event(), threading.Event()
+    flushed = []
+
+    def slow_flush():
+        started.set()
+        release.wait(5)
+        flushed.append(True)
+        return 0
+    cache.flush = slow_flush
+
+    async def run():
+        task = asyncio.create_task(cache.run_write_behind(0))
+        await asyncio.to_thread(started.wait, 5)
+        task.cancel()
+        threading.Timer(0.05, release.set).start()
+        await asyncio.gather(task, return_exceptions=True)
+        return task.cancelled()
+
+    assert asyncio.run(run())
+    assert flushed
@@ -0,0 +1,79 @@
+import itertools
+import random
+import numpy as np
+import pytest
+from utils import local_search
+from utils.local_search import is_feasible, min_assignment, parallel_local_search
+from utils.location import Attraction, LocationDistanceMatrix
+from utils.precedence import Precedence, PrecedenceGraph
+from utils.presolve import RoutePresolve, shortest_ordered_path
+
+
+def make_graph(edges):
+    graph = PrecedenceGraph()
+    assert graph.sync([Precedence(visit_location_before=a, visit_location_after=b) for a, b in edges]) is None
+    return graph
+
+
+def random_instance(rng, n, precedences):
+    route = rng.sample(range(1000), n)
+    points = {r: (rng.uniform(0, 100), rng.uniform(0, 100)) for r in route}
+    distances = {
+        (a, b): ((points[a][0] - points[b][0]) ** 2 + (points[a][1] - points[b][1]) ** 2) ** 0.5 * rng.uniform(1, 1.2)
+        for a in route for b in route if a != b
+    }
+    edges = []
+    for _ in range(precedences):
+        a, b = rng.sample(route[1:], 2)
+        if make_graph(edges).add_edge(a, b) is None:
+            edges.append((a, b))
+    return RoutePresolve(route, route[0], make_graph(edges)), distances
+
+
+def test_assignment_matches_brute_force():
+    rng = random.Random(1)
+    for n in range(1, 6):
+        cost = [[rng.uniform(0, 10) for _ in range(n)] for _ in range(n)]
+        best = min(sum(cost[i][p[i]] for i in range(n)) for p in itertools.permutations(range(n)))
+        assert min_assignment(np.array(cost)) == pytest.approx(best)
+
+
+def test_local_search_finds_the_optimum_of_small_routes():
+    rng = random.Random(7)
+    for k in range(20):
+        presolve, distances = random_instance(rng, rng.randint(3, 9), rng.randint(0, 3))
+        optimum = shortest_ordered_path(presolve, distances)[1]
+        result = parallel_local_search(presolve, distances, time_budget=0.05, workers=1, seed=k)
+        index = presolve.index
+        assert sorted(result.tour) == sorted(presolve.locations) and result.tour[0] == presolve.locations[presolve.start]
+        assert is_feasible([index[v] for v in result.tour], presolve.ancestors)
+        assert result.cost == pytest.approx(optimum)
+        assert result.lower_bound <= optimum + 1e-6 and 0 <= result.gap < 1
+
+
+def test_workers_share_a_deadline():
+    presolve, distances = random_instance(random.Random(3), 40, 10)
+    result = parallel_local_search(presolve, distances, time_budget=0.5, workers=2)
+    assert result.workers == 2
+    assert is_feasible([presolve.index[v] for v in result.tour], presolve.ancestors)
+    assert result.cost == pytest.approx(sum(distances[a, b] for a, b in zip(result.tour, result.tour[1:])))
+    assert result.lower_bound <= result.cost
+
+
+def test_solve_route_heuristic_method(monkeypatch):
+    from tools import solve_route
+    monkeypatch.setattr(local_search, "SOLVER_TIME_BUDGET", 0.1)
+    monkeypatch.setattr(local_search, "SOLVER_WORKERS", 1)
+    attractions = Attraction.load_list_from_json("cached_attractions.json")
+    dm = LocationDistanceMatrix(attractions, filename="cached_distances.json")
+    ids = [a.id for a in attractions]
+    precedences = [Precedence(visit_location_before=ids[3], visit_location_after=ids[1])]
+    config = {"configurable": {"matrix": dm}}
+
+    exact = solve_route(ids, "call", ids[0], config, precedences)
+    heuristic = solve_route(ids, "call", ids[0], config, precedences, method="heuristic")
+    assert exact["method"] == "exact" and heuristic["method"] == "heuristic"
+    # 10 locations: the local search finds the optimum
+    assert heuristic["total_cost"] == pytest.approx(exact["total_cost"])
+    assert heuristic["positions"][ids[3]] < heuristic["positions"][ids[1]]
+    assert 0 <= heuristic["gap"] < 1
@@ -0,0 +1,117 @@
+import json
+import numpy as np
+import pytest
+import requests
+from utils.location import (
+    DISTANCE, DURATION, ESTIMATED_SPEED_MPS, MAPBOX_MATRIX_MAX_COORDINATES, Attraction, LocationDistanceMatrix
+)
+from utils.backends import reset_backends
+from utils.shared_cache import get_shared_matrix_file
+
+
+@pytest.fixture(scope="module")
+def attractions():
+    return Attraction.load_list_from_json("cached_attractions.json")
+
+
+def test_cached_matrix_without_durations(attractions):
+    dm = LocationDistanceMatrix(attractions, filename="cached_distances.json")
+    assert dm.matrix.shape == (2, len(attractions), len(attractions))
+    assert dm.durations_estimated
+    a, b = attractions[0].id, attractions[1].id
+    assert dm.get_duration_between_ids(a, b) == pytest.approx(dm.get_distance_between_ids(a, b) / ESTIMATED_SPEED_MPS)
+
+    ids = [a.id for a in attractions[::2]]
+    expected = [[dm.get_distance_between_ids(i, j) for j in ids] for i in ids]
+    assert dm.get_sub_matrix(ids) == expected
+
+
+def test_both_layers_round_trip(attractions, tmp_path):
+    dm = LocationDistanceMatrix(attractions, filename="cached_distances.json")
+    filename = str(tmp_path / "matrix.json")
+    dm.save_to_json(filename)
+    for loaded in (
+        LocationDistanceMatrix(attractions, filename=filename),
+        LocationDistanceMatrix(attractions, filename=get_shared_matrix_file(filename)),
+    ):
+        assert not loaded.durations_estimated
+        np.testing.assert_allclose(loaded.matrix, dm.matrix)
+
+
+def test_cost_matrix_objectives(attractions):
+    dm = LocationDistanceMatrix(attractions, filename="cached_distances.json")
+    ids = [a.id for a in attractions[:3]]
+    distances = dm.get_cost_matrix_as_dict(ids, "distance")
+    durations = dm.get_cost_matrix_as_dict(ids, "duration")
+    weighted = dm.get_cost_matrix_as_dict(ids, "weighted", duration_weight=10)
+    assert distances == dm.get_distance_matrix_as_dict(ids)
+    assert durations[(ids[0], ids[0])] == 0.0
+    for key in distances:
+        assert weighted[key] == pytest.approx(distances[key] + 10 * durations[key])
+    with pytest.raises(ValueError):
+        dm.get_cost_matrix_as_dict(ids, "fuel")
+
+
+def test_mapbox_matrix_is_tiled(attractions, monkeypatch):
+    locations = [
+        a.model_copy(update={"id": k, "lat": 46 + k / 100, "lon": 7 + k / 100})
+        for k, a in enumerate(attractions * 5)
+    ]
+    n = len(locations)
+    assert n > MAPBOX_MATRIX_MAX_COORDINATES
+    full = np.random.default_rng(0).uniform(1, 1000, (2, n, n))
+    by_coords = {f"{loc.lon},{loc.lat}": k for k, loc in enumerate(locations)}
+    calls = []
+
+    class FakeResponse:
+        def __init__(self, data):
+            self.data = data
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return self.data
+
+    def fake_get(url, params, timeout=None):
+        coordinates = [by_coords[c] for c in url.rsplit("/", 1)[1].split(";")]
+        assert len(coordinates) <= MAPBOX_MATRIX_MAX_COORDINATES
+        assert params["annotations"] == "distance,duration"
+        calls.append(url)
+        sources = [coordinates[int(k)] for k in params["sources"].split(";")]
+        destinations = [coordinates[int(k)] for k in params["destinations"].split(";")]
+        block = np.ix_(sources, destinations)
+        return FakeResponse({"distances": full[DISTANCE][block].tolist(), "durations": full[DURATION][block].tolist()})
+
+    monkeypatch.setenv("MAPBOX_BACKEND", "LIVE")
+    monkeypatch.setenv("MAPBOX_TOKEN", "token")
+    monkeypatch.setattr(requests, "get", fake_get)
+    reset_backends()
+    try:
+        dm = LocationDistanceMatrix(locations)
+    finally:
+        reset_backends()
+    np.testing.assert_allclose(dm.matrix, full)
+    assert len(calls) == len(range(0, n, MAPBOX_MATRIX_MAX_COORDINATES // 2)) ** 2
+
+
+def test_solve_route_duration_objective(attractions, tmp_path):
+    pytest.importorskip("langgraph")
+    from tools import solve_route
+
+    # 0 -> 1 -> 2 is the shortest, 0 -> 2 -> 1 the fastest (motorway)
+    three = attractions[:3]
+    with open(tmp_path / "matrix.json", "w") as f:
+        json.dump({
+            "distances": [[0, 10, 20], [10, 0, 10], [20, 10, 0]],
+            "durations": [[0, 100, 5], [100, 0, 100], [5, 100, 0]],
+        }, f)
+    dm = LocationDistanceMatrix(three, filename=str(tmp_path / "matrix.json"))
+    ids = [a.id for a in three]
+    config = {"configurable": {"matrix": dm}}
+
+    shortest = solve_route(ids, "call", ids[0], config)
+    assert shortest["ordered_route"] == ids and shortest["total_distance"] == 20
+    fastest = solve_route(ids, "call", ids[0], config, objective="duration")
+    assert fastest["ordered_route"] == [ids[0], ids[2], ids[1]]
+    assert fastest["total_duration"] == 105 and fastest["total_cost"] == 105
@@ -0,0 +1,33 @@
+from utils.metrics import MetricsRegistry, SPAN_METRIC, registry, span, start_request_spans, server_timing_header, timed
+
+
+def test_histogram_rendering():
+    metrics = MetricsRegistry()
+    metrics.observe("latency_seconds", {"span": "a"}, 0.003)
+    metrics.observe("latency_seconds", {"span": "a"}, 0.2)
+    metrics.observe("latency_seconds", {"span": "a"}, 100)
+
+    text = metrics.render_prometheus()
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{span="a",le="0.001"} 0' in text
+    assert 'latency_seconds_bucket{span="a",le="0.005"} 1' in text
+    assert 'latency_seconds_bucket{span="a",le="0.25"} 2' in text
+    assert 'latency_seconds_bucket{span="a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{span="a"} 3' in text
+
+
+def test_spans_are_recorded_per_request():
+    @timed("test_decorated")
+    def work():
+        with span("test_inner"):
+            pass
+
+    spans = start_request_spans()
+    work()
+    work()
+
+    assert [name for name, _ in spans] == ["test_inner", "test_decorated"] * 2
+    assert registry.get(SPAN_METRIC, span="test_decorated").count >= 2
+    header = server_timing_header(spans, total=0.5)
+    assert header.startswith("test_inner;dur=")
+    assert header.endswith("total;dur=500.0")
@@ -0,0 +1,112 @@
+import pytest
+from fastapi import HTTPException
+from shapely.geometry import Point, shape
+from utils import osm_routing
+from utils.backends import get_backend, reset_backends
+from utils.directions import Directions
+from utils.location import Attraction, LocationDistanceMatrix
+from utils.osm_routing import OsmMapbox, RoadGraph
+
+NODES = {
+    1: (7.400, 46.900), 2: (7.405, 46.900), 3: (7.410, 46.900),
+    5: (7.400, 46.903), 6: (7.410, 46.903),
+    7: (7.420, 46.900), 9: (7.410, 46.897),
+    20: (7.410, 46.890),
+    30: (7.450, 46.950), 31: (7.451, 46.950),
+}
+WAYS = [
+    ([1, 2, 3], {"highway": "residential"}),
+    # Longer, but faster
+    ([1, 5, 6, 3], {"highway": "primary"}),
+    ([3, 7], {"highway": "primary", "oneway": "yes"}),
+    ([7, 9, 1], {"highway": "service"}),
+    ([3, 20], {"highway": "residential", "access": "private"}),
+    ([1, 20], {"highway": "footway"}),
+    # Not connected to the rest
+    ([30, 31], {"highway": "residential"}),
+]
+
+
+def write_extract(path):
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    lines += [f'<node id="{k}" lon="{lon}" lat="{lat}"/>' for k, (lon, lat) in NODES.items()]
+    for k, (refs, tags) in enumerate(WAYS):
+        lines.append(f'<way id="{100 + k}">')
+        lines += [f'<nd ref="{ref}"/>' for ref in refs]
+        lines += [f'<tag k="{key}" v="{value}"/>' for key, value in tags.items()]
+        lines.append("</way>")
+    lines.append("</osm>")
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def graph(tmp_path):
+    return RoadGraph.from_osm(write_extract(tmp_path / "extract.osm"), landmarks=2)
+
+
+def node(graph, osm_id):
+    return graph.snap(*NODES[osm_id])[0]
+
+
+def attraction(osm_id):
+    lon, lat = NODES[osm_id]
+    return Attraction(id=osm_id, lon=lon, lat=lat, name=f"node {osm_id}", myswitzerland_id=str(osm_id))
+
+
+def test_only_junctions_are_nodes(graph):
+    # 1, 3, 7 and the disconnected 30-31; the private road and the footway are left out
+    assert graph.node_count == 5
+    assert int(graph.routable.sum()) == 3
+    assert graph.snap(*NODES[2])[0] in (node(graph, 1), node(graph, 3))
+
+
+def test_fastest_route_and_one_ways(graph, tmp_path):
+    duration, distance, edges = graph.route(node(graph, 1), node(graph, 3))
+    assert graph.path_coordinates(node(graph, 1), edges) == [list(NODES[k]) for k in (1, 5, 6, 3)]
+    assert distance > 1400 and duration == pytest.approx(distance / (80 / 3.6))
+
+    there = graph.route(node(graph, 3), node(graph, 7))
+    back = graph.route(node(graph, 7), node(graph, 3))
+    assert back[0] > there[0]
+
+    graph.save(tmp_path / "graph.npz")
+    loaded = RoadGraph.load(tmp_path / "graph.npz")
+    assert loaded.route(node(loaded, 7), node(loaded, 3)) == back
+
+
+def test_backend_answers_directions_matrix_and_isochrone(graph, tmp_path, monkeypatch):
+    graph.save(tmp_path / "graph.npz")
+    monkeypatch.setattr(osm_routing, "OSM_GRAPH_FILE", str(tmp_path / "graph.npz"))
+    monkeypatch.setenv("MAPBOX_BACKEND", "OSM")
+    monkeypatch.delenv("MAPBOX_TOKEN", raising=False)
+    reset_backends()
+    try:
+        assert isinstance(get_backend("mapbox"), OsmMapbox)
+        data = Directions.get_from_mapbox(attraction(7), attraction(3), _Cache())
+        route = data["routes"][0]
+        assert route["geometry"]["coordinates"][0] == list(NODES[7])
+        assert route["duration"] == pytest.approx(graph.route(node(graph, 7), node(graph, 3))[0])
+
+        locations = [attraction(k) for k in (1, 3, 7)]
+        dm = LocationDistanceMatrix(locations)
+        assert dm.get_distance_between_ids(1, 3) == pytest.approx(graph.route(node(graph, 1), node(graph, 3))[1])
+        assert dm.get_duration_between_ids(7, 3) > dm.get_duration_between_ids(3, 7)
+
+        response = get_backend("mapbox").get(
+            f"https://api.mapbox.com/isochrone/v1/mapbox/driving/{NODES[1][0]},{NODES[1][1]}",
+            params={"contours_minutes": 2}
+        ).json()
+        polygon = shape(response["features"][0]["geometry"])
+        assert polygon.contains(Point(NODES[3])) and not polygon.contains(Point(NODES[30]))
+
+        # Nowhere near a routable road
+        with pytest.raises(HTTPException):
+            Directions.get_from_mapbox(attraction(30), attraction(1), _Cache())
+    finally:
+        reset_backends()
+
+
+class _Cache:
+    def add(self, id_a, id_b, data):
+        pass
@@ -1,14 +1,23 @@
 import pytest
 from fastapi.testclient import TestClient
 from main import app
+from utils.backends import reset_backends
 from utils.charge_planner import CoordsMaxMileageReach
 from utils.charging_station import ChargingStation
 
 # Create a fixture for the TestClient
 @pytest.fixture
-def client():
+def client(monkeypatch):
+    # The live backends, whatever the environment says: the tests patch their calls,
+    # and no warm-up downloads legs while they count the downloads
+    import main
+    monkeypatch.setenv("MAPBOX_BACKEND", "LIVE")
+    monkeypatch.setenv("SUPABASE_BACKEND", "LIVE")
+    monkeypatch.setattr(main, "warmup_mode", "OFF")
+    reset_backends()
     with TestClient(app) as c:
         yield c
+    reset_backends()
 
 def test_plan_route_success(client):
     payload = {
@@ -50,3 +59,136 @@ def test_plan_route_success(client):
     
     # You can also verify that properties were mapped correctly
     assert "operator_name" in cs_features[0]["properties"]
+
+
+def test_plan_route_batch_shares_charger_lookups(client, monkeypatch):
+    calls = []
+
+    async def fake_find_by_isochrones(lat, lon, supabase):
+        calls.append((lat, lon))
+        return []
+
+    monkeypatch.setattr(ChargingStation, "afind_by_isochrones", fake_find_by_isochrones)
+    payload = {
+        "requests": [
+            {"ordered_route": [578, 497, 881], "max_mileage": 90000},
+            {"ordered_route": [578, 497, 881], "max_mileage": 90000},
+            {"ordered_route": [578, 497, 881], "max_mileage": 1000000},
+            {"ordered_route": [578, 497], "max_mileage": 90000},
+        ]
+    }
+
+    response = client.post("/plan-route/batch", json=payload)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == 4
+    coords = results[0]["planned_stops"]["features"][0]["geometry"]["coordinates"]
+    assert coords[1] == pytest.approx(47.19537929153277)
+    assert coords[0] == pytest.approx(7.550145924658294)
+    assert results[1] == results[0]
+    assert results[2]["planned_stops"]["features"][0]["properties"]["reached_endpoint"] is True
+    # Same stop for requests 0, 1 and 3, no lookup for the endpoint: a single RPC
+    assert len(calls) == 1
+
+
+def test_metrics_endpoint(client, monkeypatch):
+    async def no_chargers(lat, lon, supabase):
+        return []
+
+    monkeypatch.setattr(ChargingStation, "afind_by_isochrones", no_chargers)
+    client.post("/plan-route", json={"ordered_route": [578, 497], "max_mileage": 90000})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'plan42_span_duration_seconds_count{span="charge_planner_max_reach"}' in response.text
+    assert 'path="/plan-route"' in response.text
+
+
+def test_plan_route_uses_charger_corridors(client, monkeypatch):
+    import main
+    import shapely
+    from shapely.geometry import LineString
+    from utils.charger_corridor import ChargerCorridors
+    from utils.charging_station import ChargingStationIndex
+
+    async def fail_find_by_isochrones(lat, lon, supabase):
+        raise AssertionError("the corridor should answer without an RPC")
+
+    # one charger on the route 5 km before the planned stop (90 km into the 578 -> 497 leg)
+    route = main.directions_cache.get(578, 497)["routes"][0]
+    point = shapely.line_interpolate_point(
+        LineString(route["geometry"]["coordinates"]), 85000 / route["distance"], normalized=True
+    )
+    station = ChargingStation.model_construct(id=7, operator_id="OP", operator_name="Operator", lat=point.y, lon=point.x)
+    monkeypatch.setattr(main, "charger_corridors", ChargerCorridors(ChargingStationIndex([station])))
+    monkeypatch.setattr(ChargingStation, "afind_by_isochrones", fail_find_by_isochrones)
+
+    response = client.post("/plan-route", json={"ordered_route": [578, 497, 881], "max_mileage": 90000})
+    assert response.status_code == 200
+    features = response.json()["charging_stations_on_route"]["features"]
+    assert [f["properties"]["id"] for f in features] == [7]
+
+
+def test_plan_route_overlaps_downloads_and_lookup(client, monkeypatch):
+    import asyncio
+    import time
+    import main
+    from utils.directions import Directions
+
+    events = []
+    leg = main.directions_cache.get(578, 497)
+
+    def slow_get_from_mapbox(start_loc, end_loc, directions_cache):
+        events.append(("download start", start_loc.id, time.perf_counter()))
+        time.sleep(0.2)
+        events.append(("download end", start_loc.id, time.perf_counter()))
+        return leg  # not added to the cache: the test leaves no trace
+
+    async def slow_find_by_isochrones(lat, lon, supabase):
+        events.append(("lookup start", None, time.perf_counter()))
+        await asyncio.sleep(0.2)
+        return []
+
+    monkeypatch.setattr(Directions, "get_from_mapbox", slow_get_from_mapbox)
+    monkeypatch.setattr(ChargingStation, "afind_by_isochrones", slow_find_by_isochrones)
+    # 578 -> 497 is cached and the charge runs out on it; 497 -> 1313 -> 1771 are downloaded
+    t = time.perf_counter()
+    response = client.post("/plan-route", json={"ordered_route": [578, 497, 1313, 1771], "max_mileage": 90000})
+    elapsed = time.perf_counter() - t
+    assert response.status_code == 200
+    assert len(response.json()["route"]["features"][0]["geometry"]["coordinates"]) == 3
+
+    starts = [t for name, _, t in events if name != "download end"]
+    ends = [t for name, _, t in events if name == "download end"]
+    # the two downloads and the lookup all started before the first download finished
+    assert len(starts) == 3 and len(ends) == 2 and max(starts) < min(ends)
+    assert elapsed < 0.55
+
+
+def test_failed_plan_route_cancels_its_downloads(client, monkeypatch):
+    import asyncio
+    import main
+    from utils.charge_planner import ChargePlanner
+
+    started = []
+    start_leg_downloads = main.start_leg_downloads
+
+    def record_downloads(ordered_route, legs=None):
+        started.extend(start_leg_downloads(ordered_route, legs))
+        return started
+
+    async def slow_download_leg(start_loc_id, end_loc_id):
+        await asyncio.sleep(5)
+
+    def no_stop(self):
+        raise ValueError("No stop")
+
+    monkeypatch.setattr(main, "download_leg", slow_download_leg)
+    monkeypatch.setattr(main, "start_leg_downloads", record_downloads)
+    monkeypatch.setattr(ChargePlanner, "find_coords_of_max_mileage_reach", no_stop)
+    # 578 -> 497 is cached and the charge runs out on it: the stop fails while 497 -> 1313 -> 1771 download
+    response = client.post("/plan-route", json={"ordered_route": [578, 497, 1313, 1771], "max_mileage": 90000})
+    assert response.status_code == 400
+    assert len(started) == 3 and all(f.done() for f in started)
+    assert [f.cancelled() for f in started] == [False, True, True]
@@ -0,0 +1,117 @@
+import copy
+import random
+import pytest
+from utils.precedence import Precedence, PrecedenceGraph, check_precedence_validity
+
+
+def assert_topological(graph: PrecedenceGraph):
+    for a, b in graph.edges():
+        assert graph.position[a] < graph.position[b]
+
+
+def test_add_edge_keeps_a_topological_order():
+    rng = random.Random(42)
+    graph = PrecedenceGraph()
+    for _ in range(500):
+        a, b = rng.sample(range(60), 2)
+        before = set(graph.edges())
+        cycle = graph.add_edge(a, b)
+        if cycle is None:
+            assert (a, b) in graph.edges()
+        else:
+            # rejected: nothing changed, and the cycle is made of existing edges plus (a, b)
+            assert set(graph.edges()) == before
+            assert cycle[0] == cycle[-1] == a and cycle[1] == b
+            assert all(edge in before for edge in zip(cycle[1:-1], cycle[2:]))
+        assert_topological(graph)
+
+
+def test_cycle_detection():
+    precedences = [Precedence(visit_location_before=a, visit_location_after=b) for a, b in [(1, 2), (2, 3), (3, 1)]]
+    assert check_precedence_validity(precedences) == (False, [3, 1, 2, 3])
+    assert check_precedence_validity(precedences[:2]) == (True, None)
+    assert PrecedenceGraph().add_edge(4, 4) == [4, 4]
+
+
+def test_long_chain_has_no_recursion_limit():
+    n = 20000
+    precedences = [Precedence(visit_location_before=i + 1, visit_location_after=i) for i in range(n)]
+    graph = PrecedenceGraph()
+    assert graph.sync(precedences) is None
+    assert graph.topological_order() == list(range(n, -1, -1))
+    assert graph.add_edge(0, n) == [0, n] + list(range(n - 1, -1, -1))
+
+
+def test_sync_and_round_trip():
+    graph = PrecedenceGraph()
+    graph.sync([Precedence(visit_location_before=1, visit_location_after=2)])
+    restored = PrecedenceGraph.from_dict(graph.to_dict())
+    # 1 -> 2 is dropped, 2 -> 1 no longer closes a cycle
+    assert restored.sync([Precedence(visit_location_before=2, visit_location_after=1)]) is None
+    assert restored.edges() == [(2, 1)]
+    assert_topological(restored)
+    assert PrecedenceGraph.from_dict(None).edges() == []
+
+
+def test_sync_rolls_back_on_cycle():
+    graph = PrecedenceGraph()
+    graph.sync([Precedence(visit_location_before=1, visit_location_after=2),
+                Precedence(visit_location_before=2, visit_location_after=3)])
+    cycle = graph.sync([Precedence(visit_location_before=2, visit_location_after=3),
+                        Precedence(visit_location_before=4, visit_location_after=5),
+                        Precedence(visit_location_before=5, visit_location_after=4)])
+    assert cycle == [5, 4, 5]
+    assert sorted(graph.edges()) == [(1, 2), (2, 3)] and set(graph.position) == {1, 2, 3}
+    assert_topological(graph)
+
+
+def test_validate_route_updates_state():
+    pytest.importorskip("langgraph")
+    from langgraph.types import Command
+    from tools import PrecedenceCycleError, get_precedence_graph, validate_route
+
+    precedences = [Precedence(visit_location_before=3, visit_location_after=2)]
+    state = {"precedence_graph": {"positions": {1: 0, 2: 1, 3: 2}, "edges": [[1, 2]]}}
+    saved = copy.deepcopy(state)
+    result = validate_route([1, 2, 3], "call", 1, precedences, state=state)
+    assert isinstance(result, Command)
+    # 1 had no other precedence and is dropped; the state itself is left as it was
+    assert PrecedenceGraph.from_dict(result.update["precedence_graph"]).topological_order() == [3, 2]
+    assert result.update["precedence_graph"]["edges"] == [[3, 2]]
+    assert result.update["messages"][0].tool_call_id == "call"
+    assert state == saved
+
+    # Other precedences (e.g. the ones of a solve call) get a graph of their own
+    assert get_precedence_graph(result.update, []).edges() == []
+    assert result.update["precedence_graph"]["edges"] == [[3, 2]]
+
+    precedences.append(Precedence(visit_location_before=2, visit_location_after=3))
+    with pytest.raises(PrecedenceCycleError):
+        validate_route([1, 2, 3], "call", 1, precedences, state=result.update)
+
+
+def test_graph_is_checkpointed():
+    pytest.importorskip("langgraph")
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.prebuilt import create_react_agent
+    from tools import RoutingAgentState, route_solving_tool, route_validation_tool
+    from utils.location import Attraction, LocationDistanceMatrix
+    from utils.scripted_llm import ScriptedChatModel
+
+    agent = create_react_agent(
+        ScriptedChatModel(latency_ms="0", error_rate=0),
+        [route_validation_tool, route_solving_tool],
+        state_schema=RoutingAgentState,
+        checkpointer=MemorySaver(),
+    )
+    attractions = Attraction.load_list_from_json("cached_attractions.json")
+    dm = LocationDistanceMatrix(attractions, filename="cached_distances.json")
+    config = {"configurable": {"thread_id": "graph", "matrix": dm, "eligible_locations": attractions}}
+    agent.invoke({"messages": [{"role": "user", "content": "Start at 578, visit 881 then 497"}]}, config=config)
+
+    # Restored from the checkpoint
+    saved = agent.get_state(config).values["precedence_graph"]
+    graph = PrecedenceGraph.from_dict(saved)
+    assert graph.edges() == [(881, 497)]
+    assert_topological(graph)
+    assert graph.add_edge(497, 881) == [497, 881, 497]
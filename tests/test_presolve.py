@@ -0,0 +1,86 @@
+import itertools
+import random
+import pytest
+from utils.precedence import Precedence, PrecedenceGraph
+from utils.presolve import RoutePresolve, shortest_ordered_path
+
+
+def make_graph(edges):
+    graph = PrecedenceGraph()
+    assert graph.sync([Precedence(visit_location_before=a, visit_location_after=b) for a, b in edges]) is None
+    return graph
+
+
+def brute_force(route, start, edges, distances):
+    best = None
+    for perm in itertools.permutations([r for r in route if r != start]):
+        path = [start, *perm]
+        position = {loc: k for k, loc in enumerate(path)}
+        if all(position[a] < position[b] for a, b in edges):
+            cost = sum(distances[(i, j)] for i, j in zip(path, path[1:]))
+            if best is None or cost < best:
+                best = cost
+    return best
+
+
+def test_closure_positions_and_arcs():
+    # 1 is the start, 2 -> 3 -> 4, 5 is free; 9 is not in the route
+    presolve = RoutePresolve([1, 2, 3, 4, 5], 1, make_graph([(2, 3), (3, 4), (4, 9)]))
+    assert presolve.is_feasible()
+    assert presolve.earliest == [0, 1, 2, 3, 1]
+    assert presolve.latest == [0, 2, 3, 4, 4]
+    assert presolve.fixed == {1: 0}
+    assert not presolve.arc_possible(3, 2)  # 2 has to come first
+    assert not presolve.arc_possible(2, 4)  # 3 has to come between
+    assert not presolve.arc_possible(5, 1)  # nothing goes back to the start
+    assert not presolve.arc_possible(1, 4)  # 4 is at position 3 at the earliest
+    assert presolve.arc_possible(2, 3) and presolve.arc_possible(2, 5)
+    assert len(presolve.possible_arcs()) < 5 * 4
+
+
+def test_precedence_before_start_is_infeasible():
+    assert not RoutePresolve([1, 2, 3], 1, make_graph([(2, 1)])).is_feasible()
+
+
+def test_dp_matches_brute_force():
+    rng = random.Random(7)
+    for _ in range(40):
+        n = rng.randint(2, 7)
+        route = rng.sample(range(100), n)
+        distances = {(i, j): rng.uniform(1, 100) for i in route for j in route if i != j}
+        edges = []
+        for _ in range(rng.randint(0, n)):
+            a, b = rng.sample(route[1:], 2) if n > 2 else (route[1], route[1])
+            if a != b and make_graph(edges).add_edge(a, b) is None:
+                edges.append((a, b))
+        path, cost = shortest_ordered_path(RoutePresolve(route, route[0], make_graph(edges)), distances)
+        assert sorted(path) == sorted(route) and path[0] == route[0]
+        assert cost == pytest.approx(sum(distances[(i, j)] for i, j in zip(path, path[1:])))
+        assert cost == pytest.approx(brute_force(route, route[0], edges, distances))
+
+
+def test_dp_state_cap():
+    route = list(range(12))
+    distances = {(i, j): 1.0 for i in route for j in route if i != j}
+    free = RoutePresolve(route, 0, PrecedenceGraph())
+    assert shortest_ordered_path(free, distances, max_states=1000) is None
+    # a full chain leaves a single order
+    chain = RoutePresolve(route, 0, make_graph(list(zip(route[1:], route[2:]))))
+    assert shortest_ordered_path(chain, distances, max_states=1000) == (route, 11.0)
+
+
+def test_solve_route_fast_path_needs_no_solver():
+    pytest.importorskip("langgraph")
+    from tools import solve_route
+    from utils.location import Attraction, LocationDistanceMatrix
+
+    dm = LocationDistanceMatrix(
+        Attraction.load_list_from_json("cached_attractions.json"), filename="cached_distances.json"
+    )
+    route = [578, 497, 881]
+    precedences = [Precedence(visit_location_before=881, visit_location_after=497)]
+    result = solve_route(route, "call", 578, {"configurable": {"matrix": dm}}, precedences)
+    assert result["ordered_route"] == [578, 881, 497]
+    assert result["positions"] == {578: 0, 881: 1, 497: 2}
+    expected = dm.get_distance_between_ids(578, 881) + dm.get_distance_between_ids(881, 497)
+    assert result["total_distance"] == pytest.approx(expected)
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import time
+from utils.profiler import ProfileInfo, ProfileStore, SamplingProfiler
+
+
+def busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampling_profiler_catches_hot_function():
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    busy_loop(0.1)
+    profiler.stop()
+
+    assert sum(profiler.samples.values()) > 0
+    assert "busy_loop" in profiler.collapsed()
+    speedscope = profiler.speedscope("test")
+    names = [frame["name"] for frame in speedscope["shared"]["frames"]]
+    assert "busy_loop" in names
+    profile = speedscope["profiles"][0]
+    assert len(profile["samples"]) == len(profile["weights"])
+
+
+def test_work_in_worker_threads_is_sampled():
+    async def request():
+        await asyncio.to_thread(busy_loop, 0.1)
+
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    asyncio.run(request())
+    profiler.stop()
+
+    stacks = [stack for stack in profiler.samples if any(name == "busy_loop" for name, _, _ in stack)]
+    assert stacks
+    # under the root frame of the worker thread, not the one that awaited it
+    assert all(stack[0][0].startswith("thread asyncio_") for stack in stacks)
+    assert "thread MainThread" in profiler.collapsed()
+
+
+def test_profile_store_is_bounded(tmp_path):
+    store = ProfileStore(max_profiles=2, directory=str(tmp_path))
+    for i in range(3):
+        profiler = SamplingProfiler(thread_id=threading.get_ident())
+        info = ProfileInfo(request_id=str(i), method="GET", path="/", duration_ms=1, samples=0, interval_ms=5)
+        store.add(info, profiler)
+
+    assert [info.request_id for info in store.list()] == ["2", "1"]
+    assert store.get("0") is None
+    assert (tmp_path / "0.speedscope.json").exists()
@@ -0,0 +1,57 @@
+import pytest
+from shapely import wkb
+from shapely.geometry import Point
+from utils.location import Attraction, LocationDistanceMatrix
+from utils.charging_station import ChargingStation, ChargingStationIndex
+from utils.geo import estimated_road_distance_m, haversine_m
+from utils.reachability import compute_reachability
+
+
+@pytest.fixture(scope="module")
+def dm():
+    attractions = Attraction.load_list_from_json("cached_attractions.json")
+    return LocationDistanceMatrix(attractions, filename="cached_distances.json")
+
+
+def make_station(id, lat, lon):
+    return ChargingStation(
+        id=id, operator_id="OP", operator_name="Operator", lat=lat, lon=lon,
+        location=wkb.dumps(Point(lon, lat), hex=True, srid=4326)
+    )
+
+
+def test_haversine():
+    # Zurich HB - Bern HB, ~95 km as the crow flies
+    assert haversine_m(47.3779, 8.5403, 46.9490, 7.4391) == pytest.approx(95500, rel=0.01)
+    assert estimated_road_distance_m(0, 0, 0, 0) == 0
+
+
+def test_direct_attractions_match_matrix(dm):
+    result = compute_reachability(578, 120000, dm)
+    reached = {f["properties"]["id"] for f in result["features"] if f["properties"]["kind"] == "attraction"}
+    expected = {
+        loc.id for loc in dm.locations
+        if loc.id != 578 and dm.get_distance_between_ids(578, loc.id) <= 120000
+    }
+    assert reached == expected
+    assert result["features"][0]["properties"]["kind"] == "origin"
+
+
+def test_two_hop_through_charger(dm):
+    origin = dm.locations[dm.get_idx(578)]
+    far = max(dm.locations, key=lambda loc: dm.get_distance_between_ids(578, loc.id))
+    # a charger halfway between the origin and the farthest attraction
+    chargers = ChargingStationIndex([
+        make_station(1, (origin.lat + far.lat) / 2, (origin.lon + far.lon) / 2),
+        make_station(2, 0.0, 0.0),  # far away, never reachable
+    ])
+    range_left = float(chargers.distances_from(origin.lat, origin.lon)[0]) + 1000
+
+    result = compute_reachability(578, range_left, dm, chargers, full_range=500000)
+    by_kind = {}
+    for f in result["features"]:
+        by_kind.setdefault(f["properties"]["kind"], []).append(f["properties"])
+    assert [c["id"] for c in by_kind["charger"]] == [1]
+    two_hops = {a["id"]: a for a in by_kind["attraction"] if a["hops"] == 2}
+    assert far.id in two_hops
+    assert two_hops[far.id]["via_charger_id"] == 1
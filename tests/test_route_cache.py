@@ -0,0 +1,157 @@
+import asyncio
+import time
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from utils.charge_planner import RouteRequest
+from utils.backends import reset_backends
+from utils.charging_station import ChargingStation
+from utils.route_cache import COALESCED, HIT, MISS, SingleFlightCache, request_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_request_key_is_canonical():
+    a = RouteRequest(ordered_route=[578, 497], max_mileage=90000)
+    b = RouteRequest.model_validate_json('{"max_mileage": 90000.0, "ordered_route": [578, 497]}')
+    assert request_key(a) == request_key(b)
+    assert request_key(a) != request_key(RouteRequest(ordered_route=[497, 578], max_mileage=90000))
+
+
+def test_single_flight_ttl_and_versions():
+    clock = FakeClock()
+    cache = SingleFlightCache(max_entries=2, ttl=10, clock=clock)
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return {"value": value}
+
+    async def scenario():
+        # three concurrent identical requests, one computation
+        results = await asyncio.gather(*(cache.get_or_compute("a", 1, lambda: compute("a")) for _ in range(3)))
+        assert sorted(status for _, status in results) == [COALESCED, COALESCED, MISS]
+        assert all(result is results[0][0] for result, _ in results)
+        assert await cache.get_or_compute("a", 1, lambda: compute("a")) == ({"value": "a"}, HIT)
+        # a new data version, or an expired entry, is computed again
+        assert (await cache.get_or_compute("a", 2, lambda: compute("a")))[1] == MISS
+        clock.now = 11
+        assert (await cache.get_or_compute("a", 2, lambda: compute("a")))[1] == MISS
+        # at most two entries, the least recently used goes first
+        await cache.get_or_compute("b", 2, lambda: compute("b"))
+        await cache.get_or_compute("c", 2, lambda: compute("c"))
+        assert len(cache) == 2 and (await cache.get_or_compute("a", 2, lambda: compute("a")))[1] == MISS
+
+    asyncio.run(scenario())
+    assert calls == ["a", "a", "a", "b", "c", "a"]
+
+
+def test_result_is_stored_under_the_version_after_computing():
+    cache = SingleFlightCache()
+    version = [1]
+
+    async def compute():
+        version[0] += 1  # e.g. downloads a missing leg
+        return "done"
+
+    async def scenario():
+        assert await cache.get_or_compute("k", version[0], compute, lambda: version[0]) == ("done", MISS)
+        assert await cache.get_or_compute("k", version[0], compute, lambda: version[0]) == ("done", HIT)
+
+    asyncio.run(scenario())
+
+
+def test_failures_are_shared_not_cached():
+    cache = SingleFlightCache()
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("no route")
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_compute("k", 0, fail) for _ in range(2)), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        with pytest.raises(ValueError):
+            await cache.get_or_compute("k", 0, fail)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2 and len(cache) == 0
+
+
+def test_cancelled_waiter_does_not_cancel_the_computation():
+    cache = SingleFlightCache()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        first = asyncio.ensure_future(cache.get_or_compute("k", 0, compute))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get_or_compute("k", 0, compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == ("done", COALESCED)
+        assert await cache.get_or_compute("k", 0, compute) == ("done", HIT)
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # The Mapbox stand-in: the warm-up runs and adds legs while the requests are served
+    import main
+    monkeypatch.setenv("MAPBOX_BACKEND", "STANDIN")
+    monkeypatch.delenv("MAPBOX_TOKEN", raising=False)
+    # Its directions stay out of the cache files
+    monkeypatch.setattr(main, "persist_directions", False)
+    reset_backends()
+    with TestClient(app) as c:
+        yield c
+    reset_backends()
+
+
+def test_plan_route_is_cached(client, monkeypatch):
+    import main
+    calls = []
+
+    async def fake_find_by_isochrones(lat, lon, supabase):
+        calls.append((lat, lon))
+        return []
+
+    monkeypatch.setattr(ChargingStation, "afind_by_isochrones", fake_find_by_isochrones)
+    payload = {"ordered_route": [578, 497, 881], "max_mileage": 90000}
+    first = client.post("/plan-route", json=payload)
+    second = client.post("/plan-route", json={"max_mileage": 90000.0, "ordered_route": [578, 497, 881]})
+    assert first.headers["X-Cache"] == MISS and second.headers["X-Cache"] == HIT
+    assert first.json() == second.json() and len(calls) == 1
+
+    # new station data: computed again
+    monkeypatch.setattr(main, "station_data_version", main.station_data_version + 1)
+    assert client.post("/plan-route", json=payload).headers["X-Cache"] == MISS
+    assert len(calls) == 2
+
+    # a leg of another route does not invalidate it, a new leg of this route does
+    main.directions_cache.add(881, 1313, main.directions_cache.get(578, 497))
+    assert client.post("/plan-route", json=payload).headers["X-Cache"] == HIT
+    main.directions_cache.add(497, 881, main.directions_cache.get(497, 881))
+    assert client.post("/plan-route", json=payload).headers["X-Cache"] == MISS
+
+    # a leg downloaded by the request itself: the first repeat is a hit
+    deadline = time.monotonic() + 10
+    while main.warmup_progress.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    monkeypatch.delitem(main.directions_cache.directions, (881, 497))
+    other = {"ordered_route": [578, 881, 497], "max_mileage": 90000}
+    assert client.post("/plan-route", json=other).headers["X-Cache"] == MISS
+    assert main.directions_cache.get(881, 497) is not None
+    assert client.post("/plan-route", json=other).headers["X-Cache"] == HIT
@@ -0,0 +1,67 @@
+import json
+import pytest
+from utils.location import Attraction, LocationDistanceMatrix
+from utils.shared_cache import SharedDirectionsCache, get_shared_matrix_file
+
+
+def test_shared_directions_visible_across_instances(tmp_path):
+    source = tmp_path / "directions.json"
+    source.write_text(json.dumps({"1-2": {"routes": [1]}}))
+    filename = str(tmp_path / "directions.bin")
+
+    worker_a = SharedDirectionsCache(filename=filename, import_from=str(source))
+    worker_b = SharedDirectionsCache(filename=filename, import_from=str(source))
+    assert worker_a.get(1, 2) == {"routes": [1]}
+    assert worker_b.get(2, 3) is None
+
+    worker_a.add(2, 3, {"routes": [2]})
+    # worker b picks up the new leg without reloading
+    assert worker_b.get(2, 3) == {"routes": [2]}
+    assert (2, 3) in worker_b.directions
+
+
+def test_only_one_worker_leads(tmp_path):
+    filename = str(tmp_path / "directions.bin")
+    worker_a = SharedDirectionsCache(filename=filename, import_from=None)
+    worker_b = SharedDirectionsCache(filename=filename, import_from=None)
+    assert worker_a.try_lead("warmup")
+    assert not worker_b.try_lead("warmup")
+    # the leader stopped before the end (e.g. recycled): another worker takes over
+    worker_a.release_lead("warmup", finished=False)
+    assert worker_b.try_lead("warmup")
+    # once finished, nobody leads it again in this run
+    worker_b.release_lead("warmup", finished=True)
+    assert not worker_a.try_lead("warmup") and worker_a.lead_finished("warmup")
+
+
+def test_lead_is_taken_over_when_the_leader_dies(tmp_path):
+    import multiprocessing
+    filename = str(tmp_path / "directions.bin")
+    SharedDirectionsCache(filename=filename, import_from=None)
+    started, stop = multiprocessing.Event(), multiprocessing.Event()
+    leader = multiprocessing.Process(target=lead_until_killed, args=(filename, started, stop))
+    leader.start()
+    assert started.wait(10)
+    worker = SharedDirectionsCache(filename=filename, import_from=None)
+    assert not worker.try_lead("warmup")
+    leader.kill()
+    leader.join()
+    assert worker.try_lead("warmup")
+
+
+def lead_until_killed(filename, started, stop):
+    cache = SharedDirectionsCache(filename=filename, import_from=None)
+    assert cache.try_lead("warmup")
+    started.set()
+    stop.wait(30)
+
+
+def test_shared_matrix_matches_json(tmp_path):
+    attractions = Attraction.load_list_from_json("cached_attractions.json")
+    npy_filename = get_shared_matrix_file("cached_distances.json", str(tmp_path / "distances.npy"))
+    dm_json = LocationDistanceMatrix(attractions, filename="cached_distances.json")
+    dm_shared = LocationDistanceMatrix(attractions, filename=npy_filename)
+
+    ids = [a.id for a in attractions[:4]]
+    assert dm_shared.get_sub_matrix(ids) == dm_json.get_sub_matrix(ids)
+    assert dm_shared.get_distance_between_ids(578, 497) == pytest.approx(115846.5)
@@ -0,0 +1,125 @@
+import time
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from utils.backends import get_backend, register_backend, reset_backends
+from utils.charging_station import ChargingStation
+from utils.directions import Directions
+from utils.geo import haversine_m
+from utils.location import Attraction, LocationDistanceMatrix
+from utils.standins import FaultInjector, Fixtures, MapboxStandIn, StandInError, SupabaseStandIn
+
+
+@pytest.fixture(scope="module")
+def fixtures():
+    return Fixtures()
+
+
+@pytest.fixture(scope="module")
+def attractions():
+    return Attraction.load_list_from_json("cached_attractions.json")
+
+
+@pytest.fixture
+def standins(monkeypatch):
+    monkeypatch.setenv("MAPBOX_BACKEND", "STANDIN")
+    monkeypatch.setenv("SUPABASE_BACKEND", "STANDIN")
+    monkeypatch.delenv("MAPBOX_TOKEN", raising=False)
+    reset_backends()
+    yield
+    reset_backends()
+
+
+class MemoryCache:
+    def __init__(self):
+        self.directions = {}
+
+    def add(self, id_a, id_b, data):
+        self.directions[(id_a, id_b)] = data
+
+
+def test_mapbox_standin_directions_and_matrix(standins, fixtures, attractions):
+    by_id = {a.id: a for a in attractions}
+    cache = MemoryCache()
+    cached = Directions.get_from_mapbox(by_id[578], by_id[497], cache)
+    assert cached == fixtures.directions["578-497"]
+    assert cache.directions[(578, 497)] is cached
+
+    synthetic = Directions.get_from_mapbox(by_id[881], by_id[1313], cache)["routes"][0]
+    coordinates = synthetic["geometry"]["coordinates"]
+    assert coordinates[0] == [by_id[881].lon, by_id[881].lat]
+    assert coordinates[-1] == pytest.approx([by_id[1313].lon, by_id[1313].lat])
+    assert synthetic["distance"] == pytest.approx(fixtures.distances[fixtures.by_id[881], fixtures.by_id[1313]])
+
+    # The matrix comes back as cached, whatever the tiling
+    dm = LocationDistanceMatrix(attractions)
+    np.testing.assert_allclose(dm.distance_matrix_full, fixtures.distances)
+
+
+def test_supabase_standin(standins):
+    supabase = get_backend("supabase")
+    assert isinstance(supabase, SupabaseStandIn)
+    stations = ChargingStation.get_all(supabase, page_size=300)
+    assert len(stations) == len(supabase.tables["charging_stations"])
+    assert len({s.id for s in stations}) == len(stations)
+
+    station = stations[0]
+    nearest = ChargingStation.find_nearby_lat_lon(station.lat, station.lon, supabase)
+    assert len(nearest) == 5 and nearest[0].id == station.id
+    covering = ChargingStation.find_by_isochrones(station.lat, station.lon, supabase)
+    distances = [haversine_m(station.lat, station.lon, s.lat, s.lon) for s in covering]
+    assert covering[0].id == station.id and distances == sorted(distances)
+
+    assert len(Attraction.get_random(supabase, count=3)) == 3
+
+
+def test_fault_injection(standins, attractions, monkeypatch):
+    slow = FaultInjector(latency_ms="20-30", error_rate=0)
+    t = time.perf_counter()
+    slow("test")
+    assert time.perf_counter() - t >= 0.02
+
+    failing = FaultInjector(error_rate=1)
+    with pytest.raises(StandInError):
+        failing("test")
+    # An unreachable Mapbox is a 503
+    register_backend("mapbox", "FAILING", lambda: MapboxStandIn(faults=failing))
+    monkeypatch.setenv("MAPBOX_BACKEND", "FAILING")
+    with pytest.raises(HTTPException) as error:
+        Directions.get_from_mapbox(attractions[0], attractions[1], MemoryCache())
+    assert error.value.status_code == 503
+
+    supabase = SupabaseStandIn(faults=failing, chargers=10)
+    with pytest.raises(StandInError):
+        ChargingStation.find_by_isochrones(46.9, 7.4, supabase)
+
+
+def test_scripted_llm_drives_the_agent(attractions):
+    pytest.importorskip("langgraph")
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.prebuilt import create_react_agent
+    from tools import RoutingAgentState, get_available_locations_tool, route_solving_tool, route_validation_tool
+    from utils.scripted_llm import ScriptedChatModel
+
+    graph = create_react_agent(
+        ScriptedChatModel(latency_ms="0", error_rate=0),
+        [route_validation_tool, route_solving_tool, get_available_locations_tool],
+        state_schema=RoutingAgentState,
+        checkpointer=MemorySaver(),
+    )
+    dm = LocationDistanceMatrix(attractions, filename="cached_distances.json")
+    config = {"configurable": {"thread_id": "t", "matrix": dm, "eligible_locations": attractions}}
+
+    def chat(message):
+        return graph.invoke({"messages": [{"role": "user", "content": message}]}, config=config)
+
+    result = chat("Which locations are available?")
+    assert result["messages"][-2].name == "get_available_locations"
+
+    result = chat("Start at 578, visit 881 then 497")
+    assert result["messages"][-1].content == "route_validation_tool: The route is valid"
+    assert result["starting_point"] == 578 and result["locations"] == [578, 881, 497]
+    assert [(p.visit_location_before, p.visit_location_after) for p in result["precedences"]] == [(881, 497)]
+
+    result = chat("Solve the route 578 497 881, 881 before 497")
+    assert '"ordered_route": [578, 881, 497]' in result["messages"][-1].content
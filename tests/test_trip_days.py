@@ -0,0 +1,94 @@
+import itertools
+import math
+import random
+import pytest
+from fastapi.testclient import TestClient
+from main import app
+from utils.trip_days import TripDayPlanner
+
+
+class FakeMatrix:
+    def __init__(self, distances):
+        self.distances = distances
+
+    def get_distance_between_ids(self, a, b):
+        return self.distances[(a, b)]
+
+
+class FakeCache:
+    def __init__(self, durations):
+        self.durations = durations
+
+    def get(self, a, b):
+        return {"routes": [{"duration": self.durations[(a, b)]}]}
+
+
+def make_planner(n, max_mileage, seed):
+    rng = random.Random(seed)
+    route = list(range(n))
+    legs = list(zip(route[:-1], route[1:]))
+    distances = {leg: rng.uniform(20_000, 150_000) for leg in legs}
+    durations = {leg: distances[leg] / rng.uniform(15, 30) for leg in legs}
+    return TripDayPlanner(route, max_mileage, FakeMatrix(distances), FakeCache(durations))
+
+
+def brute_force(planner, max_day_seconds, charge_seconds):
+    n = len(planner.ordered_route)
+    best = None
+    for cuts in itertools.product([False, True], repeat=n - 2):
+        bounds = [0] + [k + 1 for k, cut in enumerate(cuts) if cut] + [n - 1]
+        seconds = [planner.day_seconds(i, j, charge_seconds) for i, j in zip(bounds, bounds[1:])]
+        if max(seconds) <= max_day_seconds:
+            candidate = (len(seconds), max(seconds))
+            best = candidate if best is None else min(best, candidate)
+    return best
+
+
+def test_split_is_optimal():
+    for seed in range(20):
+        planner = make_planner(9, 120_000, seed)
+        days = planner.split(6 * 3600, 1800)
+        assert days[0][0] == 0 and days[-1][1] == 8
+        assert all(a[1] == b[0] for a, b in zip(days, days[1:]))
+        seconds = [planner.day_seconds(i, j, 1800) for i, j in days]
+        assert (len(days), max(seconds)) == pytest.approx(brute_force(planner, 6 * 3600, 1800))
+
+
+def test_charging_stops_and_infeasible_leg():
+    planner = make_planner(4, 100_000, 0)
+    total = planner.cumulated_distances[-1]
+    assert planner.charging_stops_between(0, 3) == math.ceil(total / 100_000) - 1
+    with pytest.raises(ValueError):
+        planner.split(600)
+
+
+def test_30_stops_split_quickly():
+    planner = make_planner(30, 200_000, 1)
+    days = planner.split(8 * 3600, 1800)
+    assert len(days) >= 1
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as c:
+        yield c
+
+
+def test_plan_trip_days_endpoint(client):
+    payload = {"ordered_route": [578, 497, 881], "max_mileage": 200000, "max_daily_hours": 3.5, "charge_minutes": 30}
+    response = client.post("/plan-trip-days", json=payload)
+    assert response.status_code == 200
+    days = response.json()["days"]
+    # 1.4 h then 2.7 h of driving: two days, no charge needed on either
+    assert [d["ordered_route"] for d in days] == [[578, 497], [497, 881]]
+    assert all(d["charging_stops"]["features"] == [] for d in days)
+    assert len(days[1]["route"]["geometry"]["coordinates"]) == 1
+
+    payload.update(max_daily_hours=5, max_mileage=150000)
+    days = client.post("/plan-trip-days", json=payload).json()["days"]
+    # a single day, with one charging stop 150 km into the trip
+    assert len(days) == 1 and days[0]["charging_seconds"] == 1800
+    assert days[0]["charging_stops"]["features"][0]["properties"]["max_reach_location"] == 497
+
+    payload.update(max_daily_hours=1)
+    assert client.post("/plan-trip-days", json=payload).status_code == 400
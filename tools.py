@@ -1,13 +1,19 @@
-from typing import List, Optional, Annotated
-from itertools import product
+import os
+from typing import List, Literal, Optional, Annotated
 from pydantic import BaseModel, Field
+from langchain_core.messages import ToolMessage
 from langchain_core.tools import InjectedToolCallId
 from langchain_core.tools.structured import StructuredTool
+from langgraph.prebuilt import InjectedState
 from langgraph.prebuilt.chat_agent_executor import AgentState
-import pyomo.environ as pyo
+from langgraph.types import Command
+from utils.catalogue import as_catalogue
 from utils.location import Location, LocationDistanceMatrix
-from utils.precedence import Precedence, check_precedence_validity, check_unique_locations, check_starting_point_in_precedences
+from utils.precedence import Precedence, PrecedenceGraph, check_unique_locations, check_starting_point_in_precedences
+from utils.presolve import RoutePresolve, shortest_ordered_path
+from utils.local_search import parallel_local_search
 from langchain_core.runnables import RunnableConfig
+from utils.metrics import span
 
 
 class RoutingAgentState(AgentState):
@@ -16,17 +22,20 @@ class RoutingAgentState(AgentState):
         - location: the list of location ids that will be part of a route
         - precendences: the optional list of precedences
         - the id of the starting point location
+        - precedence_graph: the validated precedences with their topological order
+          (PrecedenceGraph.to_dict), replaced by every validation
     """
     locations: List[int]
     precedences: Optional[List[Precedence]]
     starting_point: int
+    precedence_graph: Optional[dict]
 
 
 class PrecedenceCycleError(Exception):
     """Raised when a precedence constraint cannot be satisfied"""
     def __init__(self, cycle: List[int]):
         self.cycle = cycle
-        message = f"Cycle detected in precedence constraints: {' → '.join(cycle)}"
+        message = f"Cycle detected in precedence constraints: {' → '.join(map(str, cycle))}"
         super().__init__(message)
 
 
@@ -34,7 +43,7 @@ class DuplicateLocationsError(Exception):
     """Raised when duplicate locations are detected in a list."""
     def __init__(self, duplicates: List[int]):
         self.duplicates = duplicates
-        message = f"Duplicate locations detected: {', '.join(duplicates)}"
+        message = f"Duplicate locations detected: {', '.join(map(str, duplicates))}"
         super().__init__(message)
 
 
@@ -62,10 +71,7 @@ def get_available_locations(config: RunnableConfig):
     # Return a list of IDs and names
     # Note: by returning here only id and name, the model has no idea of other properties (e.g. lat, lon)
     # All the other shit is buried in the configurable
-    return [
-        {"id": loc.id, 
-         "name": getattr(loc, 'name', loc.id)} for loc in locations
-        ]
+    return as_catalogue(locations).id_names()
 
 
 get_available_locations_tool = StructuredTool.from_function(
@@ -77,11 +83,25 @@ get_available_locations_tool = StructuredTool.from_function(
     """
 )
 
+def get_precedence_graph(state: Optional[dict], precedences: List[Precedence]) -> PrecedenceGraph:
+    """
+    A new graph from the one saved in the agent state, updated to `precedences`: only the
+    precedences added or removed since the last validation are applied, the topological order
+    is not recomputed. The state is never modified, only validate_route's update replaces it.
+    """
+    graph = PrecedenceGraph.from_dict((state or {}).get("precedence_graph"))
+    cycle = graph.sync(precedences)
+    if cycle is not None:
+        raise PrecedenceCycleError(cycle)
+    return graph
+
+
 def validate_route(
         locations: List[int],
         tool_call_id: Annotated[str, InjectedToolCallId],
         starting_point: int,
-        precedences: Optional[List[Precedence]] = None):
+        precedences: Optional[List[Precedence]] = None,
+        state: Annotated[Optional[dict], InjectedState] = None):
     """
     Validates that a route is correct.
     This function only uses ids as it only looks at the sequence of ids in the route,
@@ -119,16 +139,16 @@ def validate_route(
         is_valid, wrong_precedence = check_starting_point_in_precedences(precedences, starting_point)
         if not(is_valid):
             raise IncorrectStartingPointInPrecedence(wrong_precedence)
-        is_valid, cycle = check_precedence_validity(precedences)
-        if not(is_valid):
-            raise PrecedenceCycleError(cycle)
+    graph = get_precedence_graph(state, precedences)
 
     # Return Command with ToolMessage first
-    return {
+    return Command(update={
         "locations": locations,
         "precedences": precedences,
-        "starting_point": starting_point
-        },
+        "starting_point": starting_point,
+        "precedence_graph": graph.to_dict(),
+        "messages": [ToolMessage("The route is valid", tool_call_id=tool_call_id)]
+        })
 
 
 route_validation_tool = StructuredTool.from_function(
@@ -141,14 +161,39 @@ route_validation_tool = StructuredTool.from_function(
 )
 
 
+# Default trade-off of the "weighted" objective: one second of driving is worth 25 metres (90 km/h)
+DEFAULT_DURATION_WEIGHT = 25.0
+# method="auto" solves routes with more locations than this heuristically
+# (when the precedences leave too many orders for the exact DP)
+EXACT_MAX_LOCATIONS = int(os.environ.get("SOLVER_EXACT_MAX_LOCATIONS", "15"))
+
+
+def get_tour_totals(distance_matrix: LocationDistanceMatrix, tour: List[int]) -> dict:
+    legs = list(zip(tour[:-1], tour[1:]))
+    return {
+        "total_distance": sum(distance_matrix.get_distance_between_ids(a, b) for a, b in legs),
+        "total_duration": sum(distance_matrix.get_duration_between_ids(a, b) for a, b in legs),
+    }
+
+
 def solve_route(
     route_locations: List[int],
     tool_call_id: Annotated[str, InjectedToolCallId],
     starting_point: int,
     config: RunnableConfig,
-    precedences: Optional[List[Precedence]] = None
+    precedences: Optional[List[Precedence]] = None,
+    objective: Literal["distance", "duration", "weighted"] = "distance",
+    duration_weight: float = DEFAULT_DURATION_WEIGHT,
+    method: Literal["exact", "heuristic", "auto"] = "auto",
+    state: Annotated[Optional[dict], InjectedState] = None
 ):
-    """Solve a TSP for the given locations and optional precedence constraints."""
+    """
+    Solve a TSP for the given locations and optional precedence constraints.
+    The objective minimizes the distance (default), the driving time ("duration"),
+    or "weighted": metres + duration_weight * seconds.
+    The method is "exact" (optimal), "heuristic" (parallel local search within a time budget,
+    the result has a `gap` estimate) or "auto": exact unless the route is large.
+    """
     N = len(route_locations)
     if N < 2:
         raise ValueError("Need at least 2 locations to solve a TSP.")
@@ -160,42 +205,98 @@ def solve_route(
     distance_matrix = config.get("configurable", {}).get("matrix")
     if not distance_matrix:
         return "Error: Distance Matrix was not provided in the configuration."
-    dm = distance_matrix.get_distance_matrix_as_dict(route_locations)
-
-    # Create Pyomo model
-    model = pyo.ConcreteModel()
-    model.L = pyo.Set(initialize=route_locations)
-    model.x = pyo.Var(model.L, model.L, domain=pyo.Binary)
-
-    # Objective: minimize total travel distance
-    model.obj = pyo.Objective(
-        expr=sum(dm[i,j]*model.x[i,j] for i,j in product(model.L, model.L) if i!=j),
-        sense=pyo.minimize
-    )
-
-    # Each location has exactly one incoming edge
-    model.arrive_once = pyo.Constraint(
-        [j for j in route_locations if j != starting_point],
-        rule=lambda m,j: sum(m.x[i,j] for i in m.L if i != j) == 1
+    dm = distance_matrix.get_cost_matrix_as_dict(route_locations, objective, duration_weight)
+    # Reuses the graph validated in the agent state, a cycle fails before building the model
+    graph = get_precedence_graph(state, precedences or [])
+    with span("solve_route_presolve"):
+        presolve = RoutePresolve(route_locations, starting_point, graph)
+        if not presolve.is_feasible():
+            raise ValueError(f"A precedence puts a location before the starting point {starting_point}.")
+        # Few orders left (e.g. heavily constrained requests): solved exactly, without the MILP
+        shortest = shortest_ordered_path(presolve, dm) if method != "heuristic" else None
+    if shortest is not None:
+        tour, total_cost = shortest
+        return {
+            "locations": route_locations,
+            "precedences": [p.dict() for p in precedences] if precedences else [],
+            "ordered_route": tour,
+            **get_tour_totals(distance_matrix, tour),
+            "objective": objective,
+            "total_cost": total_cost,
+            "positions": {loc: k for k, loc in enumerate(tour)} if precedences else None,
+            "method": "exact",
+            "gap": 0.0
+        }
+
+    if method == "heuristic" or (method == "auto" and N > EXACT_MAX_LOCATIONS):
+        with span("solve_route_local_search"):
+            heuristic = parallel_local_search(presolve, dm)
+        tour = heuristic.tour
+        return {
+            "locations": route_locations,
+            "precedences": [p.dict() for p in precedences] if precedences else [],
+            "ordered_route": tour,
+            **get_tour_totals(distance_matrix, tour),
+            "objective": objective,
+            "total_cost": heuristic.cost,
+            "positions": {loc: k for k, loc in enumerate(tour)} if precedences else None,
+            "method": "heuristic",
+            "gap": heuristic.gap
+        }
+
+    # Pyomo is slow to import, only pay for it when a solve actually happens
+    import pyomo.environ as pyo
+    with span("solve_route_build"):
+        # Create Pyomo model, only with the arcs the precedences allow
+        arcs = presolve.possible_arcs()
+        model = pyo.ConcreteModel()
+        model.L = pyo.Set(initialize=route_locations)
+        model.A = pyo.Set(initialize=arcs, dimen=2)
+        model.x = pyo.Var(model.A, domain=pyo.Binary)
+        incoming = {j: [] for j in route_locations}
+        outgoing = {i: [] for i in route_locations}
+        for i, j in arcs:
+            incoming[j].append(i)
+            outgoing[i].append(j)
+
+        # Objective: minimize total travel distance (or time, see `objective`)
+        model.obj = pyo.Objective(
+            expr=sum(dm[i,j]*model.x[i,j] for i,j in arcs),
+            sense=pyo.minimize
         )
 
-    # Position variables for precedence only
-    if precedences:
-        model.u = pyo.Var(model.L, domain=pyo.NonNegativeIntegers, bounds=(0, N-1))
+        # Each location has exactly one incoming edge
+        model.arrive_once = pyo.Constraint(
+            [j for j in route_locations if j != starting_point],
+            rule=lambda m,j: sum(m.x[i,j] for i in incoming[j]) == 1
+            )
+        # ... and at most one outgoing edge (the last one has none)
+        model.leave_once = pyo.Constraint(
+            [i for i in route_locations if outgoing[i]],
+            rule=lambda m,i: sum(m.x[i,j] for j in outgoing[i]) <= 1
+            )
+
+        # Position of every location, within the positions the precedences allow. Linked to
+        # the edges (MTZ), they also rule out subtours: the edges form a single path
+        model.u = pyo.Var(
+            model.L, domain=pyo.NonNegativeIntegers,
+            bounds=lambda m, i: (presolve.earliest[presolve.index[i]], presolve.latest[presolve.index[i]])
+        )
         model.pos_link = pyo.ConstraintList()
         model.u[starting_point].fix(0)
-        # Link position to edges
-        for i in route_locations:
-            for j in route_locations:
-                if i != j:
-                    model.pos_link.add(model.u[j] >= model.u[i] + 1 - 100 * (1 - model.x[i,j]))
-        
+        for i, position in presolve.fixed.items():
+            model.u[i].fix(position)
+        # Positions are below N so N is a big enough M
+        for i, j in arcs:
+            model.pos_link.add(model.u[j] >= model.u[i] + 1 - N * (1 - model.x[i,j]))
+
         # Precedence constraints
-        model.prec = pyo.ConstraintList()
-        for p in precedences:
-            a, b = p.visit_location_before, p.visit_location_after
-            if a in route_locations and b in route_locations:
-                model.prec.add(model.u[a] + 1 <= model.u[b])
+        if precedences:
+            model.prec = pyo.ConstraintList()
+            for p in precedences:
+                a, b = p.visit_location_before, p.visit_location_after
+                if a in route_locations and b in route_locations:
+                    model.prec.add(model.u[a] + 1 <= model.u[b])
 
     # Solver
     if pyo.SolverFactory("glpk").available(exception_flag=False):
@@ -205,7 +306,8 @@ def solve_route(
     else:
         raise RuntimeError("No solver found. Please install GLPK or CBC.")
 
-    result = solver.solve(model, tee=False)
+    with span("solve_route_solve"):
+        result = solver.solve(model, tee=False)
         
     if (result.solver.status != pyo.SolverStatus.ok or
         result.solver.termination_condition != pyo.TerminationCondition.optimal):
@@ -214,27 +316,26 @@ def solve_route(
             f"termination={result.solver.termination_condition}"
         )
     # Build edges from the solver solution
-    edges = [(i, j) for i, j in product(route_locations, route_locations) if i != j and pyo.value(model.x[i, j]) > 0.5]
+    edges = [(i, j) for i, j in arcs if pyo.value(model.x[i, j]) > 0.5]
 
-    # Build next_stop mapping
+    # Follow the edges from the starting point: a single path through every location
     next_stop = {i: j for i, j in edges}
     tour = [starting_point]
-    visited = {starting_point}
-    while len(tour) < len(route_locations):
-        current = tour[-1]
-        next_node = next_stop.get(current)
-        remaining = set(route_locations) - visited
-        if not next_node or next_node in visited:
-            next_node = remaining.pop()
-        tour.append(next_node)
-        visited.add(next_node)
+    while tour[-1] in next_stop and len(tour) <= N:
+        tour.append(next_stop[tour[-1]])
+    if len(tour) != N or set(tour) != set(route_locations):
+        raise RuntimeError(f"Solver returned edges that are not a single route: {edges}")
 
     return {
         "locations": route_locations,
         "precedences": [p.dict() for p in precedences] if precedences else [],
         "ordered_route": tour,
-        "total_distance": pyo.value(model.obj),
-        "positions": {i: pyo.value(model.u[i]) for i in model.L} if precedences else None
+        **get_tour_totals(distance_matrix, tour),
+        "objective": objective,
+        "total_cost": sum(dm[i, j] for i, j in zip(tour[:-1], tour[1:])),
+        "positions": {loc: k for k, loc in enumerate(tour)} if precedences else None,
+        "method": "exact",
+        "gap": 0.0
     }
 
 
@@ -244,6 +345,8 @@ route_solving_tool = StructuredTool.from_function(
     name="route_solving_tool",
     description="""
         Run only if explicitly instructed by the user.
-        Returns the optimal route and total distance, given a valid route
+        Returns the optimal route and total distance, given a valid route.
+        Use objective="duration" when the user wants the fastest route rather than the shortest.
+        Keep method="auto": it switches to a time-bounded heuristic for large routes
     """
 )
\ No newline at end of file
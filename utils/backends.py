@@ -0,0 +1,142 @@
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncContextManager, Callable, Dict
+
+# The external services, and the backend used when <SERVICE>_BACKEND is not set
+DEFAULT_BACKENDS = {"mapbox": "LIVE", "supabase": "LIVE", "llm": "OPENAI"}
+
+# service -> backend name -> factory
+_factories: Dict[str, Dict[str, Callable[[], object]]] = {service: {} for service in DEFAULT_BACKENDS}
+_instances: Dict[str, object] = {}
+_lock = threading.Lock()
+# service -> backend name -> async client factory, as an async context manager
+_async_factories: Dict[str, Dict[str, Callable[[], AsyncContextManager]]] = {"supabase": {}}
+# Connections of the async Supabase client
+SUPABASE_POOL_SIZE = int(os.environ.get("SUPABASE_POOL_SIZE", "20"))
+
+
+def register_backend(service: str, name: str, factory: Callable[[], object]):
+    """
+    Makes a backend available as <SERVICE>_BACKEND=<name>.
+    The factory is called once, on first use. A mapbox backend answers
+    `get(url, params=..., timeout=...)` like `requests`, a supabase backend
+    is used like a supabase Client, an llm backend is a LangChain chat model.
+    """
+    _factories[service][name.upper()] = factory
+    _instances.pop(service, None)
+
+
+def backend_name(service: str) -> str:
+    return os.environ.get(f"{service.upper()}_BACKEND", DEFAULT_BACKENDS[service]).upper()
+
+
+def get_backend(service: str):
+    """The backend of a service, created on first use."""
+    with _lock:
+        if service not in _instances:
+            name = backend_name(service)
+            if name not in _factories[service]:
+                known = ", ".join(sorted(_factories[service]))
+                raise ValueError(f"Unknown {service} backend {name}, use one of {known}")
+            _instances[service] = _factories[service][name]()
+        return _instances[service]
+
+
+def register_async_backend(service: str, name: str, factory: Callable[[], AsyncContextManager]):
+    """Like register_backend, for the async client of a service (selected by the same variable)."""
+    _async_factories[service][name.upper()] = factory
+
+
+def open_async_backend(service: str) -> AsyncContextManager:
+    """
+    A new async client of a service, closed on exit. Its connection pool belongs to
+    the running event loop, so the caller owns it (the app: from startup to shutdown).
+    """
+    name = backend_name(service)
+    if name not in _async_factories[service]:
+        known = ", ".join(sorted(_async_factories[service]))
+        raise ValueError(f"Unknown async {service} backend {name}, use one of {known}")
+    return _async_factories[service][name]()
+
+
+def reset_backends():
+    """Forgets the created backends, the next use picks them again from the environment."""
+    with _lock:
+        _instances.clear()
+
+
+def get_mapbox_token() -> str:
+    """The Mapbox token; stand-ins do not need one."""
+    token = os.getenv("MAPBOX_TOKEN")
+    if not token and backend_name("mapbox") != "LIVE":
+        return "stand-in"
+    if not token:
+        raise ValueError("MAPBOX_TOKEN not found in .env file.")
+    return token
+
+
+def _live_mapbox():
+    import requests
+    return requests
+
+
+def _live_supabase():
+    from supabase import create_client
+    return create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+
+
+@asynccontextmanager
+async def _live_async_supabase():
+    import httpx
+    from supabase import AsyncClientOptions, acreate_client
+    limits = httpx.Limits(max_connections=SUPABASE_POOL_SIZE, max_keepalive_connections=SUPABASE_POOL_SIZE)
+    async with httpx.AsyncClient(limits=limits, timeout=10, follow_redirects=True) as http_client:
+        yield await acreate_client(
+            os.environ.get("SUPABASE_URL"),
+            os.environ.get("SUPABASE_KEY"),
+            options=AsyncClientOptions(httpx_client=http_client)
+        )
+
+
+def _openai():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4.1", temperature=0)
+
+
+def _mapbox_standin():
+    from utils.standins import MapboxStandIn
+    return MapboxStandIn()
+
+
+def _osm_mapbox():
+    from utils.osm_routing import OsmMapbox
+    return OsmMapbox()
+
+
+def _supabase_standin():
+    from utils.standins import SupabaseStandIn
+    return SupabaseStandIn()
+
+
+@asynccontextmanager
+async def _async_supabase_standin():
+    from utils.standins import AsyncSupabaseStandIn
+    # Same tables as the sync stand-in
+    yield AsyncSupabaseStandIn(get_backend("supabase"))
+
+
+def _scripted_llm():
+    from utils.scripted_llm import ScriptedChatModel
+    return ScriptedChatModel()
+
+
+register_backend("mapbox", "LIVE", _live_mapbox)
+register_backend("mapbox", "STANDIN", _mapbox_standin)
+register_backend("mapbox", "OSM", _osm_mapbox)
+register_backend("supabase", "LIVE", _live_supabase)
+register_backend("supabase", "STANDIN", _supabase_standin)
+register_async_backend("supabase", "LIVE", _live_async_supabase)
+register_async_backend("supabase", "STANDIN", _async_supabase_standin)
+register_backend("llm", "OPENAI", _openai)
+register_backend("llm", "FAKE", _scripted_llm)
@@ -0,0 +1,198 @@
+import json
+import sys
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+import numpy as np
+from utils.geo import haversine_m
+from utils.location import Attraction, Location
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+# min lat, min lon, max lat, max lon, as in Location.is_in_swiss_bbox
+SWISS_BBOX = (45.817, 5.955, 47.808, 10.492)
+# Attraction fields kept out of the columns, read on first use
+TEXT_FIELDS = ("myswitzerland_id", "photo", "abstract", "url")
+
+
+class _TextFields:
+    """The text fields by id, loaded once on first use and shared by the sub-catalogues."""
+    def __init__(self, load: Callable[[], Dict[int, Dict[str, Any]]]):
+        self._load = load
+        self._fields: Optional[Dict[int, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def get(self, location_id: int) -> Dict[str, Any]:
+        with self._lock:
+            if self._fields is None:
+                self._fields = self._load()
+            return self._fields.get(location_id, {})
+
+
+def _text_of(rows: Iterable[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    return {row["id"]: {k: row[k] for k in TEXT_FIELDS if row.get(k) is not None} for row in rows}
+
+
+def _text_from_json(filename: str) -> Callable[[], Dict[int, Dict[str, Any]]]:
+    def load():
+        with open(filename, "r", encoding="utf-8") as f:
+            return _text_of(json.load(f))
+    return load
+
+
+class LocationCatalogue:
+    """
+    The attractions as columns: ids, latitudes and longitudes in numpy arrays and interned
+    names. The text fields (TEXT_FIELDS) stay out of memory until an Attraction is asked for.
+    Indexing and iterating give Location views (id, lat, lon, name), so a catalogue can be
+    used where a list of locations is expected; the filters are vectorized over all the rows
+    and return sub-catalogues.
+    """
+    def __init__(self,
+                 ids: Sequence[int],
+                 lats: Sequence[float],
+                 lons: Sequence[float],
+                 names: Sequence[str],
+                 text: Optional[_TextFields] = None):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.names: List[str] = [sys.intern(name) for name in names]
+        if not (len(self.ids) == len(self.lats) == len(self.lons) == len(self.names)):
+            raise ValueError("Catalogue columns must have the same length")
+        if np.any(np.abs(self.lats) > 90) or np.any(np.abs(self.lons) > 180):
+            raise ValueError("Latitude must be between -90 and 90, longitude between -180 and 180")
+        self._text = text or _TextFields(dict)
+        # Sorted ids, to find rows by id with a binary search
+        self._order = np.argsort(self.ids, kind="stable")
+        self._sorted_ids = self.ids[self._order]
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "LocationCatalogue":
+        """Rows with the Attraction fields (Supabase, JSON); their text fields are kept as they are already loaded."""
+        text = _text_of(rows)
+        return cls(
+            [row["id"] for row in rows],
+            [row["lat"] for row in rows],
+            [row["lon"] for row in rows],
+            [row["name"] for row in rows],
+            _TextFields(lambda: text)
+        )
+
+    @classmethod
+    def from_json(cls, filename: str = "locations.json") -> "LocationCatalogue":
+        """A file written by Attraction.save_list_to_json; the text fields are read again from it when needed."""
+        with open(filename, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        return cls(
+            [row["id"] for row in rows],
+            [row["lat"] for row in rows],
+            [row["lon"] for row in rows],
+            [row["name"] for row in rows],
+            _TextFields(_text_from_json(filename))
+        )
+
+    @classmethod
+    def from_locations(cls, locations: Sequence[Location]) -> "LocationCatalogue":
+        return cls(
+            [loc.id for loc in locations],
+            [loc.lat for loc in locations],
+            [loc.lon for loc in locations],
+            [loc.name for loc in locations],
+            _TextFields(lambda: _text_of(
+                {"id": loc.id, **{k: getattr(loc, k, None) for k in TEXT_FIELDS}} for loc in locations
+            ))
+        )
+
+    @classmethod
+    def get_random(cls, supabase: "Client", count: int = 10) -> "LocationCatalogue":
+        """Random attractions from Supabase, like Attraction.get_random."""
+        response = supabase.rpc("get_random_attractions", {"limit_count": count}).execute()
+        return cls.from_rows(response.data)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[Location]:
+        for row in range(len(self.ids)):
+            yield self._view(row)
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[Location, "LocationCatalogue"]:
+        if isinstance(key, slice):
+            return self.select(np.arange(len(self.ids))[key])
+        row = key + len(self.ids) if key < 0 else key
+        if not 0 <= row < len(self.ids):
+            raise IndexError("catalogue index out of range")
+        return self._view(row)
+
+    def __contains__(self, location_id: int) -> bool:
+        return self.row_of(location_id) >= 0
+
+    def _view(self, row: int) -> Location:
+        return Location.model_construct(
+            id=int(self.ids[row]), lat=float(self.lats[row]), lon=float(self.lons[row]), name=self.names[row]
+        )
+
+    def rows_of(self, location_ids: Sequence[int]) -> np.ndarray:
+        """The rows of the ids, -1 for the unknown ones."""
+        location_ids = np.asarray(location_ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.full(location_ids.shape, -1, dtype=np.int64)
+        k = np.minimum(np.searchsorted(self._sorted_ids, location_ids), len(self.ids) - 1)
+        return np.where(self._sorted_ids[k] == location_ids, self._order[k], -1)
+
+    def row_of(self, location_id: int) -> int:
+        return int(self.rows_of([location_id])[0])
+
+    def get(self, location_id: int) -> Optional[Location]:
+        row = self.row_of(location_id)
+        return self._view(row) if row >= 0 else None
+
+    def attraction(self, location_id: int) -> Optional[Attraction]:
+        """The full Attraction, with its text fields (loaded on the first call)."""
+        row = self.row_of(location_id)
+        if row < 0:
+            return None
+        return Attraction.model_construct(
+            id=location_id, lat=float(self.lats[row]), lon=float(self.lons[row]), name=self.names[row],
+            **self._text.get(location_id)
+        )
+
+    def select(self, rows: Union[np.ndarray, Sequence[int]]) -> "LocationCatalogue":
+        """The sub-catalogue of some rows (indices, or a boolean mask over all the rows)."""
+        rows = np.asarray(rows)
+        rows = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(np.int64)
+        names = self.names
+        return LocationCatalogue(
+            self.ids[rows], self.lats[rows], self.lons[rows], [names[k] for k in rows.tolist()], self._text
+        )
+
+    def within_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> "LocationCatalogue":
+        return self.select(
+            (self.lats >= min_lat) & (self.lats <= max_lat) & (self.lons >= min_lon) & (self.lons <= max_lon)
+        )
+
+    def in_swiss_bbox(self) -> "LocationCatalogue":
+        """Location.is_in_swiss_bbox, over all the rows."""
+        return self.within_bbox(*SWISS_BBOX)
+
+    def within_radius(self, lat: float, lon: float, radius_m: float) -> "LocationCatalogue":
+        """The locations at most radius_m metres (great-circle distance) from a point."""
+        return self.select(haversine_m(lat, lon, self.lats, self.lons) <= radius_m)
+
+    def records(self) -> Dict[int, Dict[str, Any]]:
+        """The Location fields of every row, by id, as plain values ready for JSON."""
+        return {
+            i: {"id": i, "lat": lat, "lon": lon, "name": name}
+            for i, lat, lon, name in zip(self.ids.tolist(), self.lats.tolist(), self.lons.tolist(), self.names)
+        }
+
+    def id_names(self) -> List[Dict[str, Any]]:
+        return [{"id": i, "name": name} for i, name in zip(self.ids.tolist(), self.names)]
+
+
+def as_catalogue(locations: Union[LocationCatalogue, Sequence[Location]]) -> LocationCatalogue:
+    """A catalogue as it is, or a list of locations as a catalogue."""
+    if isinstance(locations, LocationCatalogue):
+        return locations
+    return LocationCatalogue.from_locations(locations)
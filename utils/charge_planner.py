@@ -1,6 +1,10 @@
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
+from itertools import accumulate
+import numpy as np
+import shapely
 from utils.location import LocationDistanceMatrix
 from utils.local_directions_cache import LocalDirectionsCache
+from utils.metrics import timed
 from shapely.geometry import LineString
 from pydantic import BaseModel, Field
 
@@ -12,12 +16,17 @@ class RouteRequest(BaseModel):
 	ordered_route: List[int] = Field(..., example=[101, 102, 103], min_items=2)
 	max_mileage: float = Field(..., gt=0, example=250.0)
 
+class BatchRouteRequest(BaseModel):
+	# Several routes (or the same route with several ranges) evaluated in one call
+	requests: List[RouteRequest] = Field(..., min_length=1)
+
 class CoordsMaxMileageReach(BaseModel):
     lat: Optional[float] = Field(default=None, description="Latitude")
     lon: Optional[float] = Field(default=None, description="Longitude")
     reached_endpoint: bool
     remaining_mileage_from_last_location_reached: float
     max_reach_location: int
+    next_location: Optional[int] = Field(default=None, description="End of the leg where the charge runs out")
 
 class ChargePlanner():
 	def __init__(
@@ -34,77 +43,98 @@ class ChargePlanner():
 		self.max_mileage = max_mileage
 		self.distances = distances
 		self.directions_cache = directions_cache
-   
+		# Prefix sums of the leg distances: cumulated_distances[k] is the distance
+		# covered from the start point until ordered_route[k]
+		self.cumulated_distances: List[float] = self._get_cumulated_distances()
+		# LineStrings of the legs, built once and shared by all the mileages
+		self._leg_lines: Dict[int, Tuple[LineString, float]] = {}
+
+	@timed("charge_planner_prefix_sums")
+	def _get_cumulated_distances(self) -> List[float]:
+		legs = [
+			self.distances.get_distance_between_ids(self.ordered_route[i], self.ordered_route[i + 1])
+			for i in range(len(self.ordered_route) - 1)
+		]
+		return [0] + list(accumulate(legs))
+
 	def get_cumulated_distance_until_location(self, location:int):
 		location_idx = self.ordered_route.index(location)
-		if location_idx == 0:
-			return 0
-		else:
-			distance_covered = 0
-			for i in range(location_idx):
-				j = i + 1
-				distance_between_locations = self.distances.get_distance_between_ids(
-            		self.ordered_route[i],
-            		self.ordered_route[j]
-            	)
-				distance_covered += distance_between_locations
-			return distance_covered
+		return self.cumulated_distances[location_idx]
 
+	@timed("charge_planner_last_location")
 	def find_last_location_before_tank(self) -> int:
 		"""
 		Find the last location before fuel runs out.
 		Returns the id [int].
 		"""
-		i = 1
-		distance_travelled = 0
-		while i < len(self.ordered_route):
-			start_id = self.ordered_route[i-1]
-			end_id = self.ordered_route[i]
-			distance = self.distances.get_distance_between_ids(start_id, end_id)
-			distance_travelled += distance
-			if (distance_travelled <= self.max_mileage):
-				i += 1
-			else:
-				break
-		return self.ordered_route[i-1]
+		idx = self.find_max_reach_indices([self.max_mileage])[0]
+		return self.ordered_route[idx]
 
-	def find_coords_of_max_mileage_reach(self) -> CoordsMaxMileageReach:
-		# find the last location you can reach with the charge
-		max_reach_location = self.find_last_location_before_tank()
-		max_reach_location_idx = self.ordered_route.index(max_reach_location)
-		
-		if max_reach_location_idx == len(self.ordered_route) - 1:
-			cumulated_distance = self.get_cumulated_distance_until_location(max_reach_location)
-			return CoordsMaxMileageReach(
-				reached_endpoint=True,
-				remaining_mileage_from_last_location_reached=self.max_mileage-cumulated_distance,
-				max_reach_location=max_reach_location
-			)
-		else:
-			# calculate much distance has been covered from the start point to the last location
-			distance_covered_until_last_location_reached = self.get_cumulated_distance_until_location(max_reach_location)
-			# calculate how much mileage is left since the last location
-			remaining_mileage = self.max_mileage - distance_covered_until_last_location_reached
-			# check if the current direction tuple (max reach, and the following) is cached
-			next_location_on_route_idx = max_reach_location_idx + 1
-			next_location = self.ordered_route[next_location_on_route_idx]
-			d = self.directions_cache.get(max_reach_location, next_location)
+	def find_max_reach_indices(self, mileages: Sequence[float]) -> np.ndarray:
+		"""
+		Vectorized max reach: for every mileage, the index (in ordered_route)
+		of the last location that can be reached without charging.
+		"""
+		cumulated = np.asarray(self.cumulated_distances, dtype=float)
+		idx = np.searchsorted(cumulated, np.asarray(mileages, dtype=float), side="right") - 1
+		# a negative mileage never leaves the start point
+		return np.clip(idx, 0, len(self.ordered_route) - 1)
+
+	def _get_leg_line(self, leg_idx: int) -> Tuple[LineString, float]:
+		if leg_idx not in self._leg_lines:
+			start = self.ordered_route[leg_idx]
+			end = self.ordered_route[leg_idx + 1]
+			d = self.directions_cache.get(start, end)
 			if d is None:
-				raise ValueError(f"{max_reach_location},{next_location} not in cache")
+				raise ValueError(f"{start},{end} not in cache")
 			geojson_geometry = d["routes"][0]["geometry"]
-			line = LineString(geojson_geometry['coordinates'])
-			distance_between_locations = d["routes"][0]["distance"]
-			ratio = remaining_mileage / distance_between_locations
-			point = line.interpolate(ratio, normalized=True)
-			return CoordsMaxMileageReach(
-				lat=point.y,
-				lon=point.x,
-				reached_endpoint=False,
-				remaining_mileage_from_last_location_reached=remaining_mileage,
-				max_reach_location=max_reach_location
-			)  
+			self._leg_lines[leg_idx] = (
+				LineString(geojson_geometry['coordinates']),
+				d["routes"][0]["distance"]
+			)
+		return self._leg_lines[leg_idx]
 
+	def find_coords_of_max_mileage_reach(self) -> CoordsMaxMileageReach:
+		return self.find_coords_of_max_mileage_reach_many([self.max_mileage])[0]
 
+	@timed("charge_planner_max_reach")
+	def find_coords_of_max_mileage_reach_many(self, mileages: Sequence[float]) -> List[CoordsMaxMileageReach]:
+		"""
+		Same as find_coords_of_max_mileage_reach, for several mileages at once.
+		The prefix sums and the leg geometries are shared, and the points are
+		interpolated in one shapely call per leg.
+		"""
+		max_reach_indices = self.find_max_reach_indices(mileages)
+		results: List[Optional[CoordsMaxMileageReach]] = [None] * len(mileages)
+		# mileages whose charge runs out on the same leg, grouped by leg index
+		pending_by_leg: Dict[int, List[Tuple[int, float]]] = {}
+		last_idx = len(self.ordered_route) - 1
 
+		for k, (mileage, idx) in enumerate(zip(mileages, max_reach_indices)):
+			idx = int(idx)
+			max_reach_location = self.ordered_route[idx]
+			# how much mileage is left since the last location reached
+			remaining_mileage = mileage - self.cumulated_distances[idx]
+			if idx == last_idx:
+				results[k] = CoordsMaxMileageReach(
+					reached_endpoint=True,
+					remaining_mileage_from_last_location_reached=remaining_mileage,
+					max_reach_location=max_reach_location
+				)
+			else:
+				pending_by_leg.setdefault(idx, []).append((k, remaining_mileage))
 
-   
+		for idx, pending in pending_by_leg.items():
+			line, distance_between_locations = self._get_leg_line(idx)
+			ratios = [remaining_mileage / distance_between_locations for _, remaining_mileage in pending]
+			points = shapely.line_interpolate_point(line, ratios, normalized=True)
+			for (k, remaining_mileage), point in zip(pending, points):
+				results[k] = CoordsMaxMileageReach(
+					lat=point.y,
+					lon=point.x,
+					reached_endpoint=False,
+					remaining_mileage_from_last_location_reached=remaining_mileage,
+					max_reach_location=self.ordered_route[idx],
+					next_location=self.ordered_route[idx + 1]
+				)
+		return results
@@ -0,0 +1,115 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import shapely
+from shapely.geometry import LineString
+from utils.charging_station import ChargingStation, ChargingStationIndex
+from utils.geo import EARTH_RADIUS_M
+from utils.metrics import timed
+
+
+class LegCorridor:
+    """
+    The chargers within the buffer of one directions leg, sorted by their offset
+    (metres from the start of the leg, on the scale of the Mapbox route distance).
+    """
+    def __init__(self, offsets: np.ndarray, stations: np.ndarray, lateral: np.ndarray):
+        self.offsets = offsets    # sorted
+        self.stations = stations  # indices in the ChargingStationIndex
+        self.lateral = lateral    # distance from the route, in metres
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def between(self, from_m: float, to_m: float) -> np.ndarray:
+        """Indices of the chargers between `from_m` and `to_m` along the leg: a binary-search slice."""
+        lo = np.searchsorted(self.offsets, from_m, side="left")
+        hi = np.searchsorted(self.offsets, to_m, side="right")
+        return self.stations[lo:hi]
+
+
+class ChargerCorridors:
+    """
+    Charger candidates precomputed per directions leg, so that "chargers between
+    km X and km Y of this leg" needs no spatial query at request time.
+    Corridors are computed from the cached directions, in bulk with `precompute`
+    or on the first lookup of a leg.
+    """
+    def __init__(self, chargers: ChargingStationIndex, buffer_m: float = 2000.0):
+        self.chargers = chargers
+        self.buffer_m = buffer_m
+        self._corridors: Dict[Tuple[int, int], LegCorridor] = {}
+        self._lock = threading.Lock()
+        self._lat0 = np.radians(np.mean(chargers.lats)) if len(chargers) else 0.0
+        self._x, self._y = self._project(chargers.lons, chargers.lats)
+
+    def _project(self, lons, lats) -> Tuple[np.ndarray, np.ndarray]:
+        """Equirectangular projection in metres, good enough along a single leg."""
+        lons, lats = np.asarray(lons, dtype=float), np.asarray(lats, dtype=float)
+        return np.radians(lons) * np.cos(self._lat0) * EARTH_RADIUS_M, np.radians(lats) * EARTH_RADIUS_M
+
+    @timed("charger_corridor_build")
+    def build(self, directions: dict) -> LegCorridor:
+        """The corridor of a leg, from its Mapbox directions."""
+        route = directions["routes"][0]
+        coordinates = np.asarray(route["geometry"]["coordinates"], dtype=float)
+        x, y = self._project(coordinates[:, 0], coordinates[:, 1])
+        # bounding box prefilter, then the exact distance to the projected line
+        candidates = np.flatnonzero(
+            (self._x >= x.min() - self.buffer_m) & (self._x <= x.max() + self.buffer_m)
+            & (self._y >= y.min() - self.buffer_m) & (self._y <= y.max() + self.buffer_m)
+        )
+        projected_line = LineString(np.column_stack([x, y]))
+        shapely.prepare(projected_line)
+        points = shapely.points(self._x[candidates], self._y[candidates])
+        inside = shapely.dwithin(projected_line, points, self.buffer_m)
+        candidates, points = candidates[inside], points[inside]
+        # Offsets follow ChargePlanner: a fraction of the lon/lat line times the route distance
+        line = LineString(coordinates)
+        fractions = shapely.line_locate_point(
+            line,
+            shapely.points(self.chargers.lons[candidates], self.chargers.lats[candidates]),
+            normalized=True
+        )
+        offsets = np.asarray(fractions, dtype=float) * route["distance"]
+        order = np.argsort(offsets, kind="stable")
+        return LegCorridor(
+            offsets[order],
+            candidates[order],
+            np.asarray(shapely.distance(projected_line, points), dtype=float)[order]
+        )
+
+    def get(self, id_a: int, id_b: int, directions_cache) -> Optional[LegCorridor]:
+        """The corridor of a leg, None if its directions are not cached."""
+        key = (id_a, id_b)
+        with self._lock:
+            corridor = self._corridors.get(key)
+        if corridor is None:
+            directions = directions_cache.get(id_a, id_b)
+            if directions is None:
+                return None
+            corridor = self.build(directions)
+            with self._lock:
+                self._corridors[key] = corridor
+        return corridor
+
+    def precompute(self, directions_cache) -> int:
+        """Computes the corridor of every cached leg, returns how many were built."""
+        built = 0
+        for id_a, id_b in list(directions_cache.directions.keys()):
+            if (id_a, id_b) not in self._corridors and self.get(id_a, id_b, directions_cache) is not None:
+                built += 1
+        return built
+
+    def chargers_between(
+            self,
+            id_a: int,
+            id_b: int,
+            from_m: float,
+            to_m: float,
+            directions_cache) -> Optional[List[ChargingStation]]:
+        """The chargers between `from_m` and `to_m` along the leg, None if the leg is unknown."""
+        corridor = self.get(id_a, id_b, directions_cache)
+        if corridor is None:
+            return None
+        return [self.chargers.stations[i] for i in corridor.between(from_m, to_m)]
@@ -0,0 +1,262 @@
+import heapq
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from pydantic import BaseModel, Field
+from utils.location import LocationDistanceMatrix
+from utils.charging_station import ChargingStationIndex
+from utils.geo import DETOUR_FACTOR, EARTH_RADIUS_M, estimated_road_distance_m
+from utils.metrics import timed
+
+# See RouteRequest: IDs from 1,000,000 are chargers
+CHARGER_ID_OFFSET = 1_000_000
+# Rows of the pairwise distance matrix computed at once while building the graph
+BUILD_BLOCK_SIZE = 512
+# Graphs are built for ranges rounded down to this step (hops stay within the real range),
+# and only the last GRAPH_CACHE_SIZE used are kept
+GRAPH_RANGE_STEP_M = 5000.0
+GRAPH_CACHE_SIZE = 4
+
+
+class ChargingStopsRequest(BaseModel):
+    ordered_route: List[int] = Field(..., min_length=2, json_schema_extra={"example": [578, 497, 881]})
+    max_mileage: float = Field(..., gt=0, description="Range with a full battery, in metres")
+    initial_range: Optional[float] = Field(default=None, gt=0, description="Range at departure, defaults to max_mileage")
+    charge_minutes: float = Field(default=30, ge=0, description="Time spent at each charging stop")
+    avg_speed_kmh: float = Field(default=80, gt=0)
+
+
+class ChargingStop(BaseModel):
+    id: int = Field(..., description="Charging station id")
+    node_id: int = Field(..., description="The id to use in a route (CHARGER_ID_OFFSET + id)")
+    lat: float
+    lon: float
+    operator_name: str
+    distance_from_previous: float = Field(..., description="Estimated, in metres")
+
+
+class LegChargingPlan(BaseModel):
+    start_id: int
+    end_id: int
+    stops: List[ChargingStop]
+    distance: float = Field(..., description="Metres, estimated when the leg has charging stops")
+    duration: float = Field(..., description="Seconds, driving plus charging")
+    remaining_range: float = Field(..., description="Range left on arrival, in metres")
+
+
+class ChargerGraph:
+    """
+    Energy-constrained routing between attractions through charging stations.
+
+    The chargers are thinned to one hub per `cell_m` grid cell, then every hub is linked to a
+    few hubs per compass sector (Yao-graph style): the `k_near` nearest and the `k_far` farthest
+    within the vehicle range, so that the graph stays sparse but still has long hops.
+    Graphs are built per range (rounded down to GRAPH_RANGE_STEP_M), once even when requests
+    ask for them together, and the last few used are cached. A query is an A* search where every hub on the path is
+    a full recharge, and the cost is the travel time plus the charging time.
+    """
+    def __init__(
+            self,
+            distance_matrix: LocationDistanceMatrix,
+            chargers: ChargingStationIndex,
+            cell_m: float = 2000.0,
+            sectors: int = 8,
+            k_near: int = 2,
+            k_far: int = 2):
+        self.distance_matrix = distance_matrix
+        self.chargers = chargers
+        self.sectors = sectors
+        self.k_near = k_near
+        self.k_far = k_far
+        self.hubs = self._select_hubs(cell_m)
+        self.hub_lats = chargers.lats[self.hubs]
+        self.hub_lons = chargers.lons[self.hubs]
+        # graph range -> (indptr, indices, distances), CSR adjacency of the hubs
+        self._graphs: "OrderedDict[float, Tuple[np.ndarray, np.ndarray, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # graph range -> lock held while the graph is built, so that it is built once
+        self._build_locks: Dict[float, threading.Lock] = {}
+
+    def _project(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Equirectangular projection in metres, good enough at the scale of Switzerland."""
+        lat0 = np.radians(np.mean(self.chargers.lats))
+        return np.radians(lons) * np.cos(lat0) * EARTH_RADIUS_M, np.radians(lats) * EARTH_RADIUS_M
+
+    def _select_hubs(self, cell_m: float) -> np.ndarray:
+        """Indices (in the charger index) of one charger per grid cell."""
+        if len(self.chargers) == 0:
+            return np.array([], dtype=np.int64)
+        x, y = self._project(self.chargers.lats, self.chargers.lons)
+        cells = np.stack([np.floor(x / cell_m), np.floor(y / cell_m)], axis=1)
+        _, first = np.unique(cells, axis=0, return_index=True)
+        return np.sort(first)
+
+    @timed("charger_graph_build")
+    def _build(self, max_range: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = len(self.hubs)
+        x, y = self._project(self.hub_lats, self.hub_lons)
+        degrees = np.zeros(n, dtype=np.int64)
+        indices: List[np.ndarray] = []
+        distances: List[np.ndarray] = []
+        max_straight = max_range / DETOUR_FACTOR
+        for start in range(0, n, BUILD_BLOCK_SIZE):
+            rows = slice(start, min(n, start + BUILD_BLOCK_SIZE))
+            dx = x[None, :] - x[rows][:, None]
+            dy = y[None, :] - y[rows][:, None]
+            squared = dx * dx + dy * dy
+            r, c = np.nonzero((squared <= max_straight * max_straight) & (squared > 0))
+            d = np.sqrt(squared[r, c]) * DETOUR_FACTOR
+            sector = ((np.arctan2(dx[r, c], dy[r, c]) + np.pi) / (2 * np.pi) * self.sectors).astype(np.int64)
+            group = r * self.sectors + np.minimum(sector, self.sectors - 1)
+            # in every (row, sector) group, keep the k_near first and the k_far last by distance
+            order = np.lexsort((d, group))
+            group = group[order]
+            _, group_start, group_size = np.unique(group, return_index=True, return_counts=True)
+            group_id = np.repeat(np.arange(len(group_start)), group_size)
+            rank = np.arange(len(group)) - group_start[group_id]
+            keep = order[(rank < self.k_near) | (rank >= group_size[group_id] - self.k_far)]
+            degrees[start:start + BUILD_BLOCK_SIZE] = np.bincount(r[keep], minlength=rows.stop - start)
+            indices.append(c[keep])
+            distances.append(d[keep])
+        indptr = np.concatenate([[0], np.cumsum(degrees)])
+        return (
+            indptr,
+            np.concatenate(indices) if indices else np.array([], dtype=np.int64),
+            np.concatenate(distances) if distances else np.array([], dtype=float),
+        )
+
+    @staticmethod
+    def graph_range(max_range: float) -> float:
+        """The range the graph used for `max_range` is built for."""
+        if max_range < GRAPH_RANGE_STEP_M:
+            return max_range
+        return max_range // GRAPH_RANGE_STEP_M * GRAPH_RANGE_STEP_M
+
+    def _cached(self, key: float) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is not None:
+                self._graphs.move_to_end(key)
+            return graph
+
+    def _graph(self, max_range: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        key = self.graph_range(max_range)
+        graph = self._cached(key)
+        if graph is not None:
+            return graph
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            # built by the request we waited for
+            graph = self._cached(key)
+            if graph is not None:
+                return graph
+            try:
+                graph = self._build(key)
+                with self._lock:
+                    self._graphs[key] = graph
+                    if len(self._graphs) > GRAPH_CACHE_SIZE:
+                        self._graphs.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._build_locks.pop(key, None)
+        return graph
+
+    def _stop(self, hub: int, distance_from_previous: float) -> ChargingStop:
+        c = self.hubs[hub]
+        station = self.chargers.stations[c]
+        return ChargingStop(
+            id=station.id,
+            node_id=CHARGER_ID_OFFSET + station.id,
+            lat=station.lat,
+            lon=station.lon,
+            operator_name=station.operator_name,
+            distance_from_previous=distance_from_previous
+        )
+
+    @timed("charger_graph_leg")
+    def plan_leg(
+            self,
+            start_id: int,
+            end_id: int,
+            max_range: float,
+            initial_range: float,
+            charge_seconds: float = 1800,
+            speed_mps: float = 22.2) -> LegChargingPlan:
+        """Fastest sequence of charging stops between two attractions. Raises ValueError if there is none."""
+        direct = self.distance_matrix.get_distance_between_ids(start_id, end_id)
+        if direct <= initial_range:
+            return LegChargingPlan(
+                start_id=start_id, end_id=end_id, stops=[], distance=direct,
+                duration=direct / speed_mps, remaining_range=initial_range - direct
+            )
+        if len(self.hubs) == 0:
+            raise ValueError(f"No charging station to reach {end_id} from {start_id}")
+
+        locations = self.distance_matrix.locations
+        start = locations[self.distance_matrix.get_idx(start_id)]
+        end = locations[self.distance_matrix.get_idx(end_id)]
+        indptr, indices, distances = self._graph(max_range)
+        d_start = estimated_road_distance_m(start.lat, start.lon, self.hub_lats, self.hub_lons)
+        d_end = estimated_road_distance_m(self.hub_lats, self.hub_lons, end.lat, end.lon)
+        # A* heuristic: straight line at the average speed, never more than the estimated road distance
+        h = d_end / DETOUR_FACTOR / speed_mps
+
+        n = len(self.hubs)
+        best = np.full(n, np.inf)
+        previous = np.full(n, -1, dtype=np.int64)
+        heap = []
+        for u in np.flatnonzero(d_start <= initial_range):
+            best[u] = d_start[u] / speed_mps + charge_seconds
+            heapq.heappush(heap, (best[u] + h[u], int(u)))
+
+        best_end, last_hub = np.inf, -1
+        while heap:
+            f, u = heapq.heappop(heap)
+            if f >= best_end:
+                break  # no open path can beat the best arrival anymore
+            if f > best[u] + h[u]:
+                continue  # stale entry
+            if d_end[u] <= max_range and best[u] + d_end[u] / speed_mps < best_end:
+                best_end, last_hub = best[u] + d_end[u] / speed_mps, u
+            for k in range(indptr[u], indptr[u + 1]):
+                v, d = indices[k], distances[k]
+                g = best[u] + d / speed_mps + charge_seconds
+                if g < best[v]:
+                    best[v] = g
+                    previous[v] = u
+                    heapq.heappush(heap, (g + h[v], int(v)))
+
+        if last_hub < 0:
+            raise ValueError(f"No feasible sequence of charging stops from {start_id} to {end_id}")
+
+        path = [last_hub]
+        while previous[path[-1]] >= 0:
+            path.append(previous[path[-1]])
+        path.reverse()
+        stops = [self._stop(path[0], float(d_start[path[0]]))]
+        for a, b in zip(path[:-1], path[1:]):
+            hop = estimated_road_distance_m(self.hub_lats[a], self.hub_lons[a], self.hub_lats[b], self.hub_lons[b])
+            stops.append(self._stop(b, float(hop)))
+        distance = sum(s.distance_from_previous for s in stops) + float(d_end[last_hub])
+        return LegChargingPlan(
+            start_id=start_id, end_id=end_id, stops=stops, distance=distance,
+            duration=float(best_end), remaining_range=max_range - float(d_end[last_hub])
+        )
+
+    def plan_route(
+            self,
+            ordered_route: List[int],
+            max_range: float,
+            initial_range: Optional[float] = None,
+            charge_seconds: float = 1800,
+            speed_mps: float = 22.2) -> List[LegChargingPlan]:
+        """Plans every leg, carrying the range left at the end of a leg over to the next one."""
+        remaining = max_range if initial_range is None else initial_range
+        legs = []
+        for start_id, end_id in zip(ordered_route[:-1], ordered_route[1:]):
+            leg = self.plan_leg(start_id, end_id, max_range, remaining, charge_seconds, speed_mps)
+            legs.append(leg)
+            remaining = leg.remaining_range
+        return legs
@@ -1,16 +1,37 @@
-import os
-from typing import Annotated, Any, List
-import requests
+from typing import TYPE_CHECKING, Annotated, Any, Dict, List
+import numpy as np
+import shapely
 from shapely.geometry import shape, Point
 from shapely import wkb
-from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
-from supabase import Client
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, TypeAdapter
+from utils.metrics import span
+from utils.geo import estimated_road_distance_m
+from utils.backends import get_backend, get_mapbox_token
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient, Client
 
 # The "magic" conversion logic
 def hex_to_point(v: Any) -> Point:
-    """Converts a HEX EWKB to a Shapely Point"""
+    """Converts a HEX EWKB to a Shapely Point (already decoded points are kept as they are)"""
+    if isinstance(v, Point):
+        return v
     return wkb.loads(v, hex=True)
 
+
+def decode_points(values: List[Any]) -> np.ndarray:
+    """
+    hex_to_point over a whole column: a single vectorized shapely.from_wkb call
+    (hex strings and bytes alike), decoded points are kept as they are.
+    """
+    encoded = np.array([not isinstance(v, Point) for v in values], dtype=bool)
+    if encoded.all():
+        return shapely.from_wkb(values)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    column[encoded] = shapely.from_wkb(column[encoded])
+    return column
+
 # Annotated type for reuse
 ShapelyPoint = Annotated[Point, BeforeValidator(hex_to_point)]
 
@@ -27,8 +48,23 @@ class ChargingStation(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     @classmethod
-    def fetch_and_cache_isochrone(station, supabase: Client):
-        mapbox_tkn = os.environ.get("MAPBOX_TOKEN")
+    def from_rows(cls, rows: List[Dict[str, Any]], trusted: bool = False) -> List["ChargingStation"]:
+        """
+        Decodes Supabase rows in bulk: the locations with one vectorized WKB call,
+        then the whole list with one TypeAdapter validation (hex_to_point keeps the decoded points).
+        `trusted` rows (the charging_stations table, whose columns have the field types) are only
+        constructed, not validated.
+        """
+        if not rows:
+            return []
+        points = decode_points([row["location"] for row in rows])
+        if trusted:
+            return [cls.model_construct(**{**row, "location": point}) for row, point in zip(rows, points)]
+        return _STATION_LIST.validate_python([{**row, "location": point} for row, point in zip(rows, points)])
+
+    @classmethod
+    def fetch_and_cache_isochrone(station, supabase: "Client"):
+        mapbox_tkn = get_mapbox_token()
         url = f"https://api.mapbox.com/isochrone/v1/mapbox/driving/{station.lon},{station.lat}"
         params = {
             "contours_minutes": 5,
@@ -36,7 +72,7 @@ class ChargingStation(BaseModel):
             "access_token": mapbox_tkn
         }
         
-        response = requests.get(url, params=params).json()
+        response = get_backend("mapbox").get(url, params=params).json()
         
         # Mapbox returns a FeatureCollection; we take the first feature's geometry
         geojson_poly = response['features'][0]['geometry']
@@ -52,28 +88,92 @@ class ChargingStation(BaseModel):
     
 
     @classmethod
-    def find_nearby_lat_lon(self, lat: float, lon: float, supabase: Client) -> List["ChargingStation"]:
-        req =  supabase.rpc('get_nearest_chargers', {
-            'target_lat': lat, 
-            'target_lon': lon, 
-            'n_count': 5
-        }).execute()
-        stations = []
-        for station in req.data:
-            stations.append(ChargingStation(**station))
-        return stations
+    def find_nearby_lat_lon(self, lat: float, lon: float, supabase: "Client") -> List["ChargingStation"]:
+        with span("supabase_get_nearest_chargers"):
+            req =  supabase.rpc('get_nearest_chargers', {
+                'target_lat': lat, 
+                'target_lon': lon, 
+                'n_count': 5
+            }).execute()
+        return ChargingStation.from_rows(req.data)
 
 
     @classmethod
-    def find_by_isochrones(self, lat: float, lon: float, supabase: Client) -> List["ChargingStation"]:
-        req = supabase.rpc(
-            'get_chargers_covering_point', 
-            {
+    def find_by_isochrones(self, lat: float, lon: float, supabase: "Client") -> List["ChargingStation"]:
+        with span("supabase_find_by_isochrones"):
+            req = supabase.rpc(
+                'get_chargers_covering_point', 
+                {
+                    'target_lat': lat,
+                    'target_lon': lon
+                }
+            ).execute()
+        return ChargingStation.from_rows(req.data)
+
+
+    @classmethod
+    async def afind_nearby_lat_lon(cls, lat: float, lon: float, supabase: "AsyncClient") -> List["ChargingStation"]:
+        """find_nearby_lat_lon with the async client."""
+        with span("supabase_get_nearest_chargers"):
+            req = await supabase.rpc('get_nearest_chargers', {
                 'target_lat': lat,
-                'target_lon': lon
-            }
-        ).execute()
+                'target_lon': lon,
+                'n_count': 5
+            }).execute()
+        return cls.from_rows(req.data)
+
+
+    @classmethod
+    async def afind_by_isochrones(cls, lat: float, lon: float, supabase: "AsyncClient") -> List["ChargingStation"]:
+        """find_by_isochrones with the async client: the event loop keeps serving during the RPC."""
+        with span("supabase_find_by_isochrones"):
+            req = await supabase.rpc(
+                'get_chargers_covering_point',
+                {
+                    'target_lat': lat,
+                    'target_lon': lon
+                }
+            ).execute()
+        return cls.from_rows(req.data)
+
+
+    @classmethod
+    def get_all(cls, supabase: "Client", page_size: int = 1000, trusted: bool = False) -> List["ChargingStation"]:
+        """
+        Fetches every charging station, page by page (PostgREST caps the rows per response).
+        With `trusted`, the rows are not validated (see from_rows).
+        """
         stations = []
-        for station in req.data:
-            stations.append(ChargingStation(**station))
-        return stations
\ No newline at end of file
+        start = 0
+        while True:
+            with span("supabase_get_all_chargers"):
+                req = supabase.table("charging_stations").select(
+                    "id, operator_id, operator_name, lat, lon, location"
+                ).order("id").range(start, start + page_size - 1).execute()
+            stations.extend(cls.from_rows(req.data, trusted=trusted))
+            if len(req.data) < page_size:
+                return stations
+            start += page_size
+
+
+_STATION_LIST = TypeAdapter(List[ChargingStation])
+
+
+class ChargingStationIndex:
+    """
+    The charging stations as NumPy arrays, for vectorized distance queries.
+    Distances are road distance estimates (see utils.geo), there is no charger matrix.
+    """
+    def __init__(self, stations: List[ChargingStation]):
+        self.stations = stations
+        self.ids = np.array([s.id for s in stations], dtype=np.int64)
+        self.lats = np.array([s.lat for s in stations], dtype=float)
+        self.lons = np.array([s.lon for s in stations], dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.stations)
+
+    def distances_from(self, lat: float, lon: float) -> np.ndarray:
+        """Estimated road distance (metres) from a point to every station."""
+        return estimated_road_distance_m(lat, lon, self.lats, self.lons)
+
@@ -0,0 +1,180 @@
+import difflib
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from utils.location import Location
+
+# Words a route command may contain besides location names. Any other word makes
+# the parser unsure, and the message goes to the LLM.
+START_WORDS = {"start", "starting", "from"}
+ORDER_WORDS = {"then", "before"}
+SOLVE_WORDS = {"solve", "optimal", "optimize", "optimise", "shortest", "fastest"}
+FILLER_WORDS = {
+    "i", "we", "want", "wanna", "would", "like", "to", "please", "also", "add", "go", "the", "a",
+    "route", "trip", "tour", "and", "at", "point", "is", "my", "me", "let", "s", "us", "ok", "okay",
+    "visit", "visiting", "find", "compute", "calculate", "it", "now", "with", "in", "order", "of",
+}
+KEYWORDS = START_WORDS | ORDER_WORDS | SOLVE_WORDS | FILLER_WORDS
+# Names are matched on their word n-grams of at least this many characters
+MIN_MATCH_CHARS = 4
+# A misspelled word is replaced by the closest name word at least this similar
+FUZZY_CUTOFF = 0.85
+
+LOCATION_TAG = re.compile(r'\[\[loc:"?(\d+)"?\]\]')
+WORD = re.compile(r"\d+|[^\W\d_]+")
+
+
+def normalize_words(text: str) -> List[str]:
+    """Lower-case words without accents or punctuation."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return WORD.findall(text.casefold())
+
+
+@dataclass
+class RouteCommand:
+    """What a route command asks for, in the terms of the agent state."""
+    locations: List[int] = field(default_factory=list)
+    starting_point: Optional[int] = None
+    # (visit before, visit after)
+    precedences: List[Tuple[int, int]] = field(default_factory=list)
+    solve: bool = False
+    objective: str = "distance"
+
+
+class NameIndex:
+    """
+    Word-level trie of the location names: every run of consecutive words of a name
+    leads to the ids of the names containing it, so "Griesalp" finds "Alpine Farm and
+    Nature Trail Griesalp - Kiental". A run matching several locations is ambiguous.
+    """
+    def __init__(self, locations: Iterable[Location]):
+        self.ids: Set[int] = set()
+        self._root: dict = {}
+        self._vocabulary: Set[str] = set()
+        for location in locations:
+            self.ids.add(location.id)
+            words = normalize_words(location.name)
+            self._vocabulary.update(w for w in words if len(w) >= MIN_MATCH_CHARS)
+            for start in range(len(words)):
+                node = self._root
+                for word in words[start:]:
+                    node = node.setdefault(word, {})
+                    node.setdefault(None, set()).add(location.id)
+
+    def longest_match(self, words: List[str], start: int) -> Tuple[int, Set[int]]:
+        """The number of words matched from `start` (longest run), and the ids they name."""
+        node, best = self._root, (0, set())
+        for k in range(start, len(words)):
+            node = node.get(words[k])
+            if node is None:
+                break
+            best = (k - start + 1, node[None])
+        return best
+
+    def correct(self, word: str) -> Optional[str]:
+        """The name word closest to a misspelled one, if only one is close enough."""
+        if len(word) < MIN_MATCH_CHARS:
+            return None
+        candidates = difflib.get_close_matches(word, self._vocabulary, n=2, cutoff=FUZZY_CUTOFF)
+        if len(candidates) == 1:
+            return candidates[0]
+        if len(candidates) == 2:
+            scores = [difflib.SequenceMatcher(None, word, c).ratio() for c in candidates]
+            if scores[0] > scores[1]:
+                return candidates[0]
+        return None
+
+
+def _match_location(index: NameIndex, words: List[str], k: int) -> Tuple[int, Optional[int]]:
+    """(words consumed, location id) at position k; (0, None) when no single location matches."""
+    if words[k].isdigit():
+        location_id = int(words[k])
+        return (1, location_id) if location_id in index.ids else (0, None)
+    length, ids = index.longest_match(words, k)
+    matched = words[k:k + length]
+    # "the route" or "start" alone are commands, even if a name contains them
+    if len(ids) == 1 and len(" ".join(matched)) >= MIN_MATCH_CHARS and any(w not in KEYWORDS for w in matched):
+        return length, next(iter(ids))
+    return 0, None
+
+
+def parse_route_command(text: str, index: NameIndex) -> Optional[RouteCommand]:
+    """
+    The route command of a message such as "start at Moods, visit Longstreet Bar then
+    Niesen and solve", or None when any part of it is not understood (a word that is
+    neither a keyword nor a single location, a dangling "start" or "then", nothing to do).
+    """
+    words = normalize_words(LOCATION_TAG.sub(r" \1 ", text))
+    command = RouteCommand()
+    pending_start = pending_order = False
+    previous: Optional[int] = None
+    k = 0
+    while k < len(words):
+        length, location_id = _match_location(index, words, k)
+        if location_id is None and words[k] not in KEYWORDS and not words[k].isdigit():
+            corrected = index.correct(words[k])
+            if corrected is not None:
+                words[k] = corrected
+                length, location_id = _match_location(index, words, k)
+        if location_id is not None:
+            if location_id not in command.locations:
+                command.locations.append(location_id)
+            if pending_start:
+                if command.starting_point not in (None, location_id):
+                    return None
+                command.starting_point = location_id
+                pending_start = False
+            elif pending_order:
+                if previous is None:
+                    return None
+                if previous != command.starting_point and previous != location_id:
+                    command.precedences.append((previous, location_id))
+                pending_order = False
+            previous = location_id
+            k += length
+            continue
+        word = words[k]
+        if word in START_WORDS:
+            pending_start = True
+        elif word in ORDER_WORDS:
+            pending_order = True
+        elif word in SOLVE_WORDS:
+            command.solve = True
+            if word == "fastest":
+                command.objective = "duration"
+        elif word not in FILLER_WORDS:
+            return None
+        k += 1
+    if pending_start or pending_order:
+        return None
+    if not command.locations and not command.solve:
+        return None
+    return command
+
+
+def describe_locations(ids: List[int]) -> str:
+    return ", ".join(f'[[loc:"{i}"]]' for i in ids)
+
+
+def format_route_reply(locations: List[int], starting_point: int, precedences: List[Tuple[int, int]]) -> str:
+    text = f"Route updated: {describe_locations(locations)}, starting at {describe_locations([starting_point])}."
+    if precedences:
+        text += " Order: " + ", ".join(
+            f'[[loc:"{a}"]] before [[loc:"{b}"]]' for a, b in precedences
+        ) + "."
+    return text
+
+
+def format_solution_reply(solution: Dict) -> str:
+    # Only the exact methods prove the route optimal; the local search bounds how far from it it is
+    label = "Optimal route" if solution.get("method", "exact") == "exact" else "Best route found"
+    text = f"{label}: {' → '.join(describe_locations([i]) for i in solution['ordered_route'])}."
+    text += f" Total distance: {solution['total_distance'] / 1000:.1f} km"
+    if solution.get("total_duration"):
+        minutes = round(solution["total_duration"] / 60)
+        text += f", driving time: {minutes // 60}h{minutes % 60:02d}min"
+    if solution.get("method", "exact") != "exact" and solution.get("gap") is not None:
+        text += f", within {solution['gap']:.0%} of the optimum"
+    return text + "."
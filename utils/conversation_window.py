@@ -0,0 +1,129 @@
+import os
+from typing import Any, Dict, List, Optional
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+# The last AGENT_HISTORY_TURNS user turns are sent to the LLM as they are; the
+# AGENT_SUMMARY_TURNS turns before them are summarized in one line each, older ones dropped
+HISTORY_TURNS = int(os.environ.get("AGENT_HISTORY_TURNS", "4"))
+SUMMARY_TURNS = int(os.environ.get("AGENT_SUMMARY_TURNS", "10"))
+# Characters of a message kept in its summary line
+SUMMARY_CHARS = 200
+# Tools whose output is replaced by their next call: only the latest output is sent
+SUPERSEDED_TOOLS = ("get_available_locations", "route_validation_tool", "route_solving_tool")
+AVAILABLE_LOCATIONS_TOOL = "get_available_locations"
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    """The messages grouped in turns, each starting with a user message (tool calls stay with their outputs)."""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def shorten(content: Any, limit: int = SUMMARY_CHARS) -> str:
+    text = " ".join((content if isinstance(content, str) else str(content)).split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def drop_superseded(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Replaces the content of the tool outputs that a later call of the same tool
+    superseded. The tool messages themselves stay: every tool call needs its answer.
+    """
+    latest = {}
+    for k, message in enumerate(messages):
+        if isinstance(message, ToolMessage) and message.name in SUPERSEDED_TOOLS:
+            latest[message.name] = k
+    return [
+        message.model_copy(update={"content": f"[superseded by a later {message.name} call]"})
+        if isinstance(message, ToolMessage) and message.name in latest and latest[message.name] != k
+        else message
+        for k, message in enumerate(messages)
+    ]
+
+
+def _field(item: Any, name: str):
+    return item.get(name) if isinstance(item, dict) else getattr(item, name, None)
+
+
+def describe_route_state(state: Dict[str, Any]) -> Optional[str]:
+    """The validated route of the state, the reference over anything said in the conversation."""
+    locations = state.get("locations")
+    if not locations:
+        return None
+    text = f"Current validated route (authoritative, it replaces anything said before): locations {list(locations)}"
+    starting_point = state.get("starting_point")
+    if starting_point is not None:
+        text += f", starting point {starting_point}"
+    precedences = state.get("precedences") or []
+    if precedences:
+        pairs = ", ".join(
+            f"{_field(p, 'visit_location_before')} before {_field(p, 'visit_location_after')}" for p in precedences
+        )
+        text += f", precedences: {pairs}"
+    return text + "."
+
+
+def summarize_turns(turns: List[List[BaseMessage]], summary_turns: int = SUMMARY_TURNS) -> str:
+    """One line per turn: what the user asked and what the assistant answered."""
+    omitted = max(0, len(turns) - summary_turns)
+    lines = ["Summary of the earlier conversation:"]
+    if omitted:
+        lines.append(f"- ({omitted} earlier turns omitted)")
+    for turn in turns[omitted:]:
+        line = f"- User: {shorten(turn[0].content)}"
+        answer = next(
+            (m for m in reversed(turn) if isinstance(m, AIMessage) and m.content and not m.tool_calls),
+            None
+        )
+        if answer is not None:
+            line += f" | Assistant: {shorten(answer.content)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def window_messages(
+        messages: List[BaseMessage],
+        state: Dict[str, Any],
+        history_turns: int = HISTORY_TURNS,
+        summary_turns: int = SUMMARY_TURNS) -> List[BaseMessage]:
+    """
+    The messages sent to the LLM, bounded whatever the length of the conversation:
+        - the last `history_turns` turns, cut at user messages, without the superseded tool outputs
+        - the older turns as a short summary, and the latest available locations if they are among them
+        - the validated route of the state
+    """
+    turns = split_turns(messages)
+    # The current turn is always sent
+    cut = max(0, len(turns) - max(1, history_turns))
+    older, recent = turns[:cut], turns[cut:]
+    kept = drop_superseded([m for turn in recent for m in turn])
+
+    context = []
+    if older:
+        context.append(summarize_turns(older, summary_turns))
+        if not any(isinstance(m, ToolMessage) and m.name == AVAILABLE_LOCATIONS_TOOL for m in kept):
+            available = next((
+                m for turn in reversed(older) for m in reversed(turn)
+                if isinstance(m, ToolMessage) and m.name == AVAILABLE_LOCATIONS_TOOL
+            ), None)
+            if available is not None:
+                context.append(f"Available locations: {available.content}")
+    route = describe_route_state(state)
+    if route is not None:
+        context.append(route)
+    if not context:
+        return kept
+    return [SystemMessage(content="\n\n".join(context))] + kept
+
+
+def pre_model_hook(state: Dict[str, Any]) -> Dict[str, List[BaseMessage]]:
+    """
+    LangGraph pre-model hook: the LLM gets the windowed messages,
+    the conversation saved in the state is left untouched.
+    """
+    return {"llm_input_messages": window_messages(state["messages"], state)}
@@ -1,8 +1,9 @@
 import requests
-import os
 from utils.location import Location
 from utils.local_directions_cache import LocalDirectionsCache
 from fastapi import HTTPException, status
+from utils.metrics import span
+from utils.backends import get_backend, get_mapbox_token
 
 class Directions():
 
@@ -13,9 +14,7 @@ class Directions():
         end_loc: Location,
         directions_cache: LocalDirectionsCache):
         coords_str = f"{start_loc.lon},{start_loc.lat};{end_loc.lon}, {end_loc.lat}"
-        mapbox_access_token = os.getenv("MAPBOX_TOKEN")
-        if not mapbox_access_token:
-            raise ValueError("MAPBOX_TOKEN not found in .env file.")
+        mapbox_access_token = get_mapbox_token()
         url = f"https://api.mapbox.com/directions/v5/mapbox/driving/{coords_str}"
         params = {
             "access_token": mapbox_access_token,
@@ -25,7 +24,8 @@ class Directions():
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
+            with span("mapbox_directions"):
+                response = get_backend("mapbox").get(url, params=params, timeout=10)
             
             if response.status_code != 200:
                 error_msg = response.json().get('message', 'Unknown Mapbox Error')
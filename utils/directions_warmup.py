@@ -0,0 +1,93 @@
+import asyncio
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+from utils.location import Location, LocationDistanceMatrix
+from utils.local_directions_cache import LocalDirectionsCache
+from utils.directions import Directions
+
+# Destinations warmed per location by default: all the pairs (N² legs) must be asked for explicitly
+DEFAULT_WARMUP_TOP_K = 10
+
+
+class WarmupProgress(BaseModel):
+    """
+    Progress of the directions warm-up, exposed on the API.
+        - total: legs that had to be downloaded
+        - done / failed: legs processed so far
+        - skipped: legs that were already cached when the warm-up started
+    """
+    total: int = 0
+    done: int = 0
+    failed: int = 0
+    skipped: int = 0
+    running: bool = False
+
+
+def get_warmup_pairs(
+        locations: List[Location],
+        directions_cache: LocalDirectionsCache,
+        distance_matrix: Optional[LocationDistanceMatrix] = None,
+        top_k: Optional[int] = DEFAULT_WARMUP_TOP_K) -> Tuple[List[Tuple[Location, Location]], int]:
+    """
+    Returns the (start, end) pairs missing from the cache, and how many were already cached.
+    Only the `top_k` nearest destinations (according to the distance matrix) of every
+    location are considered; `top_k=None` considers every pair.
+    """
+    if top_k is not None and distance_matrix is None:
+        raise ValueError("top_k needs a distance matrix, pass top_k=None to warm up every pair")
+    pairs = []
+    skipped = 0
+    for start in locations:
+        ends = [end for end in locations if end.id != start.id]
+        if top_k is not None:
+            ends.sort(key=lambda end: distance_matrix.get_distance_between_ids(start.id, end.id))
+            ends = ends[:top_k]
+        for end in ends:
+            if directions_cache.get(start.id, end.id) is None:
+                pairs.append((start, end))
+            else:
+                skipped += 1
+    return pairs, skipped
+
+
+async def warm_up_directions(
+        locations: List[Location],
+        directions_cache: LocalDirectionsCache,
+        progress: WarmupProgress,
+        distance_matrix: Optional[LocationDistanceMatrix] = None,
+        top_k: Optional[int] = DEFAULT_WARMUP_TOP_K,
+        concurrency: int = 4):
+    """
+    Downloads the directions of the missing pairs (see `get_warmup_pairs`) in the background,
+    with at most `concurrency` Mapbox calls in flight.
+    Failures are counted and logged, they never stop the warm-up.
+    """
+    pairs, skipped = get_warmup_pairs(locations, directions_cache, distance_matrix, top_k)
+    progress.total = len(pairs)
+    progress.skipped = skipped
+    # The progress object outlives a run (lifespan restarts): count this run only
+    progress.done = 0
+    progress.failed = 0
+    progress.running = True
+    print(f"Directions warm-up: {len(pairs)} legs to download, {skipped} already cached")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    report_every = max(1, len(pairs) // 10)
+
+    async def fetch(start: Location, end: Location):
+        async with semaphore:
+            try:
+                # Directions.get_from_mapbox is blocking, keep it off the event loop
+                await asyncio.to_thread(Directions.get_from_mapbox, start, end, directions_cache)
+                progress.done += 1
+            except Exception as e:
+                progress.failed += 1
+                print(f"Directions warm-up: failed ({start.id}, {end.id}): {e}")
+            processed = progress.done + progress.failed
+            if processed % report_every == 0 or processed == progress.total:
+                print(f"Directions warm-up: {processed}/{progress.total} legs")
+
+    try:
+        await asyncio.gather(*(fetch(start, end) for start, end in pairs))
+    finally:
+        progress.running = False
@@ -0,0 +1,21 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+# Road distance / great-circle distance, a rough average for Swiss roads.
+# Used to estimate driving distances where no Mapbox matrix is available (e.g. chargers)
+DETOUR_FACTOR = 1.3
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Great-circle distance in metres. Accepts scalars or arrays, with numpy broadcasting:
+    `haversine_m(lat[:, None], lon[:, None], lat[None, :], lon[None, :])` is a full matrix.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def estimated_road_distance_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Driving distance estimate: great-circle distance times the detour factor."""
+    return haversine_m(lat1, lon1, lat2, lon2) * DETOUR_FACTOR
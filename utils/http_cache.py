@@ -0,0 +1,236 @@
+import gzip
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+# Bodies worth compressing: JSON and GeoJSON, plus plain text
+COMPRESSIBLE_TYPES = ("application/json", "application/geo+json", "text/")
+# Added to the ETag of a compressed body: another encoding is another representation
+ENCODING_SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+
+
+def make_etag(body: bytes) -> str:
+    """Strong ETag of a body: its hash, the same in every worker and across restarts."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """The ETag of the `encoding` compressed representation of a body tagged `etag`."""
+    return etag[:-1] + ENCODING_SUFFIXES[encoding] + '"' if etag.endswith('"') else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header names `etag`. The tags sent back for a
+    compressed response carry the encoding suffix, they match the plain tag.
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        for suffix in ENCODING_SUFFIXES.values():
+            if tag.endswith(suffix + '"'):
+                tag = tag[:-len(suffix) - 1] + '"'
+                break
+        if tag == etag:
+            return True
+    return False
+
+
+class RenderedBodies:
+    """
+    Rendered response bodies and their ETags, keyed by the version of the data
+    they were rendered from (LRU): a conditional request for unchanged data is
+    answered without rendering, or even hashing, anything.
+    """
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, str]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_or_render(self, key: Hashable, render: Callable[[], bytes]) -> Tuple[bytes, str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        body = render()
+        entry = (body, make_etag(body))
+        if self.max_entries > 0:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+
+def conditional_response(
+        if_none_match: Optional[str],
+        body: bytes,
+        etag: str,
+        cache_control: str,
+        media_type: str = "application/json") -> Response:
+    """The body with its ETag, or an empty 304 when the client already has it."""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: quality}."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """brotli when installed and accepted, else gzip when accepted."""
+    accepted = accepted_encodings(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 4) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    # mtime=0: the same body always compresses to the same bytes
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Compresses the JSON (and text) responses of at least `minimum_size` bytes,
+    with brotli if the `brotli` package is installed and the client accepts it,
+    else with gzip. The compressed bodies of responses with an ETag are kept
+    (LRU), a body sent again is not compressed again.
+    Whether a response is compressed is decided from its start message: only those with a
+    Content-Length are buffered, the others (streaming, too small, other types) pass through.
+    A 304 gets `Vary: Accept-Encoding` and the ETag of the variant the client revalidated.
+    """
+    def __init__(
+            self,
+            app,
+            minimum_size: int = 1024,
+            gzip_level: int = 6,
+            brotli_quality: int = 4,
+            cache_entries: int = 128):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_entries = cache_entries
+        # (etag, encoding) -> compressed body
+        self._compressed: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+    def _compress(self, body: bytes, encoding: str, etag: Optional[str]) -> bytes:
+        if etag is None:
+            return compress(body, encoding, self.gzip_level, self.brotli_quality)
+        key = (etag, encoding)
+        compressed = self._compressed.get(key)
+        if compressed is None:
+            compressed = compress(body, encoding, self.gzip_level, self.brotli_quality)
+            if self.cache_entries > 0:
+                self._compressed[key] = compressed
+                while len(self._compressed) > self.cache_entries:
+                    self._compressed.popitem(last=False)
+        else:
+            self._compressed.move_to_end(key)
+        return compressed
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        start_message = None
+        chunks = []
+
+        async def buffered_send(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                if message["status"] == 304:
+                    self._not_modified(message, request_headers.get("if-none-match"), encoding)
+                elif self._eligible(message):
+                    start_message = message
+                    return
+                await send(message)
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            await self._send_response(start_message, b"".join(chunks), encoding, send)
+
+        await self.app(scope, receive, buffered_send)
+
+    def _eligible(self, start_message) -> bool:
+        headers = Headers(raw=start_message["headers"])
+        content_length = headers.get("content-length")
+        return (
+            content_length is not None
+            and content_length.isdigit()
+            and int(content_length) >= self.minimum_size
+            and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            and "content-encoding" not in headers
+            and start_message["status"] != 204
+        )
+
+    @staticmethod
+    def _not_modified(start_message, if_none_match: Optional[str], encoding: Optional[str]):
+        """A 304 names the representation a 200 would have sent: the compressed variant the client has."""
+        headers = MutableHeaders(raw=start_message["headers"])
+        etag = headers.get("etag")
+        if etag is None:
+            return
+        headers.add_vary_header("Accept-Encoding")
+        if encoding is None:
+            return
+        variant = variant_etag(etag, encoding)
+        tags = [tag.strip().removeprefix("W/") for tag in (if_none_match or "").split(",")]
+        if variant != etag and variant in tags:
+            headers["ETag"] = variant
+
+    async def _send_response(self, start_message, body: bytes, encoding: Optional[str], send):
+        headers = MutableHeaders(raw=start_message["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        if encoding is not None:
+            etag = headers.get("etag")
+            body = self._compress(body, encoding, etag)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            if etag is not None:
+                headers["ETag"] = variant_etag(etag, encoding)
+        await send(start_message)
+        await send({"type": "http.response.body", "body": body})
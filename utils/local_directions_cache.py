@@ -1,51 +1,155 @@
+import asyncio
 import json
+import os
+import tempfile
+import threading
 from pathlib import Path
 
 class LocalDirectionsCache:
-    def __init__(self, filename="cached_directions.json"):
+    """
+    Directions cache persisted with write-behind:
+        - `add` only stores the entry in memory and queues its key
+        - `flush` appends the queued entries, in one batch, to a journal file (JSON lines)
+        - once the journal is large enough, `compact` rewrites the cache file atomically
+          (temp file + rename) and empties the journal
+    A crash loses at most the entries added since the last flush.
+    """
+    def __init__(self, filename="cached_directions.json", compact_every: int = 50):
         self.filename = filename
+        self.journal_filename = f"{filename}.journal"
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()  # one writer at a time on the files
+        self._pending = []  # keys added since the last flush
+        self._journal_entries = 0
+        self._journal_corrupted = False
         # Load the cache immediately upon initialization
         self.directions = self.load_cache()
         self._changed = False  # Track if new data was added
+        # Incremented by every add: results computed from the cache are stale once it changes
+        self.version = 0
+        # key -> version of the cache when the leg was added (0: loaded from the files)
+        self._leg_versions = {}
+        if self._journal_corrupted:
+            # Don't append after a torn line, start from a clean journal
+            self.compact()
 
     def save_cache(self):
-        # Convert tuple keys (101, 202) -> string keys "101-202"
-        if not self._changed:
+        """Flushes the pending entries and rewrites the whole cache file."""
+        if not self._changed and not self._journal_entries:
             print("No new directions added. Skipping save.")
             return
-        serializable_cache = {
-            f"{k[0]}-{k[1]}": v
-            for k, v in self.directions.items()
-        }
-        with open(self.filename, "w", encoding="utf-8") as f:
-            json.dump(serializable_cache, f, indent=4)
-        self._changed = False  # Reset flag after successful save
+        self.compact()
+
+    def flush(self) -> int:
+        """Appends the pending entries to the journal. Returns how many were written."""
+        with self._lock:
+            keys, self._pending = self._pending, []
+        if not keys:
+            return 0
+        with self._io_lock:
+            with open(self.journal_filename, "a", encoding="utf-8") as f:
+                for k in keys:
+                    f.write(json.dumps({"key": f"{k[0]}-{k[1]}", "data": self.directions[k]}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_entries += len(keys)
+        if self._journal_entries >= self.compact_every:
+            self.compact()
+        return len(keys)
+
+    def compact(self):
+        """Atomically rewrites the cache file with every entry, then drops the journal."""
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        with self._io_lock:
+            # Snapshot the items under both locks: the warm-up may still be adding directions from
+            # its threads, and no flush may journal an entry the snapshot misses before the journal
+            # is dropped. The pending entries are in the snapshot, they need no flush anymore.
+            with self._lock:
+                items = list(self.directions.items())
+                self._pending = []
+            # Convert tuple keys (101, 202) -> string keys "101-202"
+            serializable_cache = {f"{k[0]}-{k[1]}": v for k, v in items}
+            fd, tmp_filename = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(serializable_cache, f, separators=(",", ":"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.chmod(tmp_filename, 0o644)
+                os.replace(tmp_filename, self.filename)
+            except BaseException:
+                os.unlink(tmp_filename)
+                raise
+            # Everything in the journal is now in the cache file
+            Path(self.journal_filename).unlink(missing_ok=True)
+            self._journal_entries = 0
+            self._changed = False  # Reset flag after successful save
+
+    async def run_write_behind(self, interval: float = 5.0):
+        """Background task: flushes the pending entries every `interval` seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            flushing = asyncio.ensure_future(asyncio.to_thread(self.flush))
+            try:
+                await asyncio.shield(flushing)
+            except asyncio.CancelledError:
+                # The thread can't be cancelled: the task ends once it has, before the final flush
+                await asyncio.wait([flushing])
+                raise
+            except OSError as e:
+                print(f"Error flushing directions cache: {e}")
 
     def load_cache(self):
         # Check if the file exists before trying to open it
         path = Path(self.filename)
+        directions = {}
         if not path.exists():
             print(f"No cache file found at {self.filename}. Starting fresh.")
-            return {}
-
-        try:
-            with open(self.filename, "r", encoding="utf-8") as f:
-                data = json.load(f)        
-            # Convert string keys "101-202" back to tuple (101, 202)
-            return {
-                (int(k.split('-')[0]), int(k.split('-')[1])): v 
-                for k, v in data.items()
-            }
-        
-        except (json.JSONDecodeError, ValueError) as e:
-            print(f"Error loading cache: {e}. Returning empty cache.")
-            return {}
+        else:
+            try:
+                with open(self.filename, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                # Convert string keys "101-202" back to tuple (101, 202)
+                directions = {
+                    (int(k.split('-')[0]), int(k.split('-')[1])): v
+                    for k, v in data.items()
+                }
+
+            except (json.JSONDecodeError, ValueError) as e:
+                print(f"Error loading cache: {e}. Returning empty cache.")
+                directions = {}
+
+        # Replay the entries flushed after the last compaction
+        journal = Path(self.journal_filename)
+        if journal.exists():
+            with open(journal, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a torn write at the end of the journal, the entry is lost
+                        print("Skipping a corrupted journal entry.")
+                        self._journal_corrupted = True
+                        continue
+                    a, b = entry["key"].split('-')
+                    directions[(int(a), int(b))] = entry["data"]
+                    self._journal_entries += 1
+        return directions
 
     def get(self, id_a: int, id_b: int):
         """Helper to retrieve from state"""
         return self.directions.get((id_a, id_b))
 
+    def leg_version(self, id_a: int, id_b: int) -> int:
+        """Changes whenever the leg is replaced, identifies the cached directions of a leg."""
+        return self._leg_versions.get((id_a, id_b), 0)
+
     def add(self, id_a: int, id_b: int, data):
-        """Helper to add and save"""
-        self.directions[(id_a, id_b)] = data
-        self._changed = True  # We have new data to save!
\ No newline at end of file
+        """Helper to add, the entry is persisted by the next flush"""
+        with self._lock:
+            self.directions[(id_a, id_b)] = data
+            self._pending.append((id_a, id_b))
+            self.version += 1
+            self._leg_versions[(id_a, id_b)] = self.version
+        self._changed = True  # We have new data to save!
@@ -0,0 +1,421 @@
+import atexit
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context, shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from utils.presolve import RoutePresolve
+
+# Local search processes of a heuristic solve (default: one per core)
+SOLVER_WORKERS = int(os.environ.get("SOLVER_WORKERS", str(os.cpu_count() or 1)))
+# Wall-clock budget of a heuristic solve, in seconds
+SOLVER_TIME_BUDGET = float(os.environ.get("SOLVER_TIME_BUDGET_S", "2.0"))
+# A worker stuck this many kicks behind the shared best tour restarts from it
+ADOPT_AFTER_KICKS = 50
+# Longest segment moved by an or-opt move
+OR_OPT_MAX_LENGTH = 3
+# Moves are only tried towards the nearest locations
+NEIGHBOURS = 10
+# A kick moves short segments at most this many positions
+KICK_WINDOW = 10
+
+
+@dataclass
+class HeuristicResult:
+    tour: List[int]  # location ids, from the starting point
+    cost: float
+    lower_bound: float
+    workers: int
+    kicks: int  # perturbations tried, all workers together
+
+    @property
+    def gap(self) -> float:
+        """Upper bound of the relative distance to the optimum."""
+        return (self.cost - self.lower_bound) / self.cost if self.cost > 0 else 0.0
+
+
+def path_cost(costs: List[List[float]], tour: List[int]) -> float:
+    return sum(costs[a][b] for a, b in zip(tour, tour[1:]))
+
+
+def is_feasible(tour: List[int], ancestors: List[int]) -> bool:
+    seen = 0
+    for v in tour:
+        if ancestors[v] & ~seen:
+            return False
+        seen |= 1 << v
+    return True
+
+
+def assignment_bound(costs: List[List[float]], presolve: RoutePresolve) -> float:
+    """
+    Lower bound of the shortest path: the cheapest assignment of a successor to every location
+    (Hungarian algorithm), closing the path with a free arc from the last location back to the
+    start. Every path is such an assignment, the impossible arcs (see RoutePresolve) excluded.
+    """
+    n = len(costs)
+    locations = presolve.locations
+    matrix = np.array(costs, dtype=np.float64)
+    finite_total = float(np.abs(matrix).sum()) + 1.0
+    for i in range(n):
+        for j in range(n):
+            if j == presolve.start:
+                # back to the start: the free arc that closes the path (never from the start itself)
+                matrix[i, j] = 0.0 if i != j else finite_total
+            elif not presolve.arc_possible(locations[i], locations[j]):
+                matrix[i, j] = finite_total
+    return min_assignment(matrix)
+
+
+def min_assignment(cost: np.ndarray) -> float:
+    """Cost of the cheapest assignment of a square matrix (shortest augmenting paths, O(n^3))."""
+    n = cost.shape[0]
+    u, v = np.zeros(n + 1), np.zeros(n + 1)
+    p = np.zeros(n + 1, dtype=np.int64)  # p[j]: row assigned to column j (1-based, 0 = none)
+    way = np.zeros(n + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(n + 1, np.inf)
+        used = np.zeros(n + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            free[0] = False
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv, np.inf)
+            j1 = int(np.argmin(candidates))
+            delta = candidates[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    return float(-v[0])
+
+
+def changed_region(old: List[int], new: List[int]) -> List[int]:
+    """The locations of `new` from the first to the last position that differ, plus one on each side."""
+    n = len(old)
+    lo = next((k for k in range(n) if old[k] != new[k]), n)
+    if lo == n:
+        return []
+    hi = next(k for k in range(n - 1, -1, -1) if old[k] != new[k])
+    return new[max(lo - 1, 0):min(hi + 2, n)]
+
+
+def random_greedy_tour(
+        costs: List[List[float]],
+        ancestors: List[int],
+        start: int,
+        rng: random.Random,
+        candidates: int = 3) -> List[int]:
+    """Nearest neighbour among the locations whose predecessors are visited, picked among the `candidates` nearest."""
+    tour, seen = [start], 1 << start
+    remaining = set(range(len(costs))) - {start}
+    while remaining:
+        available = sorted((v for v in remaining if not ancestors[v] & ~seen), key=lambda v: costs[tour[-1]][v])
+        v = rng.choice(available[:candidates])
+        tour.append(v)
+        seen |= 1 << v
+        remaining.discard(v)
+    return tour
+
+
+class LocalSearch:
+    """
+    Or-opt (move a segment of up to 3 locations) and 2-opt (reverse a segment) moves on an
+    open path with a fixed start, keeping the precedences. Only moves creating an arc to one
+    of the `neighbours` nearest locations are tried. Costs may be asymmetric: the cost of a
+    reversed segment comes from prefix sums of the backward arcs.
+    """
+    def __init__(self, costs: List[List[float]], ancestors: List[int], neighbours: int = NEIGHBOURS):
+        self.costs = costs
+        self.ancestors = ancestors
+        n = len(costs)
+        self.descendants = [0] * n
+        for v in range(n):
+            for u in range(n):
+                if ancestors[v] >> u & 1:
+                    self.descendants[u] |= 1 << v
+        # nearest successors of every location, and nearest predecessors
+        self.near_out = [sorted((j for j in range(n) if j != i), key=lambda j: costs[i][j])[:neighbours]
+                         for i in range(n)]
+        self.near_in = [sorted((i for i in range(n) if i != j), key=lambda i: costs[i][j])[:neighbours]
+                        for j in range(n)]
+
+    def improve(self, tour: List[int], deadline: float, active: Optional[List[int]] = None) -> List[int]:
+        """
+        Applies improving moves until none is left (a local optimum) or the deadline.
+        Only the `active` locations (default: all) are tried, then the ones around each move
+        ("don't look bits": the rest of the tour has already been tried).
+        """
+        queue = list(tour[1:] if active is None else active)
+        queued = set(queue)
+        position, prefix = self._index(tour)
+        while queue and time.time() < deadline:
+            v = queue.pop()
+            queued.discard(v)
+            i = position[v]
+            if i == 0:
+                continue
+            better = self._or_opt(tour, i, position, prefix) or self._two_opt(tour, i, position)
+            if better is None:
+                continue
+            for u in changed_region(tour, better) + [v]:
+                if u not in queued:
+                    queue.append(u)
+                    queued.add(u)
+            tour = better
+            position, prefix = self._index(tour)
+        return tour
+
+    @staticmethod
+    def _index(tour: List[int]) -> Tuple[List[int], List[int]]:
+        """The position of every location, and the locations before every position (bitmasks)."""
+        position = [0] * len(tour)
+        prefix = [0] * (len(tour) + 1)
+        for k, v in enumerate(tour):
+            position[v] = k
+            prefix[k + 1] = prefix[k] | 1 << v
+        return position, prefix
+
+    def _or_opt(self, tour: List[int], i: int, position: List[int], prefix: List[int]) -> Optional[List[int]]:
+        """Moves the segment starting at position i elsewhere, next to a neighbour of its ends."""
+        c, n = self.costs, len(tour)
+        for length in range(1, min(OR_OPT_MAX_LENGTH, n - i) + 1):
+            segment = tour[i:i + length]
+            a, b = segment[0], segment[-1]
+            prev = tour[i - 1]
+            nxt = tour[i + length] if i + length < n else None
+            removed = c[prev][a] + (c[b][nxt] - c[prev][nxt] if nxt is not None else 0.0)
+            segment_ancestors = segment_descendants = 0
+            for v in segment:
+                segment_ancestors |= self.ancestors[v]
+                segment_descendants |= self.descendants[v]
+            # insert after p: the arc tour[p] -> a, or b -> tour[p + 1]
+            after = {position[x] for x in self.near_in[a]} | {position[y] - 1 for y in self.near_out[b]}
+            for p in after:
+                if i - 1 <= p < i + length or p < 0:
+                    continue
+                if p < i - 1:
+                    # the segment passes tour[p + 1 .. i - 1], none may be its ancestor
+                    if (prefix[i] & ~prefix[p + 1]) & segment_ancestors:
+                        continue
+                elif (prefix[p + 1] & ~prefix[i + length]) & segment_descendants:
+                    # it passes tour[i + length .. p], none may be its descendant
+                    continue
+                x = tour[p]
+                y = tour[p + 1] if p + 1 < n else None
+                added = c[x][a] + (c[b][y] - c[x][y] if y is not None else 0.0)
+                if added < removed - 1e-9:
+                    if p < i - 1:
+                        return tour[:p + 1] + segment + tour[p + 1:i] + tour[i + length:]
+                    return tour[:i] + tour[i + length:p + 1] + segment + tour[p + 1:]
+        return None
+
+    def _two_opt(self, tour: List[int], i: int, position: List[int]) -> Optional[List[int]]:
+        """Reverses tour[i .. j], for the j that bring a neighbour right after tour[i - 1]."""
+        c, n = self.costs, len(tour)
+        # the longest segment from i without two ordered locations, it is the only one that can be reversed
+        inside, reach = 1 << tour[i], i
+        while reach + 1 < n and not self.ancestors[tour[reach + 1]] & inside:
+            reach += 1
+            inside |= 1 << tour[reach]
+        if reach == i:
+            return None
+        forward, backward = 0.0, 0.0
+        segment_forward, segment_backward = [0.0] * (reach + 1), [0.0] * (reach + 1)
+        for k in range(i + 1, reach + 1):
+            forward += c[tour[k - 1]][tour[k]]
+            backward += c[tour[k]][tour[k - 1]]
+            segment_forward[k], segment_backward[k] = forward, backward
+        for y in self.near_out[tour[i - 1]]:
+            j = position[y]
+            if not i < j <= reach:
+                continue
+            before = c[tour[i - 1]][tour[i]] + segment_forward[j]
+            after = c[tour[i - 1]][tour[j]] + segment_backward[j]
+            if j + 1 < n:
+                before += c[tour[j]][tour[j + 1]]
+                after += c[tour[i]][tour[j + 1]]
+            if after < before - 1e-9:
+                return tour[:i] + tour[i:j + 1][::-1] + tour[j + 1:]
+        return None
+
+    def kick(self, tour: List[int], rng: random.Random, moves: int = 2, window: int = KICK_WINDOW) -> List[int]:
+        """Random feasible moves of short segments to nearby positions, to leave a local optimum."""
+        n = len(tour)
+        for _ in range(moves):
+            length = rng.randint(1, min(OR_OPT_MAX_LENGTH, n - 1))
+            i = rng.randint(1, n - length)
+            segment = tour[i:i + length]
+            rest = tour[:i] + tour[i + length:]
+            p = rng.randint(max(1, i - window), min(len(rest), i + window))
+            candidate = rest[:p] + segment + rest[p:]
+            if is_feasible(candidate, self.ancestors):
+                tour = candidate
+        return tour
+
+
+class SharedBest:
+    """
+    The best tour of every worker, in shared memory: one slot per worker, written only by
+    it, so no lock is needed. A slot is [version, cost, tour...]: the version is odd while
+    the slot is written, a reader retries (skips) a slot that changed under it.
+    """
+    def __init__(self, name: str, workers: int, n: int):
+        self._memory = shared_memory.SharedMemory(name=name)
+        self.slots = np.ndarray((workers, n + 2), dtype=np.float64, buffer=self._memory.buf)
+
+    @staticmethod
+    def create(workers: int, n: int) -> shared_memory.SharedMemory:
+        memory = shared_memory.SharedMemory(create=True, size=workers * (n + 2) * 8)
+        slots = np.ndarray((workers, n + 2), dtype=np.float64, buffer=memory.buf)
+        slots[:, 0] = 0
+        slots[:, 1] = np.inf
+        return memory
+
+    def publish(self, slot: int, tour: List[int], cost: float):
+        row = self.slots[slot]
+        row[0] += 1
+        row[1] = cost
+        row[2:] = tour
+        row[0] += 1
+
+    def best(self) -> Optional[Tuple[List[int], float]]:
+        best = None
+        for row in self.slots:
+            version = row[0]
+            if version % 2:
+                continue
+            cost, tour = float(row[1]), row[2:].astype(int).tolist()
+            if row[0] != version or not np.isfinite(cost):
+                continue
+            if best is None or cost < best[1]:
+                best = (tour, cost)
+        return best
+
+    def close(self):
+        del self.slots
+        self._memory.close()
+
+
+def search_worker(
+        costs: List[List[float]],
+        ancestors: List[int],
+        start: int,
+        seed: int,
+        deadline: float,
+        shared_name: str,
+        slot: int,
+        workers: int) -> Tuple[List[int], float, int]:
+    """
+    One iterated local search: a randomized greedy tour, improved, then kicked and improved
+    again until the deadline, keeping the best. The best tour is published to the other
+    workers; a worker that falls behind the shared best for too long restarts from it.
+    Returns (tour, cost, kicks).
+    """
+    rng = random.Random(seed)
+    shared = SharedBest(shared_name, workers, len(costs))
+    try:
+        search = LocalSearch(costs, ancestors)
+        best = search.improve(random_greedy_tour(costs, ancestors, start, rng), deadline)
+        best_cost = path_cost(costs, best)
+        shared.publish(slot, best, best_cost)
+        kicks = stale = 0
+        while time.time() < deadline:
+            kicked = search.kick(best, rng)
+            candidate = search.improve(kicked, deadline, changed_region(best, kicked))
+            candidate_cost = path_cost(costs, candidate)
+            kicks += 1
+            stale += 1
+            if candidate_cost < best_cost - 1e-9:
+                best, best_cost, stale = candidate, candidate_cost, 0
+                shared.publish(slot, best, best_cost)
+            elif stale >= ADOPT_AFTER_KICKS:
+                shared_best = shared.best()
+                if shared_best is not None and shared_best[1] < best_cost - 1e-9:
+                    best, best_cost = shared_best
+                stale = 0
+        return best, best_cost, kicks
+    finally:
+        shared.close()
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """The worker processes, started on first use and kept (spawned: the server may run threads)."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers < workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+        _pool_workers = workers
+    return _pool
+
+
+@atexit.register
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def parallel_local_search(
+        presolve: RoutePresolve,
+        distances: Dict[Tuple[int, int], float],
+        time_budget: Optional[float] = None,
+        workers: Optional[int] = None,
+        seed: int = 0) -> HeuristicResult:
+    """
+    Best tour found by `workers` (default SOLVER_WORKERS) independently seeded local searches
+    within `time_budget` seconds (default SOLVER_TIME_BUDGET). With one worker the search
+    runs in this process, else on a process pool.
+    """
+    deadline = time.time() + (SOLVER_TIME_BUDGET if time_budget is None else time_budget)
+    workers = max(1, SOLVER_WORKERS if workers is None else workers)
+    locations = presolve.locations
+    costs = [[float(distances[(a, b)]) if a != b else 0.0 for b in locations] for a in locations]
+    memory = SharedBest.create(workers, len(locations))
+    try:
+        args = (costs, presolve.ancestors, presolve.start)
+        if workers == 1:
+            results = [search_worker(*args, seed, deadline, memory.name, 0, 1)]
+            bound = assignment_bound(costs, presolve)
+        else:
+            pool = get_pool(workers)
+            futures = [
+                pool.submit(search_worker, *args, seed + k, deadline, memory.name, k, workers)
+                for k in range(workers)
+            ]
+            # computed while the workers search
+            bound = assignment_bound(costs, presolve)
+            results = [f.result() for f in futures]
+    finally:
+        memory.close()
+        memory.unlink()
+    tour, cost, _ = min(results, key=lambda r: r[1])
+    return HeuristicResult(
+        tour=[locations[v] for v in tour],
+        cost=cost,
+        lower_bound=min(bound, cost),
+        workers=workers,
+        kicks=sum(r[2] for r in results)
+    )
@@ -1,13 +1,15 @@
 from abc import ABC
 from pydantic import BaseModel, Field, HttpUrl, field_validator, ConfigDict
-from typing import List, Optional, Dict, Tuple
-from supabase import Client
+from typing import TYPE_CHECKING, Any, List, Optional, Dict, Tuple
 from pydantic import TypeAdapter
 import json
 from pathlib import Path
-from pydantic import TypeAdapter
-import requests
-import os
+import numpy as np
+from utils.metrics import span
+from utils.backends import get_backend, get_mapbox_token
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 
 class Location(BaseModel, ABC):
@@ -46,15 +48,25 @@ class Attraction(Location):
 
 
     @classmethod
-    def get_random(cls, supabase: Client, count: int = 10) -> List["Attraction"]:
+    def get_random(cls, supabase: "Client", count: int = 10) -> List["Attraction"]:
         """
         Fetches random attractions from Supabase and returns them as 
         a list of Attraction instances.
         """
         response = supabase.rpc("get_random_attractions", {"limit_count": count}).execute()
-        
-        # 'cls' refers to the Attraction class itself
-        return [cls(**item) for item in response.data]
+        return cls.from_rows(response.data)
+
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]], trusted: bool = False) -> List["Attraction"]:
+        """
+        Decodes rows in bulk, with one TypeAdapter validation for the whole list.
+        `trusted` rows (written by save_list_to_json) are only constructed, not validated:
+        the URLs then stay strings.
+        """
+        if trusted:
+            return [cls.model_construct(**row) for row in rows]
+        return _ATTRACTION_LIST.validate_python(rows)
     
 
     @classmethod
@@ -62,11 +74,8 @@ class Attraction(Location):
         """
         Takes a list of Attraction objects and saves them to a JSON file.
         """
-        # We use a TypeAdapter to handle the list of objects efficiently
-        adapter = TypeAdapter(list["Attraction"])
-        
         # Convert to JSON bytes (using aliases so it matches your DB/JSON keys)
-        json_data = adapter.dump_json(attractions, by_alias=True, indent=4)
+        json_data = _ATTRACTION_LIST.dump_json(attractions, by_alias=True, indent=4)
         
         with open(filename, "wb") as f:
             f.write(json_data)
@@ -75,62 +84,136 @@ class Attraction(Location):
 
 
     @classmethod
-    def load_list_from_json(cls, filename: str = "locations.json") -> list["Attraction"]:
+    def load_list_from_json(cls, filename: str = "locations.json", trusted: bool = False) -> list["Attraction"]:
         """
-        Reads a JSON file and returns a list of Attraction objects.
+        Reads a JSON file and returns a list of Attraction objects,
+        parsed and validated in one pass (or only constructed if `trusted`).
         """
-        with open(filename, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return [cls(**item) for item in data]
-    
+        if trusted:
+            with open(filename, "r", encoding="utf-8") as f:
+                return cls.from_rows(json.load(f), trusted=True)
+        with open(filename, "rb") as f:
+            return _ATTRACTION_LIST.validate_json(f.read())
+
+
+_ATTRACTION_LIST = TypeAdapter(List[Attraction])
+
+
+# Mapbox Matrix API: at most 25 coordinates (sources and destinations together) per request
+MAPBOX_MATRIX_MAX_COORDINATES = 25
+# Layers of LocationDistanceMatrix.matrix
+DISTANCE, DURATION = 0, 1
+# Used to estimate the durations of a matrix cached without them (metres per second, ~60 km/h)
+ESTIMATED_SPEED_MPS = 16.7
+
 
 class LocationDistanceMatrix:
+    """
+    Distances (metres) and durations (seconds) between locations, as the two layers of one
+    (2, N, N) array: `matrix[DISTANCE]` and `matrix[DURATION]`.
+    Matrices cached before durations were fetched get durations estimated from the distances
+    (`durations_estimated` is then True).
+    """
     def __init__(self,
                  locations: List[Location],
                  filename=None
         ):
         self.locations: List[Location] = locations
+        # Coordinate columns: a LocationCatalogue (utils.catalogue) already has them
+        if hasattr(locations, "lats"):
+            ids, self.lats, self.lons = locations.ids.tolist(), locations.lats, locations.lons
+        else:
+            ids = [loc.id for loc in locations]
+            self.lats = np.array([loc.lat for loc in locations], dtype=np.float64)
+            self.lons = np.array([loc.lon for loc in locations], dtype=np.float64)
         # Create a lookup table to translate ID strings to matrix indices
-        self.id_to_index = {loc.id: i for i, loc in enumerate(locations)}
+        self.id_to_index = {location_id: i for i, location_id in enumerate(ids)}
+        self.durations_estimated = False
         if filename is None: 
-            self.distance_matrix_full: List[List[float]] = self._get_matrix_from_mapbox()
+            self.matrix: np.ndarray = self._get_matrix_from_mapbox()
         else:
-            self.distance_matrix_full: List[List[float]] = self._get_matrix_from_file(filename)
+            self.matrix: np.ndarray = self._get_matrix_from_file(filename)
+
+    @property
+    def distance_matrix_full(self) -> np.ndarray:
+        return self.matrix[DISTANCE]
+
+    @property
+    def duration_matrix_full(self) -> np.ndarray:
+        return self.matrix[DURATION]
 
-    def _get_coords_string(self) -> str:
+    def _get_coords_string(self, indices: Optional[List[int]] = None) -> str:
         """Formats locations into the Mapbox lng,lat;lng,lat format."""
-        return ";".join([f"{loc.lon},{loc.lat}" for loc in self.locations])
+        lons, lats = self.lons.tolist(), self.lats.tolist()
+        rows = range(len(lons)) if indices is None else indices
+        return ";".join([f"{lons[i]},{lats[i]}" for i in rows])
 
 
-    def _get_matrix_from_mapbox(self, profile: str = "mapbox/driving", use_curbside: bool = False):
+    def _get_matrix_from_mapbox(self, profile: str = "mapbox/driving", use_curbside: bool = False) -> np.ndarray:
         """
-        Queries Mapbox for the full matrix.
+        Queries Mapbox for the full matrix, distances and durations in the same calls.
+        Above 25 locations, the matrix is fetched in tiles: every request covers one block
+        of sources and one block of destinations.
         :param profile: mapbox/driving, mapbox/walking, mapbox/cycling
         :param use_curbside: If True, forces arrival on the right side of the road.
         """
-        access_token = os.getenv("MAPBOX_TOKEN")
-        if not access_token:
-            raise ValueError("MAPBOX_TOKEN not found in .env file.")
-        url = f"https://api.mapbox.com/directions-matrix/v1/{profile}/{self._get_coords_string()}"
-        params = {
-            "access_token": access_token,
-            "annotations": "distance",
-            "sources": "all",
-            "destinations": "all"
-        }
-        if use_curbside:
-            params["approaches"] = ";".join(["curbside"] * len(self.locations))
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        distances = response.json()["distances"]
-        assert len(distances) == len(self.locations)
-        return distances
+        access_token = get_mapbox_token()
+        n = len(self.locations)
+        if n <= MAPBOX_MATRIX_MAX_COORDINATES:
+            blocks = [list(range(n))]
+        else:
+            size = MAPBOX_MATRIX_MAX_COORDINATES // 2
+            blocks = [list(range(k, min(n, k + size))) for k in range(0, n, size)]
+
+        matrix = np.zeros((2, n, n), dtype=np.float64)
+        for sources in blocks:
+            for destinations in blocks:
+                indices = sources if sources is destinations else sources + destinations
+                params = {
+                    "access_token": access_token,
+                    "annotations": "distance,duration",
+                    "sources": ";".join(str(k) for k in range(len(sources))),
+                    "destinations": ";".join(str(indices.index(d)) for d in destinations)
+                }
+                if use_curbside:
+                    params["approaches"] = ";".join(["curbside"] * len(indices))
+                url = f"https://api.mapbox.com/directions-matrix/v1/{profile}/{self._get_coords_string(indices)}"
+                with span("mapbox_matrix"):
+                    response = get_backend("mapbox").get(url, params=params)
+                response.raise_for_status()
+                data = response.json()
+                block = np.ix_(sources, destinations)
+                # unreachable pairs come back as null
+                matrix[DISTANCE][block] = np.array(data["distances"], dtype=np.float64)
+                matrix[DURATION][block] = np.array(data["durations"], dtype=np.float64)
+        return matrix
       
 
-    def _get_matrix_from_file(self, filename):
-        with open(filename, "r", encoding="utf-8") as f:
-            raw_data = json.load(f)
-        return raw_data["distances"]
+    def _get_matrix_from_file(self, filename) -> np.ndarray:
+        if str(filename).endswith(".npy"):
+            # Memory-mapped: the workers share the pages of the same file
+            matrix = np.load(filename, mmap_mode="r")
+            if matrix.ndim == 3:
+                return matrix
+            distances = matrix
+        else:
+            with open(filename, "r", encoding="utf-8") as f:
+                raw_data = json.load(f)
+            if "durations" in raw_data:
+                return np.array([raw_data["distances"], raw_data["durations"]], dtype=np.float64)
+            distances = np.asarray(raw_data["distances"], dtype=np.float64)
+        self.durations_estimated = True
+        return np.stack([distances, distances / ESTIMATED_SPEED_MPS])
+
+
+    def save_to_json(self, filename: str):
+        """Caches the matrix in the format read by `filename=`, with both layers."""
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump({
+                "code": "Ok",
+                "distances": self.matrix[DISTANCE].tolist(),
+                "durations": self.matrix[DURATION].tolist()
+            }, f)
     
 
     def get_idx(self, location_id: int) -> int:
@@ -145,46 +228,68 @@ class LocationDistanceMatrix:
     def get_distance_between_ids(self, id1: int, id2: int):
         idx1 = self.get_idx(id1)
         idx2 = self.get_idx(id2)
-        return self.distance_matrix_full[idx1][idx2]
+        return float(self.matrix[DISTANCE, idx1, idx2])
+
+
+    def get_duration_between_ids(self, id1: int, id2: int):
+        idx1 = self.get_idx(id1)
+        idx2 = self.get_idx(id2)
+        return float(self.matrix[DURATION, idx1, idx2])
+
 
+    def get_distances_from(self, location_id: int) -> np.ndarray:
+        """The row of the matrix: distances from a location to every location, in `self.locations` order."""
+        return np.asarray(self.matrix[DISTANCE, self.get_idx(location_id)], dtype=float)
 
-    def get_sub_matrix(self, subset_location_ids: List[int]) -> List[List[float]]:
+
+    def get_sub_array(self, subset_location_ids: List[int], layer: int = DISTANCE) -> np.ndarray:
+        """The sub-matrix of a layer for a smaller list of locations, in a single fancy-indexing call."""
+        if self.matrix.size == 0:
+            raise ValueError("Distance matrix is empty. Load or fetch data first.")
+        indices = [self.get_idx(loc) for loc in subset_location_ids]
+        return np.asarray(self.matrix[layer][np.ix_(indices, indices)], dtype=float)
+
+
+    def get_sub_matrix(self, subset_location_ids: List[int], layer: int = DISTANCE) -> List[List[float]]:
         """
-        Generates a distance matrix for a smaller list of locations 
+        Generates a distance (or duration) matrix for a smaller list of locations 
         using the data from the existing larger matrix.
         """
-        if not self.distance_matrix_full:
-            raise ValueError("Distance matrix is empty. Load or fetch data first.")
-
-        new_matrix = []
-        for row_loc in subset_location_ids:
-            row_idx = self.get_idx(row_loc)
-            new_row = []
-            
-            for col_loc in subset_location_ids:
-                col_idx = self.get_idx(col_loc)
-                # Pluck the distance from the original 2D list
-                new_row.append(self.distance_matrix_full[row_idx][col_idx])
-            
-            new_matrix.append(new_row)
-            
-        return new_matrix
+        return self.get_sub_array(subset_location_ids, layer).tolist()
     
 
+    def get_cost_matrix_as_dict(
+            self,
+            subset_locations: List[int],
+            objective: str = "distance",
+            duration_weight: float = 0.0) -> Dict[Tuple[int, int], float]:
+        """
+        Returns a dictionary mapping (id, id) tuples to the cost of going from one to the other:
+        metres for "distance", seconds for "duration", and for "weighted"
+        metres + `duration_weight` * seconds (`duration_weight` in metres per second).
+        Ensures the diagonal (self-to-self) is 0.
+        """
+        if objective == "distance":
+            costs = self.get_sub_array(subset_locations, DISTANCE)
+        elif objective == "duration":
+            costs = self.get_sub_array(subset_locations, DURATION)
+        elif objective == "weighted":
+            costs = (self.get_sub_array(subset_locations, DISTANCE)
+                     + duration_weight * self.get_sub_array(subset_locations, DURATION))
+        else:
+            raise ValueError(f"Unknown objective {objective!r}, use distance, duration or weighted")
+        # Mapbox usually returns 0 for the diagonal, but we enforce it here
+        np.fill_diagonal(costs, 0.0)
+        return {
+            (loc_i, loc_j): cost
+            for loc_i, row in zip(subset_locations, costs.tolist())
+            for loc_j, cost in zip(subset_locations, row)
+        }
+
+
     def get_distance_matrix_as_dict(self, subset_locations: List[int]) -> Dict[Tuple[int, int], float]:
         """
         Returns a dictionary mapping (id, id) tuples to distances.
         Ensures the diagonal (self-to-self) is 0.
         """
-        sub_list = self.get_sub_matrix(subset_locations)
-        dist_dict = {}
-        
-        for i, loc_i in enumerate(subset_locations):
-            for j, loc_j in enumerate(subset_locations):
-                # Mapbox usually returns 0 for the diagonal, but we enforce it here
-                if i == j:
-                    dist_dict[(loc_i, loc_j)] = 0.0
-                else:
-                    dist_dict[(loc_i, loc_j)] = sub_list[i][j]
-                    
-        return dist_dict
\ No newline at end of file
+        return self.get_cost_matrix_as_dict(subset_locations, "distance")
@@ -0,0 +1,115 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+# Upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SPAN_METRIC = "plan42_span_duration_seconds"
+REQUEST_METRIC = "plan42_http_request_duration_seconds"
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram."""
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Histograms keyed by metric name and labels, rendered in the Prometheus text format."""
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, metric: str, labels: Dict[str, str], seconds: float):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(seconds)
+
+    def get(self, metric: str, **labels) -> Optional[Histogram]:
+        return self._histograms.get((metric, tuple(sorted(labels.items()))))
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+        current_metric = None
+        for (metric, labels), histogram in items:
+            if metric != current_metric:
+                lines.append(f"# TYPE {metric} histogram")
+                current_metric = metric
+            label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+            sep = "," if label_str else ""
+            cumulated = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulated += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{metric}_bucket{{{label_str}{sep}le="{le}"}} {cumulated}')
+            lines.append(f"{metric}_sum{{{label_str}}} {histogram.sum}")
+            lines.append(f"{metric}_count{{{label_str}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Spans recorded while serving the current request, for the Server-Timing header.
+# asyncio.to_thread copies the context, so spans in worker threads end up here too.
+_request_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+
+def start_request_spans() -> List[Tuple[str, float]]:
+    spans: List[Tuple[str, float]] = []
+    _request_spans.set(spans)
+    return spans
+
+
+@contextmanager
+def span(name: str):
+    """Times the block, and records it in the histograms and in the current request's spans."""
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t
+        registry.observe(SPAN_METRIC, {"span": name}, elapsed)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def timed(name: str):
+    """Decorator version of `span`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def server_timing_header(spans: List[Tuple[str, float]], total: Optional[float] = None) -> str:
+    """Formats spans as a Server-Timing header; repeated spans are summed."""
+    durations: Dict[str, float] = {}
+    for name, elapsed in spans:
+        durations[name] = durations.get(name, 0.0) + elapsed
+    if total is not None:
+        durations["total"] = total
+    return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in durations.items())
@@ -0,0 +1,488 @@
+"""
+Offline routing on an OpenStreetMap road extract, selected with MAPBOX_BACKEND=OSM.
+`python -m utils.osm_routing switzerland.osm osm_graph.npz` turns the extract into a
+compact graph file once; the backend then answers the Directions, Matrix and Isochrone
+APIs from it in-process, without network calls or quota.
+"""
+import argparse
+import heapq
+import math
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import shapely
+from shapely.geometry import MultiPoint
+from utils.geo import haversine_m
+from utils.standins import StandInResponse, parse_coordinates
+
+# The graph file built from the extract (see the command line at the bottom)
+OSM_GRAPH_FILE = os.environ.get("OSM_GRAPH_FILE", "osm_graph.npz")
+# Locations further than this from any road get Mapbox's "NoSegment" error
+OSM_MAX_SNAP_M = float(os.environ.get("OSM_MAX_SNAP_M", "5000"))
+# Landmarks of the A* lower bounds: more is faster queries, a bigger file and a longer build
+LANDMARKS = 8
+# Speed (km/h) of a road without a maxspeed tag. Other highway types are not driven on
+DEFAULT_SPEEDS_KMH = {
+    "motorway": 110, "motorway_link": 60,
+    "trunk": 90, "trunk_link": 50,
+    "primary": 80, "primary_link": 50,
+    "secondary": 70, "secondary_link": 40,
+    "tertiary": 60, "tertiary_link": 40,
+    "unclassified": 50, "road": 40, "residential": 30,
+    "living_street": 10, "service": 20,
+}
+NO_ACCESS = {"no", "private"}
+# Concavity of the isochrone around the reached roads (1: convex hull), and its margin in degrees (~100 m)
+ISOCHRONE_HULL_RATIO = 0.3
+ISOCHRONE_MARGIN_DEG = 0.001
+
+# (node refs, speed in m/s, direction: 1 along the refs, -1 against them, 0 both ways)
+Way = Tuple[List[int], float, int]
+
+
+def _is_drivable(tags: Dict[str, str]) -> bool:
+    return (
+        tags.get("highway") in DEFAULT_SPEEDS_KMH
+        and tags.get("area") != "yes"
+        and not any(tags.get(key) in NO_ACCESS for key in ("access", "motor_vehicle", "motorcar"))
+    )
+
+
+def _speed_mps(tags: Dict[str, str]) -> float:
+    maxspeed = tags.get("maxspeed", "")
+    number = re.match(r"\s*(\d+(?:\.\d+)?)", maxspeed)
+    if number and float(number.group(1)) > 0:
+        kmh = float(number.group(1)) * (1.609344 if "mph" in maxspeed else 1.0)
+    else:
+        kmh = DEFAULT_SPEEDS_KMH[tags["highway"]]
+    return kmh / 3.6
+
+
+def _direction(tags: Dict[str, str]) -> int:
+    oneway = tags.get("oneway", "")
+    if oneway in ("-1", "reverse"):
+        return -1
+    if oneway in ("yes", "true", "1"):
+        return 1
+    if oneway == "no":
+        return 0
+    implied = tags["highway"] in ("motorway", "motorway_link") or tags.get("junction") in ("roundabout", "circular")
+    return 1 if implied else 0
+
+
+def _elements(path: str, tag: str) -> Iterator[ET.Element]:
+    """The top-level elements of an OSM XML file with this tag, freed once used."""
+    root = None
+    for event, element in ET.iterparse(path, events=("start", "end")):
+        if root is None:
+            root = element
+        elif event == "end" and element.tag in ("node", "way", "relation"):
+            if element.tag == tag:
+                yield element
+            root.clear()
+
+
+def read_ways(path: str) -> List[Way]:
+    ways = []
+    for element in _elements(path, "way"):
+        tags = {t.get("k"): t.get("v") for t in element.iter("tag")}
+        if _is_drivable(tags):
+            refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+            if len(refs) >= 2:
+                ways.append((refs, _speed_mps(tags), _direction(tags)))
+    return ways
+
+
+def read_nodes(path: str, wanted: set) -> Dict[int, Tuple[float, float]]:
+    """(lon, lat) of the wanted nodes."""
+    coords = {}
+    for element in _elements(path, "node"):
+        node_id = int(element.get("id"))
+        if node_id in wanted:
+            coords[node_id] = (float(element.get("lon")), float(element.get("lat")))
+    return coords
+
+
+def _reverse_csr(indptr: np.ndarray, heads: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The incoming edges of every node: (indptr, tails, edge ids) of the reversed graph."""
+    n = len(indptr) - 1
+    order = np.argsort(heads, kind="stable")
+    tails = np.repeat(np.arange(n), np.diff(indptr))
+    return np.concatenate([[0], np.cumsum(np.bincount(heads, minlength=n))]).astype(np.int64), tails[order], order
+
+
+def _dijkstra_all(indptr: np.ndarray, heads: np.ndarray, weights: np.ndarray, source: int) -> np.ndarray:
+    """Durations from the source to every node (inf when unreachable). Only used by the build."""
+    indptr, heads, weights = indptr.tolist(), heads.tolist(), weights.tolist()
+    best = {source: 0.0}
+    done = [False] * (len(indptr) - 1)
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if done[u]:
+            continue
+        done[u] = True
+        for k in range(indptr[u], indptr[u + 1]):
+            v, nd = heads[k], d + weights[k]
+            if nd < best.get(v, math.inf):
+                best[v] = nd
+                heapq.heappush(heap, (nd, v))
+    result = np.full(len(done), np.inf)
+    result[list(best)] = list(best.values())
+    return result
+
+
+class RoadGraph:
+    """
+    The drivable roads of an extract in compressed sparse row form. Only the junctions
+    are nodes: the road points between two junctions are the geometry of one edge.
+    Durations (s) are the weights, lengths (m) are summed along the fastest path.
+
+    Preprocessing: besides the chain contraction, the durations from and to a few
+    far-apart landmarks give every query an A* lower bound (ALT), so a point-to-point
+    search only settles the nodes towards its target.
+    """
+    ARRAYS = (
+        "lon", "lat", "indptr", "heads", "length", "duration", "segment", "reverse",
+        "segment_ptr", "points", "routable", "landmark_from", "landmark_to",
+    )
+
+    def __init__(self, **arrays: np.ndarray):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        # The searches run on lists: indexing them is much faster than numpy scalars
+        self._indptr, self._heads = self.indptr.tolist(), self.heads.tolist()
+        self._duration = self.duration.tolist()
+        self._tails = np.repeat(np.arange(len(self.lon)), np.diff(self.indptr)).tolist()
+        self._snap_nodes = np.flatnonzero(self.routable)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.lon)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.heads)
+
+    @classmethod
+    def from_osm(cls, path: str, landmarks: int = LANDMARKS) -> "RoadGraph":
+        ways = read_ways(path)
+        coords = read_nodes(path, {ref for refs, _, _ in ways for ref in refs})
+        return cls.from_ways(ways, coords, landmarks)
+
+    @classmethod
+    def from_ways(cls, ways: Sequence[Way], coords: Dict[int, Tuple[float, float]],
+                  landmarks: int = LANDMARKS) -> "RoadGraph":
+        # Ways clipped at the border of the extract are cut where their nodes are missing
+        pieces = []
+        for refs, speed, direction in ways:
+            run = []
+            for ref in refs + [None]:
+                if ref is not None and ref in coords:
+                    run.append(ref)
+                    continue
+                if len(run) >= 2:
+                    pieces.append((run, speed, direction))
+                run = []
+        # Junctions: way ends, and nodes shared by several ways (or twice by one)
+        uses = Counter(ref for refs, _, _ in pieces for ref in refs)
+        uses.update(ref for refs, _, _ in pieces for ref in (refs[0], refs[-1]))
+        junctions: Dict[int, int] = {}
+
+        def junction(ref: int) -> int:
+            return junctions.setdefault(ref, len(junctions))
+
+        tails, heads, lengths, durations, segments, reverse = [], [], [], [], [], []
+        segment_points: List[np.ndarray] = []
+        for refs, speed, direction in pieces:
+            start = 0
+            for k in range(1, len(refs)):
+                if uses[refs[k]] < 2:
+                    continue
+                a, b = junction(refs[start]), junction(refs[k])
+                points = np.array([coords[ref] for ref in refs[start:k + 1]], dtype=np.float64)
+                start = k
+                if a == b:
+                    continue
+                length = float(haversine_m(points[:-1, 1], points[:-1, 0], points[1:, 1], points[1:, 0]).sum())
+                for tail, head, backwards in ((a, b, False), (b, a, True)):
+                    if direction == (1 if backwards else -1):
+                        continue
+                    tails.append(tail)
+                    heads.append(head)
+                    lengths.append(length)
+                    durations.append(length / speed)
+                    segments.append(len(segment_points))
+                    reverse.append(backwards)
+                segment_points.append(points)
+
+        n = len(junctions)
+        lon_lat = np.array([coords[ref] for ref in junctions], dtype=np.float64).reshape(-1, 2)
+        tails = np.asarray(tails, dtype=np.int64)
+        order = np.argsort(tails, kind="stable")
+        arrays = {
+            "lon": lon_lat[:, 0],
+            "lat": lon_lat[:, 1],
+            "indptr": np.concatenate([[0], np.cumsum(np.bincount(tails, minlength=n))]).astype(np.int64),
+            "heads": np.asarray(heads, dtype=np.int64)[order],
+            "length": np.asarray(lengths, dtype=np.float64)[order],
+            "duration": np.asarray(durations, dtype=np.float64)[order],
+            "segment": np.asarray(segments, dtype=np.int64)[order],
+            "reverse": np.asarray(reverse, dtype=bool)[order],
+            "segment_ptr": np.concatenate([[0], np.cumsum([len(p) for p in segment_points])]).astype(np.int64),
+            "points": np.concatenate(segment_points) if segment_points else np.zeros((0, 2)),
+        }
+        arrays["routable"], arrays["landmark_from"], arrays["landmark_to"] = cls._preprocess(arrays, landmarks)
+        return cls(**arrays)
+
+    @staticmethod
+    def _preprocess(arrays: Dict[str, np.ndarray], landmarks: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The routable nodes (the strongly connected part of the network around its best
+        connected node: parking lots and clipped roads are left out), and the durations
+        from and to landmarks picked one by one as far as possible from the previous ones.
+        """
+        indptr, heads, duration = arrays["indptr"], arrays["heads"], arrays["duration"]
+        n = len(indptr) - 1
+        if n == 0:
+            return np.zeros(0, dtype=bool), np.zeros((0, 0)), np.zeros((0, 0))
+        rev_indptr, rev_heads, order = _reverse_csr(indptr, heads)
+        rev_duration = duration[order]
+
+        root = int(np.argmax(np.diff(indptr)))
+        routable = np.isfinite(_dijkstra_all(indptr, heads, duration, root))
+        routable &= np.isfinite(_dijkstra_all(rev_indptr, rev_heads, rev_duration, root))
+
+        landmark_from, landmark_to = [], []
+        nearest = np.where(routable, np.inf, -np.inf)
+        # The first landmark is the node farthest from the root
+        candidate = int(np.argmax(np.where(routable, _dijkstra_all(indptr, heads, duration, root), -np.inf)))
+        for _ in range(min(landmarks, int(routable.sum()))):
+            from_landmark = _dijkstra_all(indptr, heads, duration, candidate)
+            to_landmark = _dijkstra_all(rev_indptr, rev_heads, rev_duration, candidate)
+            landmark_from.append(from_landmark)
+            landmark_to.append(to_landmark)
+            nearest = np.minimum(nearest, np.where(routable, from_landmark + to_landmark, -np.inf))
+            candidate = int(np.argmax(nearest))
+        return routable, np.array(landmark_from).reshape(-1, n), np.array(landmark_to).reshape(-1, n)
+
+    def save(self, path: str):
+        np.savez_compressed(path, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in cls.ARRAYS})
+
+    def snap(self, lon: float, lat: float) -> Tuple[int, float]:
+        """The routable junction nearest to a point, and its distance in metres."""
+        if len(self._snap_nodes) == 0:
+            return -1, math.inf
+        scale = math.cos(math.radians(lat))
+        nodes = self._snap_nodes
+        k = int(np.argmin(((self.lon[nodes] - lon) * scale) ** 2 + (self.lat[nodes] - lat) ** 2))
+        node = int(nodes[k])
+        return node, float(haversine_m(lat, lon, self.lat[node], self.lon[node]))
+
+    def settle(self, source: int, pred: Optional[Dict[int, int]] = None, heuristic: Optional[List[float]] = None,
+               limit: float = math.inf) -> Iterator[Tuple[int, float]]:
+        """
+        Dijkstra (A* with a heuristic) from a node: yields the nodes in the order they are
+        settled, with their duration. `pred` gets the edge each node was reached by.
+        Stop iterating to stop the search.
+        """
+        indptr, heads, duration = self._indptr, self._heads, self._duration
+        best = {source: 0.0}
+        if pred is not None:
+            pred[source] = -1
+        done = set()
+        heap = [(0.0, 0.0, source)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            yield u, d
+            for e in range(indptr[u], indptr[u + 1]):
+                v, nd = heads[e], d + duration[e]
+                if nd <= limit and nd < best.get(v, math.inf):
+                    best[v] = nd
+                    if pred is not None:
+                        pred[v] = e
+                    heapq.heappush(heap, (nd + heuristic[v] if heuristic is not None else nd, nd, v))
+
+    def lower_bounds(self, target: int) -> List[float]:
+        """Duration lower bounds from every node to the target, by the triangle inequality over the landmarks."""
+        if len(self.landmark_from) == 0:
+            return [0.0] * self.node_count
+        with np.errstate(invalid="ignore"):
+            bounds = np.maximum(
+                (self.landmark_from[:, target, None] - self.landmark_from).max(axis=0),
+                (self.landmark_to - self.landmark_to[:, target, None]).max(axis=0),
+            )
+        # Unreachable landmarks give no bound; the margin absorbs the rounding of the sums
+        return np.nan_to_num(np.maximum(bounds - 1e-6, 0.0), nan=0.0, posinf=0.0).tolist()
+
+    def path_edges(self, pred: Dict[int, int], node: int) -> List[int]:
+        edges = []
+        while pred[node] != -1:
+            e = pred[node]
+            edges.append(e)
+            node = self._tails[e]
+        return edges[::-1]
+
+    def route(self, source: int, target: int) -> Optional[Tuple[float, float, List[int]]]:
+        """(duration, distance, edges) of the fastest path, None when there is none."""
+        pred: Dict[int, int] = {}
+        for node, duration in self.settle(source, pred, heuristic=self.lower_bounds(target)):
+            if node == target:
+                edges = self.path_edges(pred, target)
+                return duration, float(self.length[edges].sum()), edges
+        return None
+
+    def one_to_many(self, source: int, targets: Sequence[int]) -> Dict[int, Tuple[float, float]]:
+        """(duration, distance) of the fastest paths to the targets reached, in one search."""
+        pred: Dict[int, int] = {}
+        remaining, found = set(targets), {}
+        if not remaining:
+            return found
+        for node, duration in self.settle(source, pred):
+            if node in remaining:
+                found[node] = (duration, float(self.length[self.path_edges(pred, node)].sum()))
+                remaining.discard(node)
+                if not remaining:
+                    break
+        return found
+
+    def reachable(self, source: int, max_duration: float) -> np.ndarray:
+        """The (lon, lat) road points reached within max_duration: the junctions and the roads to them."""
+        pred: Dict[int, int] = {}
+        nodes = [node for node, _ in self.settle(source, pred, limit=max_duration)]
+        pieces = [np.array([[self.lon[source], self.lat[source]]])]
+        pieces += [self.edge_points(pred[node]) for node in nodes if pred[node] != -1]
+        return np.concatenate(pieces)
+
+    def edge_points(self, edge: int) -> np.ndarray:
+        s = self.segment[edge]
+        points = self.points[self.segment_ptr[s]:self.segment_ptr[s + 1]]
+        return points[::-1] if self.reverse[edge] else points
+
+    def path_coordinates(self, source: int, edges: List[int]) -> List[List[float]]:
+        if not edges:
+            point = [float(self.lon[source]), float(self.lat[source])]
+            return [point, point]
+        line = np.concatenate([self.edge_points(e)[(1 if k else 0):] for k, e in enumerate(edges)])
+        return line.tolist()
+
+
+class OsmMapbox:
+    """
+    Answers the Directions, Matrix and Isochrone APIs like `requests.get` would, from a
+    RoadGraph (OSM_GRAPH_FILE). Locations are snapped to the nearest routable junction;
+    routes are the fastest, with OSM maxspeeds or DEFAULT_SPEEDS_KMH.
+    """
+    def __init__(self, graph: Optional[RoadGraph] = None):
+        if graph is None:
+            if not os.path.exists(OSM_GRAPH_FILE):
+                raise ValueError(
+                    f"OSM graph {OSM_GRAPH_FILE} not found, build it with `python -m utils.osm_routing <extract.osm> "
+                    f"{OSM_GRAPH_FILE}` or set OSM_GRAPH_FILE"
+                )
+            graph = RoadGraph.load(OSM_GRAPH_FILE)
+        self.graph = graph
+
+    def get(self, url: str, params: Optional[dict] = None, timeout: Optional[float] = None) -> StandInResponse:
+        params = params or {}
+        path = url.split("api.mapbox.com", 1)[-1]
+        service, _, rest = path.strip("/").partition("/")
+        coordinates = parse_coordinates(rest.rsplit("/", 1)[-1])
+        snapped = [self.graph.snap(lon, lat) for lon, lat in coordinates]
+        too_far = next((k for k, (_, distance) in enumerate(snapped) if distance > OSM_MAX_SNAP_M), None)
+        if too_far is not None:
+            return StandInResponse({
+                "code": "NoSegment",
+                "message": f"Could not find a road near coordinate {too_far}"
+            }, status_code=422)
+        nodes = [node for node, _ in snapped]
+        if service == "directions":
+            return self.directions(nodes, snapped)
+        if service == "directions-matrix":
+            return self.matrix(nodes, params)
+        if service == "isochrone":
+            return self.isochrone(nodes[0], params)
+        return StandInResponse({"message": f"Not Found: {service}"}, status_code=404)
+
+    def directions(self, nodes: List[int], snapped: List[Tuple[int, float]]) -> StandInResponse:
+        if len(nodes) != 2:
+            return StandInResponse({"message": "OSM directions take two coordinates"}, status_code=422)
+        found = self.graph.route(*nodes)
+        if found is None:
+            return StandInResponse({"code": "NoRoute", "message": "No route found"}, status_code=422)
+        duration, distance, edges = found
+        return StandInResponse({
+            "routes": [{
+                "weight_name": "auto",
+                "weight": duration,
+                "duration": duration,
+                "distance": distance,
+                "legs": [{"summary": "osm", "steps": [], "distance": distance, "duration": duration}],
+                "geometry": {"type": "LineString", "coordinates": self.graph.path_coordinates(nodes[0], edges)}
+            }],
+            "waypoints": [
+                {"name": "", "location": [float(self.graph.lon[node]), float(self.graph.lat[node])], "distance": snap}
+                for node, snap in snapped
+            ],
+            "code": "Ok",
+            "uuid": "osm"
+        })
+
+    def matrix(self, nodes: List[int], params: dict) -> StandInResponse:
+        def indices(key):
+            value = params.get(key, "all")
+            return list(range(len(nodes))) if value == "all" else [int(k) for k in value.split(";")]
+        sources, destinations = indices("sources"), indices("destinations")
+        distances, durations = [], []
+        for i in sources:
+            found = self.graph.one_to_many(nodes[i], [nodes[j] for j in destinations])
+            # Unreachable pairs are null, like Mapbox's
+            row = [found.get(nodes[j], (None, None)) for j in destinations]
+            durations.append([d for d, _ in row])
+            distances.append([m for _, m in row])
+        return StandInResponse({"code": "Ok", "distances": distances, "durations": durations})
+
+    def isochrone(self, node: int, params: dict) -> StandInResponse:
+        minutes = float(str(params.get("contours_minutes", 5)).split(",")[0])
+        points = self.graph.reachable(node, minutes * 60)
+        hull = shapely.concave_hull(MultiPoint(points), ratio=ISOCHRONE_HULL_RATIO)
+        polygon = hull.buffer(ISOCHRONE_MARGIN_DEG, quad_segs=4)
+        return StandInResponse({
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "properties": {"contour": minutes},
+                "geometry": {"type": "Polygon", "coordinates": [[list(c) for c in polygon.exterior.coords]]}
+            }]
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the graph file of MAPBOX_BACKEND=OSM from an OSM XML extract.")
+    parser.add_argument("extract", help="OSM XML file (convert a .pbf with `osmium cat extract.osm.pbf -o extract.osm`)")
+    parser.add_argument("output", nargs="?", default=OSM_GRAPH_FILE, help=f"graph file (default {OSM_GRAPH_FILE})")
+    parser.add_argument("--landmarks", type=int, default=LANDMARKS, help=f"A* landmarks (default {LANDMARKS})")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    graph = RoadGraph.from_osm(args.extract, args.landmarks)
+    graph.save(args.output)
+    print(
+        f"{graph.node_count} junctions ({int(graph.routable.sum())} routable), {graph.edge_count} edges, "
+        f"{len(graph.points)} road points -> {args.output} in {time.perf_counter() - start:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,5 @@
-from typing import List, Tuple, Optional
-from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
 from pydantic import BaseModel, Field
-from utils.location import Location
 
 class Precedence(BaseModel):
     """
@@ -32,52 +30,167 @@ def check_starting_point_in_precedences(
     return True, None  # all good
 
 
-def check_precedence_validity(precedences: List[Precedence]) -> Tuple[bool, Optional[List[Location]]]:
+class PrecedenceGraph:
+    """
+    Precedences as a DAG that keeps a topological order up to date while edges are added
+    (Pearce-Kelly dynamic topological sort). An insertion only visits the nodes whose
+    position lies between the two endpoints, and is rejected if it would close a cycle.
+    Everything is iterative, long precedence chains are not limited by the recursion depth.
+    The agent state keeps it as a plain dict (`to_dict` / `from_dict`): the positions as they
+    are, without sorting, and the edges.
+    """
+    def __init__(self, positions: Optional[Dict[int, int]] = None, edges: Iterable[Sequence[int]] = ()):
+        self.position: Dict[int, int] = dict(positions or {})  # node -> position in the topological order
+        self.successors: Dict[int, Set[int]] = {node: set() for node in self.position}
+        self.predecessors: Dict[int, Set[int]] = {node: set() for node in self.position}
+        for before, after in edges:
+            self.successors[before].add(after)
+            self.predecessors[after].add(before)
+        self._next_position = max(self.position.values(), default=-1) + 1
+        self._first_position = min(self.position.values(), default=0) - 1
+
+    def add_node(self, node: int, first: bool = False):
+        """New nodes go last in the order, or first with `first`."""
+        if node not in self.position:
+            if first:
+                self.position[node] = self._first_position
+                self._first_position -= 1
+            else:
+                self.position[node] = self._next_position
+                self._next_position += 1
+            self.successors[node] = set()
+            self.predecessors[node] = set()
+
+    def edges(self) -> List[Tuple[int, int]]:
+        return [(a, b) for a in self.topological_order() for b in sorted(self.successors[a])]
+
+    def topological_order(self) -> List[int]:
+        return sorted(self.position, key=self.position.get)
+
+    def add_edge(self, before: int, after: int) -> Optional[List[int]]:
+        """
+        Adds the precedence `before` -> `after`.
+        Returns None, or the cycle it would close (e.g. [1, 2, 3, 1]), in which case nothing is added.
+        """
+        if before == after:
+            return [before, before]
+        # a new node needs no reordering: `before` goes first, `after` last
+        self.add_node(before, first=True)
+        self.add_node(after)
+        if after in self.successors[before]:
+            return None
+        lower, upper = self.position[after], self.position[before]
+        if lower < upper:
+            forward, cycle = self._forward(after, upper, before)
+            if cycle is not None:
+                return [before] + cycle
+            backward = self._backward(before, lower)
+            self._reorder(backward, forward)
+        self.successors[before].add(after)
+        self.predecessors[after].add(before)
+        return None
+
+    def remove_edge(self, before: int, after: int):
+        """
+        Removing an edge never invalidates the topological order.
+        An endpoint left without any precedence is dropped from the graph.
+        """
+        self.successors.get(before, set()).discard(after)
+        self.predecessors.get(after, set()).discard(before)
+        self._drop_if_isolated(before)
+        self._drop_if_isolated(after)
+
+    def _drop_if_isolated(self, node: int):
+        if node in self.position and not self.successors[node] and not self.predecessors[node]:
+            del self.position[node], self.successors[node], self.predecessors[node]
+
+    def _forward(self, start: int, upper: int, target: int) -> Tuple[List[int], Optional[List[int]]]:
+        """Nodes reachable from `start` up to position `upper`, or the path to `target` if there is one."""
+        parent: Dict[int, Optional[int]] = {start: None}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for m in self.successors[node]:
+                if m == target:
+                    path = [target, node]
+                    while parent[path[-1]] is not None:
+                        path.append(parent[path[-1]])
+                    return [], path[::-1]
+                if m not in parent and self.position[m] < upper:
+                    parent[m] = node
+                    stack.append(m)
+        return list(parent), None
+
+    def _backward(self, start: int, lower: int) -> List[int]:
+        """Nodes that reach `start`, down to position `lower`."""
+        visited = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for m in self.predecessors[node]:
+                if m not in visited and self.position[m] > lower:
+                    visited.add(m)
+                    stack.append(m)
+        return list(visited)
+
+    def _reorder(self, backward: List[int], forward: List[int]):
+        """Moves the `backward` nodes before the `forward` ones, reusing their positions."""
+        backward.sort(key=self.position.get)
+        forward.sort(key=self.position.get)
+        positions = sorted(self.position[n] for n in backward + forward)
+        for node, position in zip(backward + forward, positions):
+            self.position[node] = position
+
+    def sync(self, precedences: List[Precedence]) -> Optional[List[int]]:
+        """
+        Makes the edges match `precedences`: the removed ones are dropped, only the new ones
+        are inserted. Returns the first cycle found, or None; after a cycle the graph is left
+        with the edges it had.
+        """
+        wanted = [(p.visit_location_before, p.visit_location_after) for p in precedences]
+        wanted_set = set(wanted)
+        current = {(a, b) for a, after in self.successors.items() for b in after}
+        removed = [edge for edge in current if edge not in wanted_set]
+        for edge in removed:
+            self.remove_edge(*edge)
+        added: List[Tuple[int, int]] = []
+        for before, after in wanted:
+            if (before, after) in current:
+                continue
+            cycle = self.add_edge(before, after)
+            if cycle is not None:
+                for edge in added:
+                    self.remove_edge(*edge)
+                self._drop_if_isolated(before)
+                self._drop_if_isolated(after)
+                for edge in removed:
+                    self.add_edge(*edge)
+                return cycle
+            added.append((before, after))
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "positions": dict(self.position),
+            "edges": [[a, b] for a, after in self.successors.items() for b in sorted(after)],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "PrecedenceGraph":
+        """A new graph from one saved with `to_dict`, the stored positions are trusted."""
+        if not data:
+            return cls()
+        return cls(data["positions"], data["edges"])
+
+
+def check_precedence_validity(precedences: List[Precedence]) -> Tuple[bool, Optional[List[int]]]:
     """
     Checks if the precedence constraints are valid (no cycles).
     Returns (True, None) if valid, or (False, cycle_list) if invalid.
     """
-    graph = defaultdict(list)
-    nodes = set()
-
-    # Build graph
-    for p in precedences:
-        before, after = p.visit_location_before, p.visit_location_after
-        graph[before].append(after)
-        nodes.update([before, after])
-
-    visited = set()
-    stack = set()
-    path = []
-
-    def dfs(node):
-        visited.add(node)
-        stack.add(node)
-        path.append(node)
-
-        for neighbor in graph[node]:
-            if neighbor not in visited:
-                if dfs(neighbor):
-                    return True
-            elif neighbor in stack:
-                # Cycle found → reconstruct cycle
-                cycle_start = path.index(neighbor)
-                cycle = path[cycle_start:]
-                cycle.append(neighbor)  # close the loop
-                nonlocal found_cycle
-                found_cycle = cycle
-                return True
-
-        stack.remove(node)
-        path.pop()
-        return False
-
-    found_cycle = None
-    for node in nodes:
-        if node not in visited:
-            if dfs(node):
-                return False, found_cycle
-
+    cycle = PrecedenceGraph().sync(precedences)
+    if cycle is not None:
+        return False, cycle
     return True, None
 
 
@@ -0,0 +1,117 @@
+from typing import Dict, List, Optional, Tuple
+from utils.precedence import PrecedenceGraph
+from utils.metrics import timed
+
+# Held-Karp states (subset, last location) explored before giving up on the DP
+DP_MAX_STATES = 100_000
+
+
+class RoutePresolve:
+    """
+    What the precedences imply for a route that starts at `starting_point` and visits
+    every location once: the transitive closure (as bitmasks over `route_locations`),
+    the earliest and latest position of every location, the forced positions,
+    and the arcs i -> j that can never be used.
+    The starting point precedes every other location.
+    """
+    def __init__(self, route_locations: List[int], starting_point: int, graph: PrecedenceGraph):
+        self.locations = route_locations
+        self.index = {loc: k for k, loc in enumerate(route_locations)}
+        self.start = self.index[starting_point]
+        n = len(route_locations)
+        self.ancestors = self._closure(graph, n)
+        self.descendants = [0] * n
+        for v in range(n):
+            for u in _bits(self.ancestors[v]):
+                self.descendants[u] |= 1 << v
+        self.earliest = [bin(a).count("1") for a in self.ancestors]
+        self.latest = [n - 1 - bin(d).count("1") for d in self.descendants]
+        self.fixed = {route_locations[v]: self.earliest[v] for v in range(n) if self.earliest[v] == self.latest[v]}
+
+    def _closure(self, graph: PrecedenceGraph, n: int) -> List[int]:
+        """Ancestors of every location, in topological order so that each one is final when used."""
+        ancestors = [0] * n
+        in_route = [loc for loc in graph.topological_order() if loc in self.index]
+        for loc in in_route:
+            v = self.index[loc]
+            for before in graph.predecessors[loc]:
+                if before in self.index:
+                    u = self.index[before]
+                    ancestors[v] |= ancestors[u] | (1 << u)
+        # Precedences through locations that are not in the route are ignored, like in the model
+        start_bit = 1 << self.start
+        for v in range(n):
+            if v != self.start:
+                ancestors[v] |= start_bit | ancestors[self.start]
+        return ancestors
+
+    def is_feasible(self) -> bool:
+        """False when a location has to precede the starting point."""
+        return self.ancestors[self.start] == 0
+
+    def arc_possible(self, i: int, j: int) -> bool:
+        """Whether location j can directly follow location i."""
+        a, b = self.index[i], self.index[j]
+        if a == b or b == self.start:
+            return False
+        if self.ancestors[a] >> b & 1:
+            return False  # j has to come before i
+        if self.descendants[a] & self.ancestors[b]:
+            return False  # something has to come between i and j
+        return self.earliest[b] <= self.latest[a] + 1 and self.earliest[a] + 1 <= self.latest[b]
+
+    def possible_arcs(self) -> List[Tuple[int, int]]:
+        return [(i, j) for i in self.locations for j in self.locations if self.arc_possible(i, j)]
+
+
+@timed("presolve_dp")
+def shortest_ordered_path(
+        presolve: RoutePresolve,
+        distances: Dict[Tuple[int, int], float],
+        max_states: int = DP_MAX_STATES) -> Optional[Tuple[List[int], float]]:
+    """
+    Exact shortest path from the starting point through every location, respecting the
+    precedences: Held-Karp restricted to precedence-closed subsets, which are few when
+    the precedences fix most of the order.
+    Returns (path, distance), or None if more than `max_states` states would be needed.
+    """
+    locations = presolve.locations
+    n = len(locations)
+    ancestors = presolve.ancestors
+    # layers[k]: (subset, last) -> (distance, previous last), for subsets of k + 1 locations
+    layers: List[Dict[Tuple[int, int], Tuple[float, int]]] = [{(1 << presolve.start, presolve.start): (0.0, -1)}]
+    states = 1
+    for _ in range(n - 1):
+        layer: Dict[Tuple[int, int], Tuple[float, int]] = {}
+        for (subset, last), (cost, _) in layers[-1].items():
+            if states + len(layer) > max_states:
+                return None
+            for v in range(n):
+                if subset >> v & 1 or ancestors[v] & ~subset:
+                    continue
+                key = (subset | 1 << v, v)
+                candidate = cost + distances[(locations[last], locations[v])]
+                if key not in layer or candidate < layer[key][0]:
+                    layer[key] = (candidate, last)
+        states += len(layer)
+        if not layer:
+            return None  # infeasible precedences
+        layers.append(layer)
+
+    (subset, last), (cost, _) = min(layers[-1].items(), key=lambda item: item[1][0])
+    path = []
+    for layer in reversed(layers):
+        path.append(locations[last])
+        previous = layer[(subset, last)][1]
+        subset &= ~(1 << last)
+        last = previous
+    return path[::-1], cost
+
+
+def _bits(mask: int) -> List[int]:
+    bits = []
+    while mask:
+        low = mask & -mask
+        bits.append(low.bit_length() - 1)
+        mask ^= low
+    return bits
@@ -0,0 +1,142 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+# A frame is identified by (function name, file, first line)
+Frame = Tuple[str, str, int]
+
+
+# Leaf frame of an idle ThreadPoolExecutor worker (asyncio.to_thread, LangGraph's ToolNode)
+IDLE_WORKER = ("_worker", os.path.join("concurrent", "futures", "thread.py"))
+
+
+class SamplingProfiler:
+    """
+    Low-overhead sampling profiler: a background thread records the stacks of the
+    running threads every `interval` seconds (no tracing hooks on the hot path).
+    Every thread is sampled, under a root frame with its name, so the work moved off the
+    event loop (asyncio.to_thread, the agent's tool threads) shows up; idle pool workers
+    are left out. With `thread_id`, only that thread is sampled.
+    The other requests served meanwhile are sampled too, keep that in mind when reading a profile.
+    """
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()  # stack (root first) -> number of samples
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        sampler = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frames = {self.thread_id: frames[self.thread_id]} if self.thread_id in frames else {}
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id == sampler:
+                    continue
+                code = frame.f_code
+                if code.co_name == IDLE_WORKER[0] and code.co_filename.endswith(IDLE_WORKER[1]):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_qualname, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.append((f"thread {names.get(thread_id, thread_id)}", "", 0))
+                self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed stacks format, for flamegraph.pl or speedscope."""
+        lines = [
+            ";".join(f"{name} ({os.path.basename(file)}:{line})" if file else name for name, file, line in stack)
+            + f" {count}"
+            for stack, count in self.samples.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> dict:
+        """A sampled profile in the speedscope file format (https://www.speedscope.app)."""
+        frames: List[Frame] = []
+        frame_index: Dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append(frame)
+                indices.append(frame_index[frame])
+            samples.append(indices)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "plan42",
+            "shared": {"frames": [{"name": n, "file": f, "line": l} for n, f, l in frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+class ProfileInfo(BaseModel):
+    request_id: str
+    method: str
+    path: str
+    duration_ms: float
+    samples: int
+    interval_ms: float
+
+
+class ProfileStore:
+    """The last `max_profiles` profiles, keyed by request id, optionally also written to `directory`."""
+    def __init__(self, max_profiles: int = 50, directory: Optional[str] = None):
+        self.max_profiles = max_profiles
+        self.directory = directory
+        self._profiles: "OrderedDict[str, Tuple[ProfileInfo, SamplingProfiler]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, info: ProfileInfo, profiler: SamplingProfiler):
+        with self._lock:
+            self._profiles[info.request_id] = (info, profiler)
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            filename = os.path.join(self.directory, f"{info.request_id}.speedscope.json")
+            with open(filename, "w", encoding="utf-8") as f:
+                json.dump(profiler.speedscope(f"{info.method} {info.path}"), f)
+
+    def list(self) -> List[ProfileInfo]:
+        with self._lock:
+            return [info for info, _ in reversed(self._profiles.values())]
+
+    def get(self, request_id: str) -> Optional[Tuple[ProfileInfo, SamplingProfiler]]:
+        with self._lock:
+            return self._profiles.get(request_id)
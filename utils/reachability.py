@@ -0,0 +1,88 @@
+from typing import List, Optional
+import numpy as np
+from utils.location import LocationDistanceMatrix
+from utils.charging_station import ChargingStationIndex
+from utils.geo import estimated_road_distance_m
+
+# Chargers processed per block in the two-hop pass, bounds the temporary matrix size
+CHARGER_BLOCK_SIZE = 2048
+
+
+def _feature(lon: float, lat: float, properties: dict) -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [lon, lat]},
+        "properties": properties
+    }
+
+
+def compute_reachability(
+        origin_id: int,
+        max_mileage: float,
+        distance_matrix: LocationDistanceMatrix,
+        chargers: Optional[ChargingStationIndex] = None,
+        full_range: Optional[float] = None) -> dict:
+    """
+    Everything reachable from `origin_id` with `max_mileage` metres of range left, as a GeoJSON FeatureCollection:
+        - attractions within range (hops=1), using the distance matrix
+        - chargers within range, using estimated road distances
+        - with `full_range` (the range after charging), the attractions only reachable
+          by charging once at one of those chargers (hops=2, via the charger minimizing the total distance)
+    Every pass is vectorized over all the locations / chargers.
+    """
+    locations = distance_matrix.locations
+    origin = locations[distance_matrix.get_idx(origin_id)]
+    lats, lons = distance_matrix.lats, distance_matrix.lons
+
+    distances = distance_matrix.get_distances_from(origin_id)
+    is_origin = np.arange(len(locations)) == distance_matrix.get_idx(origin_id)
+    direct = (distances <= max_mileage) & ~is_origin
+
+    features: List[dict] = [_feature(origin.lon, origin.lat, {
+        "kind": "origin", "id": origin.id, "name": origin.name, "max_mileage": max_mileage
+    })]
+    for i in np.flatnonzero(direct):
+        features.append(_feature(lons[i], lats[i], {
+            "kind": "attraction", "id": locations[i].id, "name": locations[i].name,
+            "distance": float(distances[i]), "hops": 1
+        }))
+
+    if chargers is None or len(chargers) == 0:
+        return {"type": "FeatureCollection", "features": features}
+
+    charger_distances = chargers.distances_from(origin.lat, origin.lon)
+    reachable = np.flatnonzero(charger_distances <= max_mileage)
+    for c in reachable:
+        features.append(_feature(chargers.lons[c], chargers.lats[c], {
+            "kind": "charger", "id": int(chargers.ids[c]), "operator_name": chargers.stations[c].operator_name,
+            "distance": float(charger_distances[c]), "estimated": True, "hops": 1
+        }))
+
+    if full_range is None or len(reachable) == 0:
+        return {"type": "FeatureCollection", "features": features}
+
+    # Two hops: origin -> charger (within max_mileage) -> attraction (within full_range)
+    targets = np.flatnonzero(~direct & ~is_origin)
+    best_total = np.full(len(targets), np.inf)
+    best_charger = np.full(len(targets), -1, dtype=np.int64)
+    for start in range(0, len(reachable), CHARGER_BLOCK_SIZE):
+        block = reachable[start:start + CHARGER_BLOCK_SIZE]
+        second_hop = estimated_road_distance_m(
+            chargers.lats[block][:, None], chargers.lons[block][:, None],
+            lats[targets][None, :], lons[targets][None, :]
+        )
+        total = np.where(second_hop <= full_range, charger_distances[block][:, None] + second_hop, np.inf)
+        block_best = total.argmin(axis=0)
+        block_total = total[block_best, np.arange(len(targets))]
+        improved = block_total < best_total
+        best_total[improved] = block_total[improved]
+        best_charger[improved] = block[block_best[improved]]
+
+    for k in np.flatnonzero(np.isfinite(best_total)):
+        i, c = targets[k], best_charger[k]
+        features.append(_feature(lons[i], lats[i], {
+            "kind": "attraction", "id": locations[i].id, "name": locations[i].name,
+            "distance": float(best_total[k]), "estimated": True, "hops": 2,
+            "via_charger_id": int(chargers.ids[c])
+        }))
+    return {"type": "FeatureCollection", "features": features}
@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from pydantic import BaseModel
+
+# How a response was obtained, returned in the X-Cache header
+HIT, COALESCED, MISS = "HIT", "COALESCED", "MISS"
+
+
+def request_key(request: BaseModel) -> str:
+    """Canonical hash of a request: the same fields give the same key, whatever their order or formatting."""
+    payload = json.dumps(request.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlightCache:
+    """
+    Results of identical requests:
+        - concurrent identical requests share one computation (single flight)
+        - completed results are kept for `ttl` seconds, at most `max_entries` of them (LRU)
+    Every result is tagged with the version of the data it was computed from:
+    when the version changes, the cached results are stale and recomputed.
+    Failures are shared by the requests waiting for them, but not cached.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        # key -> (expiry, version, result)
+        self._entries: "OrderedDict[str, Tuple[float, Hashable, Any]]" = OrderedDict()
+        # key -> (version, running computation)
+        self._in_flight: Dict[str, Tuple[Hashable, asyncio.Future]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _lookup(self, key: str, version: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expiry, entry_version, result = entry
+        if entry_version != version or expiry <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _store(self, key: str, version: Hashable, result: Any):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = (self.clock() + self.ttl, version, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(
+            self,
+            key: str,
+            version: Hashable,
+            compute: Callable[[], Awaitable[Any]],
+            version_after: Optional[Callable[[], Hashable]] = None) -> Tuple[Any, str]:
+        """
+        The result for `key`, and how it was obtained (HIT, COALESCED or MISS).
+        The computation runs in its own task: a waiting request that is cancelled
+        does not cancel it for the others.
+        A computation that changes the data it reads (e.g. downloads the legs it needs) gives
+        `version_after`: the result is stored under the version read once it is done.
+        """
+        result = self._lookup(key, version)
+        if result is not None:
+            return result, HIT
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None and in_flight[0] == version:
+            return await asyncio.shield(in_flight[1]), COALESCED
+
+        future = asyncio.ensure_future(compute())
+        self._in_flight[key] = (version, future)
+
+        def done(f: asyncio.Future):
+            if self._in_flight.get(key, (None, None))[1] is f:
+                del self._in_flight[key]
+            if not f.cancelled() and f.exception() is None:
+                self._store(key, version if version_after is None else version_after(), f.result())
+        future.add_done_callback(done)
+        return await asyncio.shield(future), MISS
@@ -0,0 +1,67 @@
+import itertools
+import re
+from typing import Any, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+from utils.standins import FaultInjector
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    A deterministic chat model that calls the routing tools like the agent would,
+    from location ids in the last user message:
+    - "solve ..." (or "optimal") calls route_solving_tool
+    - "... 12 before 34 ..." / "12 then 34" become precedences
+    - "start at 12" / "from 12" sets the starting point (else the first id)
+    - a message without ids calls get_available_locations
+    After a tool answers, it replies with the tool output.
+    """
+    latency_ms: Optional[str] = None
+    error_rate: Optional[float] = None
+    _faults: FaultInjector = PrivateAttr()
+    # Tool call ids, unique over the conversation (the LLM may only see part of it)
+    _calls: Iterator[int] = PrivateAttr(default_factory=itertools.count)
+
+    def model_post_init(self, context: Any):
+        self._faults = FaultInjector(self.latency_ms, self.error_rate)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-stand-in"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self._faults("llm")
+        return ChatResult(generations=[ChatGeneration(message=self.next_message(messages, next(self._calls)))])
+
+    @staticmethod
+    def next_message(messages: List[BaseMessage], call: int = 0) -> AIMessage:
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=f"{last.name}: {last.content}")
+        text = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        text = text if isinstance(text, str) else str(text)
+        ids = [int(k) for k in re.findall(r"\d+", text)]
+        call_id = f"call_{call}"
+        if not ids:
+            return AIMessage(content="", tool_calls=[{"name": "get_available_locations", "args": {}, "id": call_id}])
+
+        pairs = re.findall(r"(\d+)\s+before\s+(\d+)", text)
+        for chain in re.findall(r"\d+(?:\s+then\s+\d+)+", text):
+            steps = re.findall(r"\d+", chain)
+            pairs.extend(zip(steps, steps[1:]))
+        precedences = [{"visit_location_before": int(a), "visit_location_after": int(b)} for a, b in pairs]
+        start = re.search(r"(?:start(?:ing)?(?: point)?(?: at| from)?|from)\s+(\d+)", text, re.IGNORECASE)
+        starting_point = int(start.group(1)) if start else ids[0]
+        locations = list(dict.fromkeys([starting_point] + ids))
+
+        if re.search(r"\b(solve|optimal)\b", text, re.IGNORECASE):
+            name, args = "route_solving_tool", {"route_locations": locations}
+        else:
+            name, args = "route_validation_tool", {"locations": locations}
+        args.update(starting_point=starting_point, precedences=precedences)
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id}])
@@ -0,0 +1,215 @@
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import numpy as np
+from utils.location import ESTIMATED_SPEED_MPS
+
+# Record layout of the shared directions store:
+# | id_a: int64 | id_b: int64 | length: uint32 | `length` bytes of JSON |
+MAGIC = b"P42DIR01"
+RECORD_HEADER = struct.Struct("<qqI")
+
+
+class SharedDirectionsCache:
+    """
+    Directions cache shared by all the workers of a `fastapi run --workers N` process.
+    The legs are appended to a single packed file that every worker memory-maps:
+    the pages live once in the OS page cache, and each worker only keeps an index
+    (key -> offset) plus a handful of decoded legs.
+    A leg fetched by one worker is visible to the others at their next lookup.
+    Same interface as LocalDirectionsCache.
+    """
+    def __init__(
+            self,
+            filename: str = "cached_directions.bin",
+            import_from: Optional[str] = "cached_directions.json",
+            decoded_cache_size: int = 64):
+        self.filename = filename
+        self._index: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        self._scanned_until = len(MAGIC)
+        self._mmap: Optional[mmap.mmap] = None
+        self._decoded: OrderedDict = OrderedDict()
+        self._decoded_cache_size = decoded_cache_size
+        self._lock = threading.Lock()
+        # task -> lock file held while this worker leads the task
+        self._leader_locks: Dict[str, object] = {}
+        self._init_file(import_from)
+        self._fd = os.open(self.filename, os.O_RDWR)
+        if os.pread(self._fd, len(MAGIC), 0) != MAGIC:
+            raise ValueError(f"{self.filename} is not a directions store")
+        self.refresh()
+
+    def _init_file(self, import_from: Optional[str]):
+        """Creates the store (importing the JSON cache) unless another worker already did."""
+        with open(f"{self.filename}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if Path(self.filename).exists():
+                return
+            directions = {}
+            if import_from is not None and Path(import_from).exists():
+                with open(import_from, "r", encoding="utf-8") as f:
+                    directions = json.load(f)
+            directory = os.path.dirname(os.path.abspath(self.filename))
+            fd, tmp_filename = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC)
+                for k, v in directions.items():
+                    a, b = k.split('-')
+                    f.write(self._pack(int(a), int(b), v))
+            os.chmod(tmp_filename, 0o644)
+            os.replace(tmp_filename, self.filename)
+            print(f"Imported {len(directions)} directions into {self.filename}")
+
+    @staticmethod
+    def _pack(id_a: int, id_b: int, data) -> bytes:
+        payload = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        return RECORD_HEADER.pack(id_a, id_b, len(payload)) + payload
+
+    def refresh(self):
+        """Maps the records appended (by any worker) since the last refresh."""
+        with self._lock:
+            size = os.fstat(self._fd).st_size
+            if size <= self._scanned_until:
+                return
+            # The previous map is not closed: readers may still hold it, it goes away with them
+            mapped = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+            offset = self._scanned_until
+            while offset + RECORD_HEADER.size <= size:
+                id_a, id_b, length = RECORD_HEADER.unpack_from(mapped, offset)
+                start = offset + RECORD_HEADER.size
+                if start + length > size:
+                    break  # a record still being written, picked up next time
+                self._index[(id_a, id_b)] = (start, length)
+                offset = start + length
+            self._mmap = mapped
+            self._scanned_until = offset
+
+    @property
+    def version(self) -> int:
+        """Grows with every leg appended (by this worker, or by another one once refreshed)."""
+        return self._scanned_until
+
+    @property
+    def directions(self) -> Dict[Tuple[int, int], Tuple[int, int]]:
+        """The index of the cached legs, for membership tests and counts."""
+        return self._index
+
+    def get(self, id_a: int, id_b: int):
+        key = (id_a, id_b)
+        with self._lock:
+            if key in self._decoded:
+                self._decoded.move_to_end(key)
+                return self._decoded[key]
+        if key not in self._index:
+            # another worker may have fetched it in the meantime
+            self.refresh()
+            if key not in self._index:
+                return None
+        start, length = self._index[key]
+        data = json.loads(self._mmap[start:start + length])
+        with self._lock:
+            self._decoded[key] = data
+            if len(self._decoded) > self._decoded_cache_size:
+                self._decoded.popitem(last=False)
+        return data
+
+    def leg_version(self, id_a: int, id_b: int) -> int:
+        """The offset of the leg in the shared file: the same in every worker, changes if the leg is appended again."""
+        return self._index.get((id_a, id_b), (0, 0))[0]
+
+    def add(self, id_a: int, id_b: int, data):
+        """Appends the leg to the shared file, it is durable as soon as the OS writes it back."""
+        record = self._pack(id_a, id_b, data)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            os.lseek(self._fd, 0, os.SEEK_END)
+            os.write(self._fd, record)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self.refresh()
+
+    def try_lead(self, task: str) -> bool:
+        """
+        True for a single worker at a time: used to run background jobs (e.g. the warm-up) once.
+        The lock is held until `release_lead`, or until the process exits (a crashed leader
+        releases it too, and another worker can take over). False once the task is finished.
+        """
+        if self.lead_finished(task):
+            return False
+        lock = open(f"{self.filename}.{task}.lock", "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return False
+        # the previous leader may have finished between the check and the lock
+        if self.lead_finished(task):
+            lock.close()
+            return False
+        self._leader_locks[task] = lock
+        return True
+
+    def release_lead(self, task: str, finished: bool):
+        """Lets another worker lead `task`; with `finished`, none will for this server run."""
+        if finished:
+            Path(f"{self.filename}.{task}.done").write_text(str(os.getppid()))
+        lock = self._leader_locks.pop(task, None)
+        if lock is not None:
+            lock.close()
+
+    def lead_finished(self, task: str) -> bool:
+        """Whether a worker of this server run (same parent process) finished `task`."""
+        try:
+            return Path(f"{self.filename}.{task}.done").read_text() == str(os.getppid())
+        except FileNotFoundError:
+            return False
+
+    # Every add is already written to the shared file: persistence hooks are no-ops
+    def flush(self) -> int:
+        return 0
+
+    def save_cache(self):
+        pass
+
+    async def run_write_behind(self, interval: float = 5.0):
+        return None
+
+
+def get_shared_matrix_file(json_filename: str, npy_filename: Optional[str] = None) -> str:
+    """
+    Converts a cached Mapbox matrix (JSON) into a .npy file, which the workers
+    load with `np.load(mmap_mode="r")` to share the same pages.
+    The file holds both layers as one (2, N, N) array, durations missing
+    from the JSON are estimated (see LocationDistanceMatrix) so that the
+    workers can still map it instead of computing them in a private copy.
+    The conversion runs once, unless the JSON file is newer than the .npy.
+    """
+    if npy_filename is None:
+        npy_filename = str(Path(json_filename).with_suffix(".npy"))
+    with open(f"{npy_filename}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        npy = Path(npy_filename)
+        if npy.exists() and npy.stat().st_mtime >= Path(json_filename).stat().st_mtime:
+            return npy_filename
+        with open(json_filename, "r", encoding="utf-8") as f:
+            raw_data = json.load(f)
+        distances = np.asarray(raw_data["distances"], dtype=np.float64)
+        if "durations" in raw_data:
+            durations = np.asarray(raw_data["durations"], dtype=np.float64)
+        else:
+            durations = distances / ESTIMATED_SPEED_MPS
+        matrix = np.stack([distances, durations])
+        directory = os.path.dirname(os.path.abspath(npy_filename))
+        fd, tmp_filename = tempfile.mkstemp(dir=directory, suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, matrix)
+        os.chmod(tmp_filename, 0o644)
+        os.replace(tmp_filename, npy_filename)
+    return npy_filename
@@ -0,0 +1,395 @@
+"""
+Local stand-ins for the external services, selected with MAPBOX_BACKEND=STANDIN,
+SUPABASE_BACKEND=STANDIN (see utils.backends, and utils.scripted_llm for LLM_BACKEND=FAKE).
+They answer from the cached JSON fixtures (or synthesize an answer of the same shape),
+after STANDIN_LATENCY_MS, and fail a STANDIN_ERROR_RATE fraction of the calls:
+enough to run the API, the benchmarks and the load test without any network.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+import numpy as np
+import requests
+from shapely import wkb
+from shapely.geometry import Point
+from utils.geo import DETOUR_FACTOR, estimated_road_distance_m, haversine_m
+from utils.location import ESTIMATED_SPEED_MPS
+
+# Stand-in chargers: half of them along the cached directions, the others anywhere in Switzerland
+STANDIN_CHARGERS = int(os.environ.get("STANDIN_CHARGERS", "2000"))
+SWISS_BBOX = (45.817, 5.955, 47.808, 10.492)  # min lat, min lon, max lat, max lon
+# Points of a synthesized directions geometry
+SYNTHETIC_GEOMETRY_POINTS = 50
+
+
+class StandInError(Exception):
+    """An injected failure."""
+
+
+class FaultInjector:
+    """
+    Sleeps `latency_ms` (a number, or a "min-max" range drawn uniformly) and raises
+    StandInError for an `error_rate` fraction of the calls. Seeded, so runs repeat.
+    """
+    def __init__(self, latency_ms: Optional[str] = None, error_rate: Optional[float] = None, seed: int = 42):
+        latency = str(latency_ms if latency_ms is not None else os.environ.get("STANDIN_LATENCY_MS", "0"))
+        low, _, high = latency.partition("-")
+        self.latency = (float(low) / 1000, float(high or low) / 1000)
+        self.error_rate = float(error_rate if error_rate is not None else os.environ.get("STANDIN_ERROR_RATE", "0"))
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self) -> Tuple[float, bool]:
+        with self._lock:
+            return self._rng.uniform(*self.latency), self._rng.random() < self.error_rate
+
+    def __call__(self, what: str):
+        delay, failed = self._draw()
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise StandInError(f"Injected {what} failure")
+
+    async def wait(self, what: str):
+        """Same as calling it, without blocking the event loop."""
+        delay, failed = self._draw()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if failed:
+            raise StandInError(f"Injected {what} failure")
+
+
+class Fixtures:
+    """The cached attractions, distances and directions the stand-ins answer from."""
+    def __init__(self, directory: Optional[str] = None):
+        directory = Path(directory or os.environ.get("STANDIN_FIXTURES_DIR", "."))
+        with open(directory / "cached_attractions.json", "r", encoding="utf-8") as f:
+            self.attractions: List[dict] = json.load(f)
+        with open(directory / "cached_distances.json", "r", encoding="utf-8") as f:
+            matrix = json.load(f)
+        self.distances = np.asarray(matrix["distances"], dtype=np.float64)
+        self.durations = np.asarray(matrix["durations"], dtype=np.float64) if "durations" in matrix else None
+        with open(directory / "cached_directions.json", "r", encoding="utf-8") as f:
+            self.directions: Dict[str, dict] = json.load(f)
+        self.by_id = {a["id"]: k for k, a in enumerate(self.attractions)}
+        self.by_coords = {_coords_key(a["lon"], a["lat"]): a["id"] for a in self.attractions}
+
+    def attraction_at(self, lon: float, lat: float) -> Optional[int]:
+        return self.by_coords.get(_coords_key(lon, lat))
+
+    def distance_and_duration(self, a: Tuple[float, float], b: Tuple[float, float]) -> Tuple[float, float]:
+        """Between two (lon, lat): from the cached matrix for two attractions, estimated otherwise."""
+        id_a, id_b = self.attraction_at(*a), self.attraction_at(*b)
+        if id_a is not None and id_b is not None:
+            i, j = self.by_id[id_a], self.by_id[id_b]
+            distance = float(self.distances[i, j])
+            if self.durations is not None:
+                return distance, float(self.durations[i, j])
+        else:
+            distance = float(estimated_road_distance_m(a[1], a[0], b[1], b[0]))
+        return distance, distance / ESTIMATED_SPEED_MPS
+
+
+def _coords_key(lon: float, lat: float) -> Tuple[float, float]:
+    return round(float(lon), 6), round(float(lat), 6)
+
+
+def parse_coordinates(text: str) -> List[Tuple[float, float]]:
+    """Mapbox "lon,lat;lon,lat" (with or without spaces) as (lon, lat) tuples."""
+    coordinates = []
+    for pair in unquote(text).split(";"):
+        lon, lat = pair.split(",")
+        coordinates.append((float(lon), float(lat)))
+    return coordinates
+
+
+class StandInResponse:
+    """The part of requests.Response the callers use."""
+    def __init__(self, data: Any, status_code: int = 200):
+        self._data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}: {self._data.get('message')}", response=self)
+
+
+class MapboxStandIn:
+    """
+    Answers the Directions, Matrix and Isochrone APIs like `requests.get` would.
+    A cached leg comes back as cached; any other leg gets a straight line, the estimated
+    road distance (utils.geo) and a duration at ESTIMATED_SPEED_MPS.
+    An injected failure is a ConnectionError, like an unreachable Mapbox.
+    """
+    def __init__(self, fixtures: Optional[Fixtures] = None, faults: Optional[FaultInjector] = None):
+        self.fixtures = fixtures or Fixtures()
+        self.faults = faults or FaultInjector()
+
+    def get(self, url: str, params: Optional[dict] = None, timeout: Optional[float] = None) -> StandInResponse:
+        try:
+            self.faults("mapbox")
+        except StandInError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        params = params or {}
+        path = url.split("api.mapbox.com", 1)[-1]
+        service, _, rest = path.strip("/").partition("/")
+        coordinates = parse_coordinates(rest.rsplit("/", 1)[-1])
+        if service == "directions":
+            return self.directions(coordinates)
+        if service == "directions-matrix":
+            return self.matrix(coordinates, params)
+        if service == "isochrone":
+            return self.isochrone(coordinates[0], params)
+        return StandInResponse({"message": f"Not Found: {service}"}, status_code=404)
+
+    def directions(self, coordinates: List[Tuple[float, float]]) -> StandInResponse:
+        if len(coordinates) != 2:
+            return StandInResponse({"message": "Stand-in directions take two coordinates"}, status_code=422)
+        start, end = coordinates
+        id_a, id_b = self.fixtures.attraction_at(*start), self.fixtures.attraction_at(*end)
+        cached = self.fixtures.directions.get(f"{id_a}-{id_b}")
+        if cached is not None:
+            return StandInResponse(cached)
+        distance, duration = self.fixtures.distance_and_duration(start, end)
+        t = np.linspace(0, 1, SYNTHETIC_GEOMETRY_POINTS)
+        line = np.column_stack([start[0] + t * (end[0] - start[0]), start[1] + t * (end[1] - start[1])])
+        return StandInResponse({
+            "routes": [{
+                "weight_name": "auto",
+                "weight": duration,
+                "duration": duration,
+                "distance": distance,
+                "legs": [{"summary": "stand-in", "steps": [], "distance": distance, "duration": duration}],
+                "geometry": {"type": "LineString", "coordinates": line.tolist()}
+            }],
+            "waypoints": [{"name": "", "location": list(c)} for c in coordinates],
+            "code": "Ok",
+            "uuid": "stand-in"
+        })
+
+    def matrix(self, coordinates: List[Tuple[float, float]], params: dict) -> StandInResponse:
+        def indices(key):
+            value = params.get(key, "all")
+            return list(range(len(coordinates))) if value == "all" else [int(k) for k in value.split(";")]
+        sources, destinations = indices("sources"), indices("destinations")
+        distances = [[0.0] * len(destinations) for _ in sources]
+        durations = [[0.0] * len(destinations) for _ in sources]
+        for r, i in enumerate(sources):
+            for c, j in enumerate(destinations):
+                if i != j:
+                    distances[r][c], durations[r][c] = self.fixtures.distance_and_duration(coordinates[i], coordinates[j])
+        return StandInResponse({"code": "Ok", "distances": distances, "durations": durations})
+
+    def isochrone(self, center: Tuple[float, float], params: dict) -> StandInResponse:
+        # A circle of the straight-line distance driven in contours_minutes
+        radius_m = float(params.get("contours_minutes", 5)) * 60 * ESTIMATED_SPEED_MPS / DETOUR_FACTOR
+        polygon = Point(center).buffer(1, quad_segs=8)
+        lon_scale = radius_m / (111_320 * math.cos(math.radians(center[1])))
+        lat_scale = radius_m / 110_574
+        ring = [
+            [center[0] + (x - center[0]) * lon_scale, center[1] + (y - center[1]) * lat_scale]
+            for x, y in polygon.exterior.coords
+        ]
+        return StandInResponse({
+            "type": "FeatureCollection",
+            "features": [{"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}}]
+        })
+
+
+class _StandInResult:
+    def __init__(self, data: List[dict]):
+        self.data = data
+
+
+class _StandInQuery:
+    """The PostgREST builder calls used on the tables: select, order, range, eq, update, insert."""
+    def __init__(self, client: "SupabaseStandIn", table: str):
+        self.client = client
+        self.rows = client.tables.setdefault(table, [])
+        self.columns: Optional[List[str]] = None
+        self.filters: List[Tuple[str, Any]] = []
+        self.order_by: Optional[Tuple[str, bool]] = None
+        self.bounds: Optional[Tuple[int, int]] = None
+        self.values: Optional[dict] = None
+        self.inserted: Optional[List[dict]] = None
+
+    def select(self, columns: str = "*"):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column: str, value: Any):
+        self.filters.append((column, value))
+        return self
+
+    def order(self, column: str, desc: bool = False):
+        self.order_by = (column, desc)
+        return self
+
+    def range(self, start: int, end: int):
+        self.bounds = (start, end)
+        return self
+
+    def update(self, values: dict):
+        self.values = values
+        return self
+
+    def insert(self, rows):
+        self.inserted = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def execute(self) -> _StandInResult:
+        self.client.faults("supabase")
+        return self.run()
+
+    def run(self) -> _StandInResult:
+        with self.client.lock:
+            if self.inserted is not None:
+                self.rows.extend(dict(row) for row in self.inserted)
+                return _StandInResult(self.inserted)
+            rows = [row for row in self.rows if all(row.get(c) == v for c, v in self.filters)]
+            if self.values is not None:
+                for row in rows:
+                    row.update(self.values)
+                return _StandInResult(rows)
+        if self.order_by is not None:
+            column, desc = self.order_by
+            rows = sorted(rows, key=lambda row: row[column], reverse=desc)
+        if self.bounds is not None:
+            rows = rows[self.bounds[0]:self.bounds[1] + 1]
+        if self.columns is not None:
+            rows = [{c: row.get(c) for c in self.columns} for row in rows]
+        return _StandInResult(rows)
+
+
+class _StandInRpc:
+    def __init__(self, client: "SupabaseStandIn", name: str, params: dict):
+        self.client, self.name, self.params = client, name, params
+
+    def execute(self) -> _StandInResult:
+        self.client.faults("supabase")
+        return self.run()
+
+    def run(self) -> _StandInResult:
+        handler = getattr(self.client, f"rpc_{self.name}", None)
+        if handler is None:
+            raise StandInError(f"Unknown stand-in RPC {self.name}")
+        return _StandInResult(handler(**self.params))
+
+
+class SupabaseStandIn:
+    """
+    The Supabase client calls of the app, in memory: the fixture attractions, and
+    STANDIN_CHARGERS seeded chargers (with a hex EWKB `location`, like the database).
+    """
+    CHARGER_COLUMNS = ("id", "operator_id", "operator_name", "lat", "lon", "location")
+
+    def __init__(
+            self,
+            fixtures: Optional[Fixtures] = None,
+            faults: Optional[FaultInjector] = None,
+            chargers: int = STANDIN_CHARGERS,
+            seed: int = 42):
+        self.fixtures = fixtures or Fixtures()
+        self.faults = faults or FaultInjector()
+        self.lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.tables: Dict[str, List[dict]] = {
+            "attractions": [dict(a) for a in self.fixtures.attractions],
+            "charging_stations": self._make_chargers(chargers, seed),
+        }
+        stations = self.tables["charging_stations"]
+        self._lats = np.array([s["lat"] for s in stations], dtype=np.float64)
+        self._lons = np.array([s["lon"] for s in stations], dtype=np.float64)
+
+    def _make_chargers(self, count: int, seed: int) -> List[dict]:
+        rng = np.random.default_rng(seed)
+        lines = [np.asarray(d["routes"][0]["geometry"]["coordinates"]) for d in self.fixtures.directions.values()]
+        along = count // 2 if lines else 0
+        points = []
+        if along:
+            route = np.concatenate(lines)
+            picked = route[rng.integers(0, len(route), along)]
+            # within ~1 km of the road
+            points.append(picked + rng.normal(0, 0.005, picked.shape))
+        min_lat, min_lon, max_lat, max_lon = SWISS_BBOX
+        points.append(np.column_stack([
+            rng.uniform(min_lon, max_lon, count - along), rng.uniform(min_lat, max_lat, count - along)
+        ]))
+        stations = []
+        for k, (lon, lat) in enumerate(np.concatenate(points), start=1):
+            lon, lat = float(lon), float(lat)
+            stations.append({
+                "id": k,
+                "operator_id": f"standin-{k % 7}",
+                "operator_name": f"Stand-in operator {k % 7}",
+                "lat": lat,
+                "lon": lon,
+                "location": wkb.dumps(Point(lon, lat), hex=True, srid=4326),
+            })
+        return stations
+
+    def table(self, name: str) -> _StandInQuery:
+        return _StandInQuery(self, name)
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _StandInRpc:
+        return _StandInRpc(self, name, params or {})
+
+    def _chargers(self, indices) -> List[dict]:
+        stations = self.tables["charging_stations"]
+        return [{c: stations[k][c] for c in self.CHARGER_COLUMNS} for k in indices]
+
+    def rpc_get_random_attractions(self, limit_count: int = 10) -> List[dict]:
+        attractions = self.tables["attractions"]
+        with self.lock:
+            return [dict(a) for a in self._rng.sample(attractions, min(limit_count, len(attractions)))]
+
+    def rpc_get_nearest_chargers(self, target_lat: float, target_lon: float, n_count: int = 5) -> List[dict]:
+        distances = haversine_m(target_lat, target_lon, self._lats, self._lons)
+        return self._chargers(np.argsort(distances, kind="stable")[:n_count])
+
+    def rpc_get_chargers_covering_point(self, target_lat: float, target_lon: float) -> List[dict]:
+        # The 5 minutes catchment areas, as circles (see MapboxStandIn.isochrone)
+        radius_m = 5 * 60 * ESTIMATED_SPEED_MPS / DETOUR_FACTOR
+        distances = haversine_m(target_lat, target_lon, self._lats, self._lons)
+        inside = np.flatnonzero(distances <= radius_m)
+        return self._chargers(inside[np.argsort(distances[inside], kind="stable")])
+
+
+class _AsyncStandInBuilder:
+    """Forwards the builder calls of a stand-in query or RPC, `execute` is awaitable."""
+    def __init__(self, builder):
+        self._builder = builder
+
+    def __getattr__(self, name: str):
+        method = getattr(self._builder, name)
+
+        def call(*args, **kwargs):
+            method(*args, **kwargs)
+            return self
+        return call
+
+    async def execute(self) -> _StandInResult:
+        await self._builder.client.faults.wait("supabase")
+        return self._builder.run()
+
+
+class AsyncSupabaseStandIn:
+    """The async client calls (`await ....execute()`) over the tables of a SupabaseStandIn."""
+    def __init__(self, standin: SupabaseStandIn):
+        self.standin = standin
+
+    def table(self, name: str) -> _AsyncStandInBuilder:
+        return _AsyncStandInBuilder(self.standin.table(name))
+
+    def rpc(self, name: str, params: Optional[dict] = None) -> _AsyncStandInBuilder:
+        return _AsyncStandInBuilder(self.standin.rpc(name, params))
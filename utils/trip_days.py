@@ -0,0 +1,117 @@
+import math
+from itertools import accumulate
+from typing import List, Tuple
+from pydantic import BaseModel, Field
+from utils.charge_planner import ChargePlanner, CoordsMaxMileageReach
+from utils.location import LocationDistanceMatrix
+from utils.local_directions_cache import LocalDirectionsCache
+from utils.metrics import timed
+
+
+class TripDaysRequest(BaseModel):
+    ordered_route: List[int] = Field(..., min_length=2, json_schema_extra={"example": [578, 497, 881]})
+    max_mileage: float = Field(..., gt=0, description="Range with a full battery, in metres")
+    max_daily_hours: float = Field(default=6, gt=0, description="Daily budget: driving plus charging")
+    charge_minutes: float = Field(default=30, ge=0, description="Time spent at each charging stop")
+
+
+class TripDay(BaseModel):
+    day: int
+    ordered_route: List[int]
+    distance: float = Field(..., description="Metres")
+    driving_seconds: float
+    charging_seconds: float
+    charging_stops: List[CoordsMaxMileageReach]
+
+
+class TripDayPlanner:
+    """
+    Splits an ordered route into days: every night is spent at a location of the route,
+    where the battery is charged full. During a day, the car charges (for `charge_seconds`)
+    every time the range runs out, and driving plus charging must fit in the daily budget.
+    Distances come from the matrix (like ChargePlanner), durations from the cached directions.
+    """
+    def __init__(
+            self,
+            ordered_route: List[int],
+            max_mileage: float,
+            distances: LocationDistanceMatrix,
+            directions_cache: LocalDirectionsCache):
+        if len(ordered_route) < 2:
+            raise ValueError("TripDayPlanner requires at least two locations (incl start point)")
+        self.ordered_route = ordered_route
+        self.max_mileage = max_mileage
+        self.distances = distances
+        self.directions_cache = directions_cache
+        legs = list(zip(ordered_route[:-1], ordered_route[1:]))
+        # Prefix sums: cumulated_*[k] is the distance (duration) from the start point until ordered_route[k]
+        self.cumulated_distances = [0.0] + list(accumulate(distances.get_distance_between_ids(a, b) for a, b in legs))
+        self.cumulated_durations = [0.0] + list(accumulate(self._get_duration(a, b) for a, b in legs))
+
+    def _get_duration(self, start: int, end: int) -> float:
+        d = self.directions_cache.get(start, end)
+        if d is None:
+            raise ValueError(f"{start},{end} not in cache")
+        return d["routes"][0]["duration"]
+
+    def charging_stops_between(self, i: int, j: int) -> int:
+        """Charging stops needed from ordered_route[i] to ordered_route[j], leaving with a full battery."""
+        distance = self.cumulated_distances[j] - self.cumulated_distances[i]
+        return max(0, math.ceil(distance / self.max_mileage) - 1)
+
+    def day_seconds(self, i: int, j: int, charge_seconds: float) -> float:
+        """Driving plus charging time of a day from ordered_route[i] to ordered_route[j]."""
+        driving = self.cumulated_durations[j] - self.cumulated_durations[i]
+        return driving + self.charging_stops_between(i, j) * charge_seconds
+
+    @timed("trip_days_split")
+    def split(self, max_day_seconds: float, charge_seconds: float = 1800) -> List[Tuple[int, int]]:
+        """
+        Optimal split, as (first, last) indices in ordered_route per day: the fewest days,
+        then the shortest longest day. DP over the prefix sums, O(n * days that fit in the budget).
+        Raises ValueError if a single leg does not fit in a day.
+        """
+        n = len(self.ordered_route)
+        # best[j] = (days, longest day) to reach ordered_route[j]; previous[j] = where its last day starts
+        best: List[Tuple[float, float]] = [(0, 0.0)] + [(math.inf, math.inf)] * (n - 1)
+        previous = [-1] * n
+        for j in range(1, n):
+            for i in range(j - 1, -1, -1):
+                seconds = self.day_seconds(i, j, charge_seconds)
+                if seconds > max_day_seconds:
+                    break  # starting the day earlier only makes it longer
+                candidate = (best[i][0] + 1, max(best[i][1], seconds))
+                if candidate < best[j]:
+                    best[j] = candidate
+                    previous[j] = i
+            if previous[j] < 0:
+                a, b = self.ordered_route[j - 1], self.ordered_route[j]
+                raise ValueError(f"The leg {a},{b} does not fit in a day of {max_day_seconds / 3600:.1f} hours")
+
+        days = []
+        j = n - 1
+        while j > 0:
+            days.append((previous[j], j))
+            j = previous[j]
+        return days[::-1]
+
+    def plan(self, max_day_seconds: float, charge_seconds: float = 1800) -> List[TripDay]:
+        """The days of the trip, with the points where the battery runs out (the charging stops)."""
+        trip = []
+        for day, (i, j) in enumerate(self.split(max_day_seconds, charge_seconds), start=1):
+            route = self.ordered_route[i:j + 1]
+            stops = self.charging_stops_between(i, j)
+            charging_stops = []
+            if stops:
+                planner = ChargePlanner(route, self.max_mileage, self.distances, self.directions_cache)
+                mileages = [self.max_mileage * (k + 1) for k in range(stops)]
+                charging_stops = planner.find_coords_of_max_mileage_reach_many(mileages)
+            trip.append(TripDay(
+                day=day,
+                ordered_route=route,
+                distance=self.cumulated_distances[j] - self.cumulated_distances[i],
+                driving_seconds=self.cumulated_durations[j] - self.cumulated_durations[i],
+                charging_seconds=stops * charge_seconds,
+                charging_stops=charging_stops
+            ))
+        return trip